@@ -1,22 +1,909 @@
+import argparse
+import base64
+import json
+import os
+import queue
 import sqlite3
-from flask import Flask, jsonify, request
+import threading
+import time
+from flask import (Flask, g, has_request_context, jsonify, request,
+                   send_file, stream_with_context)
 
-conn = sqlite3.connect('states_of_the_world.db', check_same_thread=False)
-cursor = conn.cursor()
+import compression
+import export
+import graph
+import http_cache
+import metrics
+import name_index
+import snapshot
+from create_database import DATABASE, create_database
+from storage import STATS_COLUMNS, STATS_METRICS
+from serialization import (DEFAULT_SERIALIZER, SERIALIZERS, CHUNK_ROWS,
+                           SerializerJSONProvider, json_array_chunks,
+                           ndjson_chunks)
+from utils import name_key, text_terms, timezone_terms
 
 # Setup Flask application for API
 app = Flask(__name__)
+app.config.setdefault('DATABASE', DATABASE)
+# Maximum number of idle read-only connections kept for reuse
+app.config.setdefault('DB_POOL_SIZE', 16)
+# Page cache of each connection in KiB and size of the memory mapped part
+# of the database file in bytes
+app.config.setdefault('DB_CACHE_SIZE_KB', 8192)
+app.config.setdefault('DB_MMAP_SIZE', 64 * 1024 * 1024)
+# Serve the routes from an in-memory snapshot of the countries table
+# instead of querying the database, the snapshot being reloaded when the
+# database changes (checked at most once every SNAPSHOT_CHECK_INTERVAL s)
+app.config.setdefault('SNAPSHOT', False)
+app.config.setdefault('SNAPSHOT_CHECK_INTERVAL', snapshot.CHECK_INTERVAL)
+# Binary snapshot written by prepare_data.py that the snapshot mode maps
+# into memory instead of loading the database, so that the worker
+# processes of a server share a single copy of it through the page cache
+# (for example FLASK_SNAPSHOT=true FLASK_SNAPSHOT_FILE=<path>), None to
+# load the database in each process. The dataset version is then read
+# from the file too, so the cached responses always match the data served.
+app.config.setdefault('SNAPSHOT_FILE', None)
+# How the timezone, language and regime routes search the countries:
+#   terms - indexed lookup in the term tables filled by the scraper: exact
+#           UTC offsets or abbreviations for timezones (so "UTC+1" does not
+#           match "UTC+10") and word prefixes for languages and regimes
+#   fts   - substring search using the trigram full-text index
+#   like  - substring search scanning the whole table
+app.config.setdefault('TEXT_SEARCH', 'terms')
+
+# For each searchable column, the table holding its terms, the function
+# splitting a text into terms and whether the terms are matched as prefixes
+TERM_SEARCH = {
+    'timezone': ('country_timezones', timezone_terms, False),
+    'languages': ('country_languages', text_terms, True),
+    'regime': ('country_regimes', text_terms, True),
+}
+
+# Number of serialized GET responses kept in memory, 0 to keep none, and
+# number of seconds clients may reuse a response before revalidating it
+app.config.setdefault('RESPONSE_CACHE_SIZE', http_cache.CACHE_SIZE)
+app.config.setdefault('CACHE_MAX_AGE', 60)
+# Serializer of the JSON responses, see serialization.SERIALIZERS
+app.json = SerializerJSONProvider(app)
+app.config.setdefault('JSON_SERIALIZER', DEFAULT_SERIALIZER)
+# Stream the JSON arrays of the search routes from the database rows, a
+# chunk of STREAM_CHUNK_ROWS rows at a time, instead of building them
+# whole; NDJSON responses (format=ndjson) are always streamed
+app.config.setdefault('STREAM_RESPONSES', False)
+app.config.setdefault('STREAM_CHUNK_ROWS', CHUNK_ROWS)
+# Compress the responses of at least COMPRESS_MIN_BYTES bytes with brotli
+# or gzip when the client accepts it
+app.config.setdefault('COMPRESSION', True)
+app.config.setdefault('COMPRESS_MIN_BYTES', compression.MIN_BYTES)
+# Largest number of countries returned by one page of a ranking
+app.config.setdefault('RANKING_MAX_LIMIT', 100)
+
+# Metrics the countries can be ranked by, mapped to their column
+RANKING_METRICS = {
+    'populatie': 'population',
+    'densitate': 'density',
+    'suprafata': 'area',
+}
+# Arguments of the ranking route filtering by a text column
+RANKING_FILTERS = {
+    'fus_orar': 'timezone',
+    'limba': 'languages',
+    'sistem_politic': 'regime',
+}
+# Arguments of the grouped statistics route choosing the grouping, mapped
+# to its summary table (see storage.STATS_TABLES)
+STATS_GROUPINGS = {
+    'fus_orar': 'timezone_stats',
+    'limba': 'language_stats',
+    'sistem_politic': 'regime_stats',
+}
+# Aggregates of the grouped statistics route the groups can be ordered
+# by, mapped to their key in its responses
+STATS_AGGREGATES = {
+    'numar': 'count',
+    'suma': 'sum',
+    'medie': 'avg',
+    'minim': 'min',
+    'maxim': 'max',
+}
+
+# Largest number of countries resolved by one batch request
+app.config.setdefault('BATCH_MAX_COUNTRIES', 500)
+# Answer for the closest country (see name_index.closest) when a name
+# matches neither a country nor an alias, as long as only one country is
+# the closest, and largest number of countries the suggestion route returns
+app.config.setdefault('FUZZY_MATCHING', True)
+app.config.setdefault('SUGGESTIONS_MAX_LIMIT', 50)
+# Directory where the exports of the current dataset version are written
+# the first time they are downloaded
+app.config.setdefault('EXPORT_DIRECTORY', export.EXPORT_DIRECTORY)
+
+# Fields the batch route can return, mapped to their column
+BATCH_FIELDS = {
+    'capitala': 'capital',
+    'vecini': 'neighbors',
+    'populatie': 'population',
+    'densitate': 'density',
+    'suprafata': 'area',
+    'limbi': 'languages',
+    'fus_orar': 'timezone',
+    'sistem_politic': 'regime',
+}
+
+# Collect the latency of each route and the time its requests spend in
+# SQLite, exposed by /metrics in the Prometheus text format
+app.config.setdefault('METRICS', False)
+
+# Routes whose responses are never cached, as they do not depend only on
+# the dataset
+UNCACHED_ENDPOINTS = {'response_cache_stats', 'prometheus_metrics'}
+
+metrics.describe('api_request_seconds', 'histogram',
+                 "Seconds from the start of a request to the end of its "
+                 "response body, by route, method and status")
+metrics.describe('api_sqlite_seconds', 'histogram',
+                 "Seconds a request spent running and fetching SQLite "
+                 "queries, by route")
+metrics.describe('api_sqlite_queries_total', 'counter',
+                 "SQLite queries run by the requests, by route")
+
+# Any config key can also be set from the environment with the FLASK_
+# prefix (for example FLASK_SNAPSHOT=true), which is how the servers
+# importing the application (gunicorn, uvicorn with asgi.py) configure it
+app.config.from_prefixed_env()
+if app.config['METRICS']:
+    metrics.enable()
+
+# Idle connections, each one used by a single request at a time
+_pool = queue.LifoQueue()
+
+
+def open_connection():
+    """
+    Open a read-only connection to the database tuned for the API queries
+    :return: The new connection
+    """
+
+    connection = sqlite3.connect(
+        f"file:{app.config['DATABASE']}?mode=ro", uri=True,
+        check_same_thread=False)
+    connection.execute(
+        f"PRAGMA cache_size = -{int(app.config['DB_CACHE_SIZE_KB'])}")
+    connection.execute(
+        f"PRAGMA mmap_size = {int(app.config['DB_MMAP_SIZE'])}").fetchall()
+    return connection
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor adding the time spent in SQLite, running a query or fetching
+    its rows, to the timings of the current request. Only used when the
+    metrics are enabled.
+    """
+
+    timing = None
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            self.timing['sqlite'] += time.perf_counter() - start
+
+    def execute(self, *args):
+        self.timing['queries'] += 1
+        return self._timed(sqlite3.Cursor.execute, *args)
+
+    def fetchone(self):
+        return self._timed(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(sqlite3.Cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(sqlite3.Cursor.fetchall)
+
+    def __next__(self):
+        return self._timed(sqlite3.Cursor.__next__)
+
+
+def get_cursor():
+    """
+    Get a cursor on the connection of the current request. The connection
+    is taken from the pool (or opened if the pool is empty) the first time
+    it is needed during a request and given back when the request ends, so
+    concurrent requests never share a connection or a cursor.
+    :return: A cursor on the request's connection
+    """
+
+    if 'db' not in g:
+        try:
+            g.db = _pool.get_nowait()
+        except queue.Empty:
+            g.db = open_connection()
+    if 'request_timing' in g:
+        cursor = g.db.cursor(TimedCursor)
+        cursor.timing = g.request_timing
+        return cursor
+    return g.db.cursor()
+
+
+@app.teardown_appcontext
+def release_connection(exception):
+    """
+    Give the connection of the request back to the pool, closing it if
+    the pool is already full
+    """
+
+    connection = g.pop('db', None)
+    if connection is None:
+        return
+    if _pool.qsize() < app.config['DB_POOL_SIZE']:
+        _pool.put(connection)
+    else:
+        connection.close()
+
+
+def request_data(get):
+    """
+    Get an in-memory structure loaded from the database (the snapshot, the
+    neighbor graph, the name index) for the current request, from the
+    version of the dataset the response is stamped with. Each structure is
+    only checked for changes every SNAPSHOT_CHECK_INTERVAL seconds, on its
+    own timer, so one loaded from another version is checked again at
+    once; if it still differs (the database changed in between) the
+    response is neither stamped with the version nor cached.
+    :param get: Function getting the structure, given the number of
+    seconds between two checks
+    :return: The structure
+    """
+
+    data = get(app.config['SNAPSHOT_CHECK_INTERVAL'])
+    if not has_request_context() or 'dataset_version' not in g:
+        return data
+    if data['version'] != g.dataset_version:
+        data = get(0)
+        if data['version'] != g.dataset_version:
+            g.mixed_versions = True
+    return data
+
+
+def current_snapshot():
+    """
+    :return: The up to date snapshot of the database
+    """
+
+    return request_data(lambda check_interval: snapshot.get_snapshot(
+        app.config['DATABASE'], check_interval, app.config['SNAPSHOT_FILE']))
+
+
+def current_version():
+    """
+    :return: The up to date version stamp of the dataset, checked like the
+    snapshot when the database changes, or the version of the binary
+    snapshot served
+    """
+
+    if app.config['SNAPSHOT'] and app.config['SNAPSHOT_FILE']:
+        return current_snapshot()['version']
+    return http_cache.dataset_version(app.config['DATABASE'],
+                                      app.config['SNAPSHOT_CHECK_INTERVAL'])
+
+
+def response_encoding():
+    """
+    :return: The content coding the response of the current request is
+    compressed with, None if it is not compressed
+    """
+
+    if not app.config['COMPRESSION']:
+        return None
+    return compression.choose_encoding(request.accept_encodings)
+
+
+# Databases this process already brought up to the current schema
+_migrated = set()
+_migration_lock = threading.Lock()
+
+
+@app.before_request
+def migrate_database():
+    """
+    Bring the database up to the current schema before the first request
+    reading it, so that a database written by an older version, like the
+    one in the repository, is served without running prepare_data.py first
+    """
+
+    database = app.config['DATABASE']
+    if database in _migrated:
+        return
+    with _migration_lock:
+        if database not in _migrated:
+            create_database(database)
+            _migrated.add(database)
+
+
+@app.before_request
+def start_request_timer():
+    """
+    Start measuring the request when the metrics are enabled
+    """
+
+    if metrics.enabled:
+        g.request_timing = {'start': time.perf_counter(), 'sqlite': 0.0,
+                            'queries': 0}
+
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    Record the latency of the request in the histogram of its route, with
+    the time it spent in SQLite, once its body is sent, so that streamed
+    bodies are measured until their end. Registered before finish_response
+    so that it runs after it and measures the compression too.
+    """
+
+    timing = g.get('request_timing')
+    if timing is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    method, status = request.method, response.status_code
+
+    def record():
+        metrics.observe('api_request_seconds',
+                        time.perf_counter() - timing['start'],
+                        route=route, method=method, status=status)
+        if timing['queries']:
+            metrics.observe('api_sqlite_seconds', timing['sqlite'],
+                            route=route)
+            metrics.inc('api_sqlite_queries_total', timing['queries'],
+                        route=route)
+
+    response.call_on_close(record)
+    return response
+
+
+@app.before_request
+def serve_cached_response():
+    """
+    Answer a GET request without running its route when possible: with
+    304 NOT MODIFIED if the client already has the response of the current
+    dataset version (its If-None-Match holds the ETag), otherwise with the
+    serialized and compressed body kept in the response cache
+    """
+
+    if request.method != 'GET' or request.endpoint in UNCACHED_ENDPOINTS:
+        return None
+    g.dataset_version = current_version()
+    if request.if_none_match.contains_weak(str(g.dataset_version)):
+        http_cache.count_not_modified()
+        return app.response_class(status=304)
+    if not app.config['RESPONSE_CACHE_SIZE']:
+        return None
+    g.cache_key = http_cache.cache_key(request.path, request.args,
+                                       response_encoding())
+    cached = http_cache.get_response(g.cache_key, g.dataset_version)
+    if cached is None:
+        return None
+    g.cache_hit = True
+    body, mimetype, encoding = cached
+    response = app.response_class(body, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+@app.after_request
+def finish_response(response):
+    """
+    Add the ETag of the dataset version and the Cache-Control header to
+    the successful GET responses built from that version, compress the
+    large responses and keep the new GET responses in the response cache,
+    compressed
+    """
+
+    cacheable = ('dataset_version' in g and not g.get('mixed_versions')
+                 and response.status_code in (200, 304))
+    if cacheable:
+        response.set_etag(str(g.dataset_version), weak=True)
+        response.headers['Cache-Control'] = (
+            f"public, max-age={app.config['CACHE_MAX_AGE']}")
+    if app.config['COMPRESSION']:
+        response.vary.add('Accept-Encoding')
+    if g.get('cache_hit'):
+        response.headers['X-Cache'] = 'HIT'
+        return response
+    if response.status_code != 200:
+        return response
+
+    # Files (the exports) are sent as they are stored
+    encoding = response_encoding()
+    if (encoding and 'Content-Encoding' not in response.headers
+            and not response.direct_passthrough):
+        if response.is_streamed:
+            response.response = compression.compress_chunks(
+                response.response, encoding)
+            response.headers['Content-Encoding'] = encoding
+        elif response.content_length >= app.config['COMPRESS_MIN_BYTES']:
+            response.set_data(
+                compression.compress(response.get_data(), encoding))
+            response.headers['Content-Encoding'] = encoding
+    # Streamed responses are never held whole, so they are not cached
+    if cacheable and 'cache_key' in g and not response.is_streamed:
+        response.headers['X-Cache'] = 'MISS'
+        http_cache.store_response(
+            g.cache_key, g.dataset_version, response.get_data(),
+            response.mimetype, response.headers.get('Content-Encoding'),
+            app.config['RESPONSE_CACHE_SIZE'])
+    return response
+
+
+def respond_rows(rows, format_row):
+    """
+    Build the response of a route returning a list of rows: a JSON array,
+    or newline delimited JSON when the "format" argument is "ndjson". The
+    NDJSON responses, and the JSON arrays when STREAM_RESPONSES is set, are
+    streamed straight from the rows iterator (the database cursor), a
+    chunk of STREAM_CHUNK_ROWS rows at a time, so the rows are never all
+    held in memory, neither as tuples nor as dicts.
+    :param rows: An iterable of the rows, a cursor or a list
+    :param format_row: Function turning a row into its JSON value
+    :return: The response, or 400 BAD REQUEST if the format is unknown
+    """
+
+    output_format = request.args.get('format', 'json')
+    if output_format not in ('json', 'ndjson'):
+        return jsonify({
+            "error": "The parameter 'format' must be json or ndjson"}), 400
+    if output_format == 'json' and not app.config['STREAM_RESPONSES']:
+        return jsonify([format_row(row) for row in rows])
+
+    dumps = SERIALIZERS[app.config['JSON_SERIALIZER']]
+    if output_format == 'ndjson':
+        chunks, mimetype = ndjson_chunks, 'application/x-ndjson'
+    else:
+        chunks, mimetype = json_array_chunks, 'application/json'
+    return app.response_class(
+        stream_with_context(chunks(map(format_row, rows), dumps,
+                                   app.config['STREAM_CHUNK_ROWS'])),
+        mimetype=mimetype)
+
+
+def current_graph():
+    """
+    :return: The up to date neighbor graph of the database, reloaded like
+    the snapshot when the database changes
+    """
+
+    return request_data(lambda check_interval: graph.get_graph(
+        app.config['DATABASE'], check_interval))
+
+
+def country_not_found(name):
+    """
+    :param name: The name of the country that was searched
+    :return: 404 NOT FOUND with a descriptive message
+    """
+
+    return jsonify({"error": f"The country '{name}' was not found"}), 404
+
+
+def term_conditions(column, terms, prefix):
+    """
+    Build the SQL conditions selecting the countries having every one of
+    the given terms (or a term starting with it) in the term table of a
+    text column
+    :param column: The text column whose terms are searched
+    :param terms: The searched terms
+    :param prefix: Whether the terms are matched as prefixes
+    :return: The SQL conditions on the id of the countries and their
+    parameters
+    """
+
+    table = TERM_SEARCH[column][0]
+    if prefix:
+        condition = 'term >= ? AND term < ?'
+        parameters = [bound for term in terms
+                      for bound in (term, term + '\U0010ffff')]
+    else:
+        condition = 'term = ?'
+        parameters = list(terms)
+    conditions = ' AND '.join(
+        [f'id IN (SELECT country_id FROM {table} WHERE {condition})']
+        * len(terms))
+    return conditions, parameters
+
+
+def query_ranking(metric, descending, limit, offset=0, after=None,
+                  minimum=None, maximum=None, filters=()):
+    """
+    Rank the countries having a known value of a metric by (value, id),
+    from the highest when descending, the unknown values being stored as
+    -1 by the scraper. The rows are read in the order of the
+    countries_<metric> covering index, so a page only reads its own rows
+    plus the skipped ones: after resumes the ranking after the given row
+    (keyset pagination) without reading the previous pages again, unlike
+    a large offset.
+    :param metric: The numeric column the countries are ranked by
+    :param descending: Rank from the highest value
+    :param limit: Maximum number of rows returned
+    :param offset: Number of matching rows skipped
+    :param after: The (value, id) key of the row the ranking resumes after
+    :param minimum: Smallest value of the metric allowed
+    :param maximum: Largest value of the metric allowed
+    :param filters: (column, text) pairs, the countries having to match
+    each text in the term table of the column
+    :return: The (id, name, value) rows
+    """
+
+    searches = []
+    for column, text in filters:
+        _, split, prefix = TERM_SEARCH[column]
+        terms = split(text.upper())
+        if not terms:
+            return []
+        searches.append((column, terms, prefix))
+
+    if app.config['SNAPSHOT']:
+        current = current_snapshot()
+        allowed = None
+        for column, terms, prefix in searches:
+            matching = snapshot.rows_with_terms(current, column, terms,
+                                                prefix)
+            allowed = matching if allowed is None else allowed & matching
+        return snapshot.ranking(current, metric, descending, limit, offset,
+                                after, minimum, maximum, allowed)
+
+    conditions = [f'{metric} >= 0']
+    parameters = []
+    if minimum is not None:
+        conditions.append(f'{metric} >= ?')
+        parameters.append(minimum)
+    if maximum is not None:
+        conditions.append(f'{metric} <= ?')
+        parameters.append(maximum)
+    if after is not None:
+        conditions.append(
+            f'({metric}, id) {"<" if descending else ">"} (?, ?)')
+        parameters.extend(after)
+    for column, terms, prefix in searches:
+        condition, condition_parameters = term_conditions(column, terms,
+                                                          prefix)
+        conditions.append(condition)
+        parameters.extend(condition_parameters)
+    direction = 'DESC' if descending else 'ASC'
+    cursor = get_cursor()
+    cursor.execute(
+        f'SELECT id, name, {metric} FROM countries '
+        f'WHERE {" AND ".join(conditions)} '
+        f'ORDER BY {metric} {direction}, id {direction} LIMIT ? OFFSET ?',
+        parameters + [limit, offset])
+    return cursor.fetchall()
+
+
+def query_top(metric):
+    """
+    :param metric: The numeric column the countries are ranked by
+    :return: The (name, value) rows of the 10 countries with the highest
+    value of the metric
+    """
+
+    return [row[1:] for row in query_ranking(metric, True, 10)]
+
+
+def query_group_stats(stats, metric=None, aggregate='sum',
+                      descending=True, limit=None):
+    """
+    Read the statistics of the groups of countries (languages, UTC offsets
+    or regimes) from their summary table, kept up to date by the scraper,
+    or from its copy in the snapshot in snapshot mode, so the cost depends
+    on the number of groups and not on the number of countries
+    :param stats: The summary table of the grouping
+    :param metric: The numeric column the groups are ordered by, None to
+    order them by their number of countries
+    :param aggregate: The aggregate of the metric the groups are ordered by
+    (count, sum, avg, min or max), the groups without a known value of the
+    metric coming last
+    :param descending: Whether the groups are ordered from the highest
+    :param limit: The largest number of groups returned, None for all
+    :return: The (term, countries, then count, sum, min and max of each of
+    STATS_METRICS) rows of the groups
+    """
+
+    if app.config['SNAPSHOT']:
+        return snapshot.group_stats(current_snapshot(), stats, metric,
+                                    aggregate, descending, limit)
+    if metric is None:
+        order = 'countries'
+    elif aggregate == 'avg':
+        order = (f'CAST({metric}_sum AS REAL) / '
+                 f'NULLIF({metric}_count, 0)')
+    elif aggregate == 'sum':
+        order = f'CASE WHEN {metric}_count > 0 THEN {metric}_sum END'
+    else:
+        order = f'{metric}_{aggregate}'
+    direction = 'DESC' if descending else 'ASC'
+    cursor = get_cursor()
+    cursor.execute(
+        f'SELECT term, {", ".join(STATS_COLUMNS)} FROM {stats} '
+        f'ORDER BY {order} IS NULL, {order} {direction}, term '
+        f'LIMIT ?', (-1 if limit is None else limit,))
+    return cursor
+
+
+def format_group_stats(row):
+    """
+    :param row: A row read by query_group_stats
+    :return: The JSON value of the statistics of the group, the sum and the
+    average of a metric being null when no country of the group has a
+    known value of it
+    """
+
+    result = {"group": row[0], "countries": row[1]}
+    for index, metric in enumerate(STATS_METRICS):
+        count, total, minimum, maximum = row[2 + 4 * index:6 + 4 * index]
+        result[metric] = {
+            "count": count,
+            "sum": round(total, 2) if count else None,
+            "avg": round(total / count, 2) if count else None,
+            "min": minimum,
+            "max": maximum,
+        }
+    return result
+
+
+def query_names_matching(column, text):
+    """
+    Search the countries by one of their text columns, as configured by
+    the TEXT_SEARCH config key
+    :param column: The text column to search in
+    :param text: The searched text, case-insensitive
+    :return: The (name,) rows of the matching countries, in id order, as
+    a list or as the cursor they are read from
+    """
+
+    if app.config['TEXT_SEARCH'] == 'terms':
+        _, split, prefix = TERM_SEARCH[column]
+        terms = split(text.upper())
+        if not terms:
+            return []
+        if app.config['SNAPSHOT']:
+            return snapshot.names_with_terms(
+                current_snapshot(), column, terms, prefix)
+        # Every term of the searched text must be found
+        conditions, parameters = term_conditions(column, terms, prefix)
+        cursor = get_cursor()
+        return cursor.execute(
+            f'SELECT name FROM countries WHERE {conditions} ORDER BY id',
+            parameters)
+
+    if app.config['SNAPSHOT']:
+        return snapshot.names_containing(
+            current_snapshot(), column, text.upper())
+    cursor = get_cursor()
+    if app.config['TEXT_SEARCH'] == 'fts':
+        return cursor.execute(
+            f'SELECT name FROM countries WHERE id IN '
+            f'(SELECT rowid FROM countries_fts WHERE {column} LIKE ?) '
+            f'ORDER BY id', (f"%{text.upper()}%",))
+    return cursor.execute(
+        f'SELECT name FROM countries '
+        f'WHERE UPPER({column}) LIKE ?', (f"%{text.upper()}%",))
+
+
+def query_countries_by_keys(keys, columns):
+    """
+    Read some columns of many countries with a single query, looking their
+    name keys up in the countries_name_key index and their aliases in the
+    country_aliases table
+    :param keys: The name or alias keys of the countries, see
+    utils.name_key
+    :param columns: The columns read for each country
+    :return: The (key, name, *columns) rows of the countries found, key
+    being the searched key, in id order
+    """
+
+    if not keys:
+        return []
+    if app.config['SNAPSHOT']:
+        return snapshot.countries_by_keys(current_snapshot(), keys, columns)
+    selected = ''.join(f', countries.{column}' for column in columns)
+    placeholders = ", ".join("?" * len(keys))
+    cursor = get_cursor()
+    cursor.execute(
+        f'SELECT countries.id, name_key, name{selected} FROM countries '
+        f'WHERE name_key IN ({placeholders}) '
+        f'UNION ALL '
+        f'SELECT countries.id, alias_key, name{selected} '
+        f'FROM country_aliases '
+        f'JOIN countries ON countries.id = country_aliases.country_id '
+        f'WHERE alias_key IN ({placeholders}) ORDER BY 1',
+        list(keys) * 2)
+    return [row[1:] for row in cursor.fetchall()]
+
+
+def query_column_by_name(column, name, fuzzy=True):
+    """
+    Read a column of a country looking its name key up in the
+    countries_name_key index, then in the country_aliases table, and
+    finally, with FUZZY_MATCHING, trying the closest country
+    :param column: The column to read
+    :param name: The name or an alias of the country, without regard to
+    diacritics and case
+    :param fuzzy: Whether the closest country is tried
+    :return: The (value,) row of the country, or no row
+    """
+
+    key = name_key(name)
+    if app.config['SNAPSHOT']:
+        rows = snapshot.column_by_key(current_snapshot(), column, key)
+    else:
+        cursor = get_cursor()
+        cursor.execute(
+            f'SELECT {column} FROM countries WHERE name_key = ? '
+            f'UNION ALL '
+            f'SELECT countries.{column} FROM country_aliases '
+            f'JOIN countries ON countries.id = country_aliases.country_id '
+            f'WHERE alias_key = ?', (key, key))
+        rows = cursor.fetchall()
+    if not rows and fuzzy:
+        closest = closest_country(name)
+        if closest is not None:
+            return query_column_by_name(column, closest, fuzzy=False)
+    return rows
+
+
+def current_name_index():
+    """
+    :return: The up to date index of the names and aliases of the
+    countries, reloaded like the snapshot when the database changes
+    """
+
+    return request_data(lambda check_interval: name_index.get_index(
+        app.config['DATABASE'], check_interval))
+
+
+def closest_country(name):
+    """
+    :param name: A name that matched neither a country nor an alias
+    :return: The name of the only closest country, or None if there is
+    none, several, or FUZZY_MATCHING is disabled
+    """
+
+    if not app.config['FUZZY_MATCHING']:
+        return None
+    return name_index.resolve(current_name_index(), name)
+
+
+def find_graph_country(neighbor_graph, name):
+    """
+    :param neighbor_graph: The neighbor graph
+    :param name: The name or an alias of a country, without regard to
+    diacritics and case
+    :return: The node of the country, or of the closest country, or None
+    if there is none
+    """
+
+    node = graph.find_country(neighbor_graph, name)
+    if node is None:
+        closest = closest_country(name)
+        if closest is not None:
+            node = graph.find_country(neighbor_graph, closest)
+    return node
+
+
+def encode_cursor(row):
+    """
+    :param row: The last (id, name, value) row of a ranking page
+    :return: The opaque token the next page is requested with
+    """
+
+    key = json.dumps([row[2], row[0]]).encode()
+    return base64.urlsafe_b64encode(key).decode()
+
+
+def decode_cursor(token):
+    """
+    :param token: A token returned by encode_cursor
+    :return: The (value, id) key of the row the page resumes after, or
+    None if the token is invalid
+    """
+
+    try:
+        value, country_id = json.loads(base64.urlsafe_b64decode(token))
+    except (ValueError, TypeError):
+        return None
+    if (not isinstance(value, (int, float)) or isinstance(value, bool)
+            or not isinstance(country_id, int)):
+        return None
+    return value, country_id
+
+
+def parse_number(text):
+    """
+    :param text: The text of a numeric argument
+    :return: The number or None if the text is not a number
+    """
+
+    try:
+        return float(text) if '.' in text else int(text)
+    except ValueError:
+        return None
+
+
+@app.route('/clasament-tari', methods=['GET'])
+def countries_ranking():
+    """
+    This route requires an argument named "criteriu", the metric the
+    countries are ranked by ("populatie", "densitate" or "suprafata"), and
+    accepts the arguments "ordine" ("desc" or "asc", default "desc"),
+    "limita" (default 10), "deplasament" (rows skipped, default 0), "dupa"
+    (the "next" token of the previous page), "minim" and "maxim" (bounds of
+    the metric) and "fus_orar", "limba" and "sistem_politic" (filters
+    matched like the routes searching by them).
+    :return: 200 OK with JSON with the page of countries and the token of
+    the next page (null on the last page), otherwise 400 BAD REQUEST and a
+    descriptive message
+    """
+    criteriu = request.args.get('criteriu')
+    if criteriu not in RANKING_METRICS:
+        return jsonify({
+            "error": "The parameter 'criteriu' must be one of "
+                     + ", ".join(RANKING_METRICS)}), 400
+    metric = RANKING_METRICS[criteriu]
+    ordine = request.args.get('ordine', 'desc')
+    if ordine not in ('desc', 'asc'):
+        return jsonify({
+            "error": "The parameter 'ordine' must be desc or asc"}), 400
+    limita = request.args.get('limita', '10')
+    if (not limita.isdigit()
+            or not 1 <= int(limita) <= app.config['RANKING_MAX_LIMIT']):
+        return jsonify({
+            "error": "The parameter 'limita' must be an integer between 1 "
+                     f"and {app.config['RANKING_MAX_LIMIT']}"}), 400
+    deplasament = request.args.get('deplasament', '0')
+    if not deplasament.isdigit():
+        return jsonify({
+            "error": "The parameter 'deplasament' must be a non-negative "
+                     "integer"}), 400
+    after = None
+    if request.args.get('dupa'):
+        after = decode_cursor(request.args['dupa'])
+        if after is None:
+            return jsonify({
+                "error": "The parameter 'dupa' is not a valid token"}), 400
+    bounds = {}
+    for argument in ('minim', 'maxim'):
+        if request.args.get(argument):
+            bounds[argument] = parse_number(request.args[argument])
+            if bounds[argument] is None:
+                return jsonify({
+                    "error": f"The parameter '{argument}' must be a "
+                             f"number"}), 400
+    filters = [(column, request.args[argument])
+               for argument, column in RANKING_FILTERS.items()
+               if request.args.get(argument)]
+
+    # One more row than requested tells whether there is a next page
+    limit = int(limita)
+    results = query_ranking(metric, ordine == 'desc', limit + 1,
+                            int(deplasament), after, bounds.get('minim'),
+                            bounds.get('maxim'), filters)
+    next_token = encode_cursor(results[limit - 1]) if len(
+        results) > limit else None
+    formatted_results = [{"name": row[1], metric: row[2]}
+                         for row in results[:limit]]
+    return jsonify({"countries": formatted_results, "next": next_token})
 
 
 @app.route('/top-10-tari-populatie', methods=['GET'])
 def top_10_population():
     """
+    Alias of /clasament-tari?criteriu=populatie
     :return: JSON with top 10 countries with the highest population
     """
-    cursor.execute(
-        'SELECT name, population FROM countries '
-        'ORDER BY population DESC LIMIT 10')
-    results = cursor.fetchall()
+    results = query_top('population')
     formatted_results = [
         {"name": row[0], "population": row[1]}
         for row in results]
@@ -26,12 +913,10 @@ def top_10_population():
 @app.route('/top-10-tari-densitate', methods=['GET'])
 def top_10_density():
     """
+    Alias of /clasament-tari?criteriu=densitate
     :return: JSON with top 10 countries with the highest density
     """
-    cursor.execute(
-        'SELECT name, density FROM countries '
-        'ORDER BY density DESC LIMIT 10')
-    results = cursor.fetchall()
+    results = query_top('density')
     formatted_results = [{"name": row[0], "people per km² (density)": row[1]}
                          for row in results]
     return jsonify(formatted_results)
@@ -40,11 +925,10 @@ def top_10_density():
 @app.route('/top-10-tari-suprafata', methods=['GET'])
 def top_10_area():
     """
+    Alias of /clasament-tari?criteriu=suprafata
     :return: JSON with top 10 countries with the highest area
     """
-    cursor.execute(
-        'SELECT name, area FROM countries ORDER BY area DESC LIMIT 10')
-    results = cursor.fetchall()
+    results = query_top('area')
     formatted_results = [{"name": row[0], "area (km²)": row[1]}
                          for row in results]
     return jsonify(formatted_results)
@@ -62,12 +946,8 @@ def countries_by_timezone():
     fus_orar = request.args.get('fus_orar')
     if not fus_orar:
         return jsonify({"error": "The parameter 'fus_orar' is required"}), 400
-    cursor.execute(
-        'SELECT name FROM countries '
-        'WHERE UPPER(timezone) LIKE ?', (f"%{fus_orar.upper()}%",))
-    results = cursor.fetchall()
-    formatted_results = [{"name": row[0]} for row in results]
-    return jsonify(formatted_results)
+    results = query_names_matching('timezone', fus_orar)
+    return respond_rows(results, lambda row: {"name": row[0]})
 
 
 @app.route('/tarile-care-vorbesc', methods=['GET'])
@@ -82,12 +962,8 @@ def countries_by_language():
     limba = request.args.get('limba')
     if not limba:
         return jsonify({"error": "The parameter 'limba' is required"}), 400
-    cursor.execute(
-        'SELECT name FROM countries '
-        'WHERE UPPER(languages) LIKE ?', (f"%{limba.upper()}%",))
-    results = cursor.fetchall()
-    formatted_results = [{"name": row[0]} for row in results]
-    return jsonify(formatted_results)
+    results = query_names_matching('languages', limba)
+    return respond_rows(results, lambda row: {"name": row[0]})
 
 
 @app.route('/tarile-cu-sistem-politic', methods=['GET'])
@@ -103,19 +979,66 @@ def countries_by_regime():
     if not sistem_politic:
         return jsonify({
             "error": "The parameter 'sistem_politic' is required"}), 400
-    cursor.execute(
-        'SELECT name FROM countries WHERE UPPER(regime)'
-        ' LIKE ?', (f"%{sistem_politic.upper()}%",))
-    results = cursor.fetchall()
-    formatted_results = [{"name": row[0]} for row in results]
-    return jsonify(formatted_results)
+    results = query_names_matching('regime', sistem_politic)
+    return respond_rows(results, lambda row: {"name": row[0]})
+
+
+@app.route('/statistici-tari', methods=['GET'])
+def countries_statistics():
+    """
+    This route requires an argument named "grupare", what the countries
+    are grouped by ("fus_orar", "limba" or "sistem_politic"): a country is
+    counted once in its regime, and in each of its UTC offsets or
+    languages, the unknown ones being left out, and accepts the arguments
+    "criteriu" (the metric the groups are ordered by: "populatie",
+    "densitate" or "suprafata", by default their number of countries),
+    "agregare" (the aggregate of the metric: "numar", "suma", "medie",
+    "minim" or "maxim", default "suma"), "ordine" ("desc" or "asc", default
+    "desc") and "limita" (default every group).
+    :return: 200 OK with JSON with the number of countries of each group
+    and the count, sum, average, minimum and maximum of the known
+    population, area and density of its countries, otherwise 400 BAD
+    REQUEST and a descriptive message
+    """
+    grupare = request.args.get('grupare')
+    if grupare not in STATS_GROUPINGS:
+        return jsonify({
+            "error": "The parameter 'grupare' must be one of "
+                     + ", ".join(STATS_GROUPINGS)}), 400
+    criteriu = request.args.get('criteriu')
+    if criteriu is not None and criteriu not in RANKING_METRICS:
+        return jsonify({
+            "error": "The parameter 'criteriu' must be one of "
+                     + ", ".join(RANKING_METRICS)}), 400
+    agregare = request.args.get('agregare', 'suma')
+    if agregare not in STATS_AGGREGATES:
+        return jsonify({
+            "error": "The parameter 'agregare' must be one of "
+                     + ", ".join(STATS_AGGREGATES)}), 400
+    ordine = request.args.get('ordine', 'desc')
+    if ordine not in ('desc', 'asc'):
+        return jsonify({
+            "error": "The parameter 'ordine' must be desc or asc"}), 400
+    limita = request.args.get('limita')
+    if limita is not None and (not limita.isdigit() or int(limita) < 1):
+        return jsonify({
+            "error": "The parameter 'limita' must be a positive "
+                     "integer"}), 400
+
+    results = query_group_stats(
+        STATS_GROUPINGS[grupare], RANKING_METRICS.get(criteriu),
+        STATS_AGGREGATES[agregare], ordine == 'desc',
+        None if limita is None else int(limita))
+    return respond_rows(results, format_group_stats)
 
 
 @app.route('/tarile-vecine-pentru', methods=['GET'])
 def country_neighbors():
     """
     This route requires an argument named "tara" which represents
-    the name of the country the neighbors will be returned for.
+    the name of the country the neighbors will be returned for, or its
+    English name or ISO code, without regard to diacritics and case (a
+    misspelled name is matched with the closest country).
     :return: 200 OK with JSON with the neighbors of the given country
     if the name argument is given, otherwise 400 BAD REQUEST and
     a descriptive message
@@ -123,10 +1046,7 @@ def country_neighbors():
     tara = request.args.get('tara')
     if not tara:
         return jsonify({"error": "The parameter 'tara' is required"}), 400
-    cursor.execute(
-        'SELECT neighbors FROM countries '
-        'WHERE UPPER(name) = ?', (tara.upper(),))
-    results = cursor.fetchall()
+    results = query_column_by_name('neighbors', tara)
     formatted_results = [{"neighbors": row[0]} for row in results]
     return jsonify(formatted_results)
 
@@ -135,7 +1055,9 @@ def country_neighbors():
 def country_capital():
     """
     This route requires an argument named "tara" which represents
-    the name of the country the capital will be returned for.
+    the name of the country the capital will be returned for, or its
+    English name or ISO code, without regard to diacritics and case (a
+    misspelled name is matched with the closest country).
     :return: 200 OK with JSON with the capital of the given country
     if the name argument is given, otherwise 400 BAD REQUEST and
     a descriptive message
@@ -143,13 +1065,283 @@ def country_capital():
     tara = request.args.get('tara')
     if not tara:
         return jsonify({"error": "The parameter 'tara' is required"}), 400
-    cursor.execute(
-        'SELECT capital FROM countries '
-        'WHERE UPPER(name) = ?', (tara.upper(),))
-    results = cursor.fetchall()
+    results = query_column_by_name('capital', tara)
     formatted_results = [{"capital": row[0]} for row in results]
     return jsonify(formatted_results)
 
 
+@app.route('/sugestii-tari', methods=['GET'])
+def country_suggestions():
+    """
+    This route requires an argument named "text", the beginning of the
+    name of a country, of its English name or of its ISO code, and accepts
+    an argument named "limita", the maximum number of countries returned
+    (default: 10). Names are matched without regard to diacritics and
+    case; when no name starts with the text, the countries whose name is
+    closest to it are returned instead.
+    :return: 200 OK with JSON with the matching countries, with the alias
+    that matched when it is not their name, otherwise 400 BAD REQUEST and
+    a descriptive message
+    """
+    text = request.args.get('text', '')
+    if not name_key(text):
+        return jsonify({"error": "The parameter 'text' is required"}), 400
+    limita = request.args.get('limita', '10')
+    maximum = app.config['SUGGESTIONS_MAX_LIMIT']
+    if not limita.isdigit() or not 1 <= int(limita) <= maximum:
+        return jsonify({
+            "error": "The parameter 'limita' must be an integer between 1 "
+                     f"and {maximum}"}), 400
+
+    index = current_name_index()
+    matches = [(name, alias, "prefix") for name, alias in
+               name_index.complete(index, text, int(limita))]
+    if not matches and app.config['FUZZY_MATCHING']:
+        matches = [(name, alias, "fuzzy") for _, name, alias in
+                   name_index.closest(index, text, int(limita))]
+    formatted_results = []
+    for name, alias, match in matches:
+        result = {"name": name, "match": match}
+        if alias is not None:
+            result["alias"] = alias
+        formatted_results.append(result)
+    return jsonify(formatted_results)
+
+
+@app.route('/interogare-tari', methods=['POST'])
+def countries_batch():
+    """
+    This route requires a JSON body with a list of country names named
+    "tari" and a list of fields named "campuri" (capitala, vecini,
+    populatie, densitate, suprafata, limbi, fus_orar, sistem_politic).
+    Names and aliases (English names, ISO codes) are matched without
+    regard to diacritics and case, a misspelled name with the closest
+    country.
+    :return: 200 OK with JSON with one entry per requested name, in the
+    same order, holding the requested fields of the country or an error
+    if it was not found, otherwise 400 BAD REQUEST and a descriptive
+    message
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "A JSON object body is required"}), 400
+    tari = body.get('tari')
+    if (not isinstance(tari, list) or not tari
+            or not all(isinstance(tara, str) for tara in tari)):
+        return jsonify({
+            "error": "The parameter 'tari' must be a non-empty list of "
+                     "names"}), 400
+    if len(tari) > app.config['BATCH_MAX_COUNTRIES']:
+        return jsonify({
+            "error": "At most "
+                     f"{app.config['BATCH_MAX_COUNTRIES']} countries can "
+                     "be requested at once"}), 400
+    campuri = body.get('campuri')
+    if (not isinstance(campuri, list) or not campuri
+            or not all(camp in BATCH_FIELDS for camp in campuri)):
+        return jsonify({
+            "error": "The parameter 'campuri' must be a non-empty list of "
+                     + ", ".join(BATCH_FIELDS)}), 400
+
+    columns = list(dict.fromkeys(BATCH_FIELDS[camp] for camp in campuri))
+    keys = [name_key(tara) for tara in tari]
+    found = {}
+    for row in query_countries_by_keys(list(dict.fromkeys(keys)), columns):
+        found.setdefault(row[0], row[1:])
+    # Look the names found neither as a name nor as an alias up again
+    # under the name of their closest country
+    closest = {}
+    for tara, key in zip(tari, keys):
+        if key not in found and key not in closest:
+            name = closest_country(tara)
+            if name is not None:
+                closest[key] = name_key(name)
+    if closest:
+        rows = query_countries_by_keys(list(set(closest.values())), columns)
+        by_key = {row[0]: row[1:] for row in rows}
+        for key, name in closest.items():
+            if name in by_key:
+                found[key] = by_key[name]
+    formatted_results = []
+    for tara, key in zip(tari, keys):
+        if key not in found:
+            formatted_results.append({
+                "tara": tara, "error": "The country was not found"})
+            continue
+        country = found[key]
+        result = {"tara": tara, "name": country[0]}
+        result.update(zip(columns, country[1:]))
+        formatted_results.append(result)
+    return jsonify(formatted_results)
+
+
+@app.route('/tarile-vecine-la-distanta', methods=['GET'])
+def country_neighborhood():
+    """
+    This route requires an argument named "tara" which represents the name
+    of a country and accepts an argument named "distanta", the maximum
+    number of borders crossed from it (default: 1).
+    :return: 200 OK with JSON with the countries reachable from the given
+    country and their distance, 400 BAD REQUEST if an argument is missing
+    or invalid, 404 NOT FOUND if there is no such country
+    """
+    tara = request.args.get('tara')
+    if not tara:
+        return jsonify({"error": "The parameter 'tara' is required"}), 400
+    distanta = request.args.get('distanta', '1')
+    if not distanta.isdigit() or int(distanta) < 1:
+        return jsonify({
+            "error": "The parameter 'distanta' must be a positive "
+                     "integer"}), 400
+    neighbor_graph = current_graph()
+    start = find_graph_country(neighbor_graph, tara)
+    if start is None:
+        return country_not_found(tara)
+    names = neighbor_graph['names']
+    formatted_results = [{"name": names[node], "distance": distance}
+                         for node, distance in graph.neighborhood(
+                             neighbor_graph, start, int(distanta))]
+    return jsonify(formatted_results)
+
+
+@app.route('/drum-intre-tari', methods=['GET'])
+def countries_path():
+    """
+    This route requires two arguments named "de_la" and "pana_la" which
+    represent the names of the countries the path starts and ends at.
+    :return: 200 OK with JSON with the countries of a shortest land path
+    between them, 400 BAD REQUEST if an argument is missing, 404 NOT FOUND
+    if a country does not exist or no land path joins them
+    """
+    de_la = request.args.get('de_la')
+    pana_la = request.args.get('pana_la')
+    if not de_la or not pana_la:
+        return jsonify({
+            "error": "The parameters 'de_la' and 'pana_la' are "
+                     "required"}), 400
+    neighbor_graph = current_graph()
+    start = find_graph_country(neighbor_graph, de_la)
+    if start is None:
+        return country_not_found(de_la)
+    end = find_graph_country(neighbor_graph, pana_la)
+    if end is None:
+        return country_not_found(pana_la)
+    path = graph.shortest_path(neighbor_graph, start, end)
+    if path is None:
+        return jsonify({
+            "error": f"There is no land path between '{de_la}' and "
+                     f"'{pana_la}'"}), 404
+    names = neighbor_graph['names']
+    return jsonify({"path": [names[node] for node in path],
+                    "borders": len(path) - 1})
+
+
+@app.route('/componente-conexe', methods=['GET'])
+def connected_components():
+    """
+    This route returns the groups of countries joined by land borders.
+    :return: 200 OK with JSON with the connected components of the
+    neighbor graph, from the largest to the smallest
+    """
+    neighbor_graph = current_graph()
+    names = neighbor_graph['names']
+    formatted_results = [{"size": len(members),
+                          "countries": [names[node] for node in members]}
+                         for members in graph.components(neighbor_graph)]
+    return jsonify(formatted_results)
+
+
+@app.route('/exporta', methods=['GET'])
+def export_table():
+    """
+    This route requires the arguments "tabel", the table exported (one of
+    export.TABLES), and "format" ("csv", "ndjson", and "parquet" or
+    "arrow" when pyarrow is installed). The file of the current dataset
+    version is written the first time it is asked for and then sent as it
+    is, compressed with the content coding accepted by the client for the
+    text formats.
+    :return: 200 OK with the file as an attachment, otherwise 400 BAD
+    REQUEST and a descriptive message
+    """
+    tabel = request.args.get('tabel')
+    if tabel not in export.TABLES:
+        return jsonify({
+            "error": "The parameter 'tabel' must be one of "
+                     + ", ".join(export.TABLES)}), 400
+    output_format = request.args.get('format')
+    if output_format not in export.FORMATS:
+        return jsonify({
+            "error": "The parameter 'format' must be one of "
+                     + ", ".join(export.FORMATS)}), 400
+
+    encoding = response_encoding()
+    path, g.dataset_version = export.cached_export(
+        tabel, output_format, encoding, app.config['DATABASE'],
+        app.config['EXPORT_DIRECTORY'])
+    _, mimetype, text = export.FORMATS[output_format]
+    response = send_file(
+        os.path.abspath(path), mimetype=mimetype, as_attachment=True,
+        download_name=export.export_name(tabel, output_format), etag=False)
+    if text and encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    This route returns the metrics collected when the METRICS config key
+    is set: the latency histogram of each route and the time its requests
+    spent in SQLite. Each process of a server keeps its own metrics.
+    :return: 200 OK with the metrics in the Prometheus text format,
+    otherwise 404 NOT FOUND if the metrics are not enabled
+    """
+    if not metrics.enabled:
+        return jsonify({"error": "The metrics are not enabled"}), 404
+    return app.response_class(
+        metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/statistici-cache', methods=['GET'])
+def response_cache_stats():
+    """
+    This route returns the counters of the response cache.
+    :return: JSON with the number of requests answered from the cache
+    (hits), by running their route (misses) and with 304 NOT MODIFIED, the
+    number of cached responses and the current dataset version
+    """
+    return jsonify(dict(http_cache.cache_stats(), version=current_version()))
+
+
 if __name__ == '__main__':
-    app.run()
+    parser = argparse.ArgumentParser(description="Run the countries API")
+    parser.add_argument(
+        '--snapshot', action='store_true',
+        help="serve the routes from an in-memory snapshot of the database")
+    parser.add_argument(
+        '--snapshot-file', metavar='PATH',
+        help="serve the routes from the binary snapshot written by "
+             "prepare_data.py, mapped into memory")
+    parser.add_argument(
+        '--text-search', choices=('terms', 'fts', 'like'),
+        help="how countries are searched by timezone, language and regime "
+             "(default: terms)")
+    parser.add_argument(
+        '--metrics', action='store_true',
+        help="collect the latency of the routes, exposed by /metrics")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    if args.metrics:
+        app.config['METRICS'] = True
+        metrics.enable()
+    if args.text_search:
+        app.config['TEXT_SEARCH'] = args.text_search
+    if args.snapshot_file:
+        app.config['SNAPSHOT_FILE'] = args.snapshot_file
+    if args.snapshot or args.snapshot_file:
+        app.config['SNAPSHOT'] = True
+        # Load the snapshot before the first request
+        current_snapshot()
+    app.run(host=args.host, port=args.port)
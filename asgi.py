@@ -0,0 +1,208 @@
+import asyncio
+import contextvars
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.wsgi import FileWrapper
+
+from api import app as flask_app, current_snapshot
+
+# The Flask routes are blocking, as every SQLite call is. Each request is
+# therefore run in this pool, never on the event loop, which keeps
+# accepting and answering other connections meanwhile; with one worker
+# thread per pooled database connection a request never waits for one
+_executor = ThreadPoolExecutor(
+    max_workers=flask_app.config['DB_POOL_SIZE'],
+    thread_name_prefix='api')
+# Bodies of known length up to this size are read at once, larger ones
+# (the exports) are sent in blocks of FILE_BLOCK_SIZE bytes when they are
+# files, each block being read in a worker thread
+MAX_BUFFERED_BYTES = 1024 * 1024
+FILE_BLOCK_SIZE = 256 * 1024
+
+
+def file_wrapper(file, block_size=FILE_BLOCK_SIZE):
+    """
+    The wsgi.file_wrapper of the requests, reading files in blocks of at
+    least FILE_BLOCK_SIZE bytes
+    """
+
+    return FileWrapper(file, max(block_size, FILE_BLOCK_SIZE))
+
+
+def build_environ(scope, body):
+    """
+    Translate the scope of an ASGI HTTP request into a WSGI environ
+    :param scope: The ASGI connection scope
+    :param body: The complete request body
+    :return: The WSGI environ
+    """
+
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode(
+            'latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': file_wrapper,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            environ['CONTENT_LENGTH'] = value
+        elif f'HTTP_{name}' in environ:
+            environ[f'HTTP_{name}'] += ',' + value
+        else:
+            environ[f'HTTP_{name}'] = value
+    return environ
+
+
+def run_flask(environ):
+    """
+    Run the Flask application on a request, in a worker thread. A body of
+    known length is read entirely here unless it is larger than
+    MAX_BUFFERED_BYTES, the others are left to be iterated chunk by chunk.
+    :param environ: The WSGI environ of the request
+    :return: The status code, the headers and the body, as bytes or as
+    an iterator of chunks
+    """
+
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'),
+                                value.encode('latin-1'))
+                               for name, value in headers]
+
+    body = flask_app(environ, start_response)
+    length = next((int(value) for name, value in response['headers']
+                   if name == b'content-length'), None)
+    if length is not None and length <= MAX_BUFFERED_BYTES:
+        try:
+            content = b''.join(body)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        return response['status'], response['headers'], content
+    return response['status'], response['headers'], body
+
+
+async def lifespan(receive, send):
+    """
+    Answer the startup and shutdown events of the server, loading the
+    snapshot at startup when the snapshot mode is enabled
+    """
+
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if flask_app.config['SNAPSHOT']:
+                await asyncio.get_running_loop().run_in_executor(
+                    _executor, current_snapshot)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            _executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """
+    ASGI entry point serving the routes of api.py, for example with
+    "uvicorn asgi:app --workers 4". The request body is read on the event
+    loop, the route runs in the worker threads and the body of the
+    response is sent chunk by chunk as the route produces it.
+    """
+
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    body = bytearray()
+    while True:
+        message = await receive()
+        body.extend(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+
+    loop = asyncio.get_running_loop()
+    status, headers, response_body = await loop.run_in_executor(
+        _executor, run_flask, build_environ(scope, bytes(body)))
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': headers})
+    if isinstance(response_body, bytes):
+        await send({'type': 'http.response.body', 'body': response_body})
+        return
+    # A streamed body may run in several worker threads, one chunk at a
+    # time, but always in the same context, where the request context
+    # Flask pushed for it lives until it ends
+    context = contextvars.copy_context()
+    chunks = iter(response_body)
+    try:
+        while True:
+            chunk = await loop.run_in_executor(
+                _executor, context.run, next, chunks, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk,
+                            'more_body': True})
+    finally:
+        if hasattr(response_body, 'close'):
+            await loop.run_in_executor(
+                _executor, context.run, response_body.close)
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+if __name__ == '__main__':
+    import argparse
+    import socket
+
+    import uvicorn
+    from uvicorn.supervisors import Multiprocess
+
+    parser = argparse.ArgumentParser(
+        description="Run the countries API on uvicorn")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help="number of worker processes (default: 1)")
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args()
+
+    config = uvicorn.Config('asgi:app', host=args.host, port=args.port,
+                            workers=args.workers, log_level=args.log_level)
+    if args.workers > 1:
+        # The socket uvicorn binds for its workers has no protocol number,
+        # so asyncio does not set TCP_NODELAY on the connections accepted
+        # from it and the body of each response, written after its
+        # headers, waits for the client's delayed ACK (about 40 ms). The
+        # socket is bound here as a TCP socket instead.
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM,
+                             socket.IPPROTO_TCP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((args.host, args.port))
+        sock.set_inheritable(True)
+        Multiprocess(config, sockets=[sock]).run()
+    else:
+        uvicorn.Server(config).run()
@@ -0,0 +1,1439 @@
+import argparse
+import bz2
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from importlib.util import find_spec
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+from create_database import DATABASE, create_database
+
+# Path used for the page listing all the countries on the stub server
+STUB_LIST_PATH = "/wiki/Lista_tarilor"
+# Inputs of the utils parsers together with their expected outputs
+UTILS_GOLDEN = os.path.join('benchmark_data', 'utils_golden.json')
+# Country pages made of wikipedia-like information boxes, together with
+# the fields parsed from each one
+INFOBOX_CORPUS = os.path.join('benchmark_data', 'infobox_corpus.json.gz')
+# Pages-articles dump of wikipedia-like articles, the countries of the
+# database among a few pages the dump ingestion has to skip
+SAMPLE_DUMP = os.path.join('benchmark_data',
+                           'rowiki-sample-pages-articles.xml.bz2')
+# Results of the benchmark suite the later runs are compared with
+SUITE_BASELINE = os.path.join('benchmark_data', 'baseline.json')
+# Numbers of countries of the synthetic tables the suite measures the API on
+SUITE_SIZES = [10000, 100000, 1000000]
+# Requests sent to the API by the load tests, one for each route
+API_REQUESTS = [
+    '/top-10-tari-populatie',
+    '/top-10-tari-densitate',
+    '/top-10-tari-suprafata',
+    '/tarile-cu-fus-orar?fus_orar=%2B2',
+    '/tarile-care-vorbesc?limba=engleza',
+    '/tarile-cu-sistem-politic?sistem_politic=monarhie',
+    '/tarile-vecine-pentru?tara=China',
+    '/capitala-tarii?tara=Japonia',
+    '/tarile-vecine-la-distanta?tara=Romania&distanta=2',
+    '/drum-intre-tari?de_la=Portugalia&pana_la=China',
+    '/componente-conexe',
+    '/clasament-tari?criteriu=suprafata&ordine=asc&limita=20&limba=engleza',
+]
+# Measures of the suite reported but not compared with the baseline: the
+# size of the bodies and the tail latencies, which vary too much between
+# two runs of a few hundred requests
+UNCOMPARED_MEASURES = ('bytes', 'ok', 'p95_ms', 'p99_ms')
+# Requests sent to the API by the suite, at least one for each route,
+# naming countries of the first copy of the synthetic tables
+SUITE_REQUESTS = [
+    ('GET', '/top-10-tari-populatie', None),
+    ('GET', '/top-10-tari-densitate', None),
+    ('GET', '/top-10-tari-suprafata', None),
+    ('GET', '/tarile-cu-fus-orar?fus_orar=%2B2', None),
+    ('GET', '/tarile-care-vorbesc?limba=engleza', None),
+    ('GET', '/tarile-cu-sistem-politic?sistem_politic=monarhie', None),
+    ('GET', '/tarile-vecine-pentru?tara=China%200', None),
+    ('GET', '/capitala-tarii?tara=Japonia%200', None),
+    ('GET', '/capitala-tarii?tara=Japnia%200', None),
+    ('GET', '/sugestii-tari?text=Rom', None),
+    ('GET', '/sugestii-tari?text=Bulgria%200', None),
+    ('POST', '/interogare-tari', {
+        'tari': ['China 0', 'India 0', 'Japonia 0', 'Brazilia 0',
+                 'Germania 0', 'Portugalia 0'],
+        'campuri': ['capitala', 'vecini', 'populatie']}),
+    ('GET', '/tarile-vecine-la-distanta?tara=Romania%200&distanta=2', None),
+    ('GET', '/drum-intre-tari?de_la=Portugalia%200&pana_la=China%200',
+     None),
+    ('GET', '/componente-conexe', None),
+    ('GET', '/clasament-tari?criteriu=populatie&limita=100', None),
+    ('GET', '/clasament-tari?criteriu=suprafata&ordine=asc&limita=20'
+            '&limba=engleza', None),
+    ('GET', '/statistici-tari?grupare=fus_orar', None),
+    ('GET', '/statistici-tari?grupare=sistem_politic&criteriu=populatie'
+            '&agregare=medie', None),
+    ('GET', '/exporta?tabel=countries&format=csv', None),
+    ('GET', '/statistici-cache', None),
+]
+# Servers compared by the serve benchmark: the module each one needs and
+# its command, {port}, {workers} and {threads} being filled in
+API_SERVERS = {
+    'flask': (None, [sys.executable, 'api.py', '--port', '{port}']),
+    'gunicorn': ('gunicorn', [
+        sys.executable, '-m', 'gunicorn', '--workers', '{workers}',
+        '--threads', '{threads}', '--bind', '127.0.0.1:{port}',
+        '--log-level', 'warning', 'api:app']),
+    'uvicorn': ('uvicorn', [
+        sys.executable, 'asgi.py', '--workers', '{workers}', '--port',
+        '{port}', '--log-level', 'warning']),
+}
+
+
+def build_stub_site(database=DATABASE, filler_kb=0):
+    """
+    Build a set of wikipedia-like pages out of the countries already stored
+    in the database: one list page with the countries table and one page
+    per country with an "infocaseta" information box, both shaped the way
+    the scraper expects them on ro.wikipedia.org.
+    :param database: Path of the database the countries are read from
+    :param filler_kb: Approximate number of KB of article text added after
+    the information box of each country page, real pages being several
+    hundred KB long
+    :return: A dict mapping each url path to the HTML text served for it
+    """
+
+    conn = sqlite3.connect(database)
+    rows = conn.execute(
+        'SELECT name, capital, population, density, area, neighbors, '
+        'languages, timezone, regime FROM countries ORDER BY id').fetchall()
+    conn.close()
+
+    paragraph = (
+        '<p>Lorem <b>ipsum</b> dolor sit amet, <a href="/wiki/Lorem">'
+        'consectetur</a> adipiscing elit<sup class="reference">'
+        '<a href="#cite_note-1">[1]</a></sup>, sed do eiusmod tempor.</p>'
+        '<div class="thumb"><div><a href="/wiki/Fisier:Harta.svg">'
+        '<img src="harta.svg" width="220"></a></div></div>')
+    filler = paragraph * (filler_kb * 1024 // len(paragraph))
+
+    pages = {}
+    table_rows = ['<tr><th>Nr.</th><th>Țara</th><th>Populație</th></tr>']
+    for index, (name, capital, population, density, area, neighbors,
+                languages, timezone, regime) in enumerate(rows, start=1):
+        path = "/wiki/" + quote(name.replace(" ", "_"))
+        table_rows.append(
+            f'<tr><td>{index}</td><td><a href="{path}">{name}</a></td>'
+            f'<td>{population:,}</td></tr>'.replace(",", "."))
+        pages[path] = (
+            '<html><body><table class="infocaseta">'
+            '<tr><th>Suprafață</th><td></td></tr>'
+            f'<tr><th>Total</th><td>{area} km²</td></tr>'
+            f'<tr><th>Densitate</th><td>{density} loc./km²</td></tr>'
+            f'<tr><th>Capitala</th><td>{capital}</td></tr>'
+            f'<tr><th>Vecini</th><td>{neighbors}</td></tr>'
+            f'<tr><th>Limbi oficiale</th><td>{languages}</td></tr>'
+            f'<tr><th>Fus orar</th><td>{timezone}</td></tr>'
+            f'<tr><th>Sistem politic</th><td>{regime}</td></tr>'
+            '</table>' + filler + '</body></html>')
+    pages[STUB_LIST_PATH] = (
+        '<html><body><table class="wikitable"><tbody>'
+        + ''.join(table_rows) + '</tbody></table></body></html>')
+    return pages
+
+
+def load_saved_pages(directory):
+    """
+    Load saved wikipedia HTML pages from a directory, the file
+    "Lista_tarilor.html" being served as the list page and every other
+    "<href>.html" file as /wiki/<href>, href being the percent-encoded
+    link found in the list page
+    :param directory: The directory containing the saved pages
+    :return: A dict mapping each url path to the HTML text served for it
+    """
+
+    pages = {}
+    for file_name in os.listdir(directory):
+        if file_name.endswith('.html'):
+            with open(os.path.join(directory, file_name),
+                      encoding='utf-8') as file:
+                pages["/wiki/" + file_name[:-len('.html')]] = file.read()
+    return pages
+
+
+def start_stub_server(pages, latency=0.05):
+    """
+    Start a local HTTP server in a background thread serving the given
+    pages, each response being delayed to simulate the round trip to
+    wikipedia. Pages carry an ETag and conditional requests for an
+    unchanged page are answered with 304 Not Modified
+    :param pages: A dict mapping each url path to the HTML text to serve
+    :param latency: Number of seconds each response is delayed with
+    :return: The running server and the base url it can be reached at
+    """
+
+    class StubWikipediaHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            html = pages.get(self.path)
+            if html is None:
+                self.send_error(404)
+                return
+            body = html.encode('utf-8')
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubWikipediaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def timed_scrape(base_url, workers, min_interval, passes=1):
+    """
+    Run full scrapes against the stub server into a fresh database, every
+    pass after the first one revalidating the pages already scraped, and
+    a last pass parsing everything again from the HTML cache
+    :return: The wall clock seconds of each pass, the last one being the
+    re-parse from the cache
+    """
+
+    from scraper import scrape_wikipedia
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'bench.db')
+        create_database(database)
+        conn = sqlite3.connect(database)
+        cache_directory = os.path.join(directory, 'cache')
+        elapsed = []
+        for index in range(passes + 1):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                scrape_wikipedia(
+                    workers=workers,
+                    min_interval=min_interval,
+                    base_url=base_url,
+                    countries_table_url=base_url + STUB_LIST_PATH,
+                    connection=conn,
+                    cache_directory=cache_directory,
+                    from_cache=index == passes,
+                    journal=os.path.join(directory, 'journal.db'))
+            elapsed.append(time.perf_counter() - start)
+        conn.close()
+    return elapsed
+
+
+def load_cached_pages(directory):
+    """
+    Load every page kept in an HTML cache directory
+    :param directory: The directory of the cache
+    :return: A dict mapping each url to the HTML text of the page
+    """
+
+    from html_cache import cached_urls, load_page
+
+    return {url: load_page(url, directory)
+            for url in cached_urls(directory)}
+
+
+def benchmark_parse(args):
+    """
+    Measure the per-page parse time and the peak memory of every HTML
+    parsing backend on the same pages
+    """
+
+    from html_backends import BACKENDS
+    from scraper import extract_country_rows, parse_country_details
+
+    if args.cache:
+        pages = list(load_cached_pages(args.cache).values())
+    elif args.pages:
+        pages = list(load_saved_pages(args.pages).values())
+    else:
+        pages = list(build_stub_site(filler_kb=args.filler_kb).values())
+    pages = pages[:args.limit]
+
+    def parse(html, backend):
+        if 'infocaseta' in html:
+            return parse_country_details(html, backend)
+        return [row[:2] for row in extract_country_rows(html, '', backend)]
+
+    size = sum(len(html) for html in pages) / len(pages) / 1024
+    print(f"pages: {len(pages)}, average size: {size:.0f} KB")
+    print(f"{'backend':<12} {'ms/page':>9} {'peak KB':>9}")
+    for backend in sorted(BACKENDS):
+        start = time.perf_counter()
+        for html in pages:
+            parse(html, backend)
+        per_page = (time.perf_counter() - start) / len(pages) * 1000
+
+        peak = 0
+        for html in pages[:args.memory_pages]:
+            tracemalloc.start()
+            parse(html, backend)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        print(f"{backend:<12} {per_page:>9.2f} {peak / 1024:>9.0f}")
+
+
+def build_synthetic_database(database, count, source=DATABASE, seed=0):
+    """
+    Create a database of the given number of countries, made of the
+    countries of the source database repeated under numbered names with
+    their numbers scaled randomly, written the way the scraper writes them
+    (term tables included). The neighbors of each copy are renamed to the
+    countries of the same copy, so that the neighbor graph is made of as
+    many copies of the real one.
+    :param database: Path of the database file to create
+    :param count: Number of countries
+    :param source: Path of the database the countries are taken from
+    :param seed: Seed of the random numbers
+    """
+
+    from storage import (NEIGHBOR_ALIASES, NEIGHBOR_SEPARATOR, connect,
+                         replace_neighbors, upsert_countries)
+    from utils import name_key
+
+    source_conn = sqlite3.connect(source)
+    countries = source_conn.execute(
+        'SELECT name, capital, population, density, area, neighbors, '
+        'languages, timezone, regime FROM countries ORDER BY id').fetchall()
+    source_conn.close()
+    # Names of the countries each neighbor is resolved to, as done by
+    # storage.replace_neighbors
+    names = {name_key(country[0]): country[0] for country in countries}
+    for alias, name in NEIGHBOR_ALIASES.items():
+        names.setdefault(name_key(alias), name)
+
+    create_database(database)
+    conn = connect(database)
+    generator = random.Random(seed)
+    batch = []
+    for index in range(count):
+        (name, capital, population, density, area, neighbors, languages,
+         timezone, regime) = countries[index % len(countries)]
+        copy = index // len(countries)
+        if neighbors:
+            neighbors = NEIGHBOR_SEPARATOR.join(
+                f"{names[name_key(neighbor)]} {copy}"
+                if name_key(neighbor) in names else neighbor
+                for neighbor in neighbors.split(NEIGHBOR_SEPARATOR))
+        scale = generator.uniform(0.5, 2.0)
+        batch.append((f"{name} {copy}", capital,
+                      int((population or 0) * scale),
+                      round((density or 0) * scale, 1),
+                      int((area or 0) * scale), neighbors, languages,
+                      timezone, regime, None, None))
+        if len(batch) == 10000:
+            upsert_countries(conn, batch)
+            batch = []
+    if batch:
+        upsert_countries(conn, batch)
+    replace_neighbors(conn)
+    conn.close()
+
+
+def benchmark_utils(args):
+    """
+    Measure the number of calls per second of each function of utils.py on
+    the inputs of the golden file
+    """
+
+    print(f"{'function':<38} {'calls/s':>10}")
+    for name, calls in measure_utils(args.seconds).items():
+        print(f"{name:<38} {calls:>10.0f}")
+
+
+def measure_utils(seconds):
+    """
+    Call each function of utils.py on the inputs of the golden file for the
+    given number of seconds
+    :param seconds: The time spent calling each function
+    :return: A dict mapping each function name to its calls per second
+    """
+
+    import utils
+
+    with open(UTILS_GOLDEN, encoding='utf-8') as file:
+        golden = json.load(file)
+    results = {}
+    for name, cases in golden.items():
+        function = getattr(utils, name)
+        values = [value for value, _ in cases]
+        runs = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            for value in values:
+                function(value)
+            runs += len(values)
+        results[name] = runs / (time.perf_counter() - start)
+    return results
+
+
+def load_infobox_corpus(path=INFOBOX_CORPUS):
+    """
+    :param path: Path of the corpus file
+    :return: The list of the [url path, HTML text, parsed fields] entries
+    of the information box corpus
+    """
+
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def measure_infobox(corpus, backends, seconds):
+    """
+    Parse the pages of the information box corpus with parse_country_details
+    for the given number of seconds with each backend
+    :param corpus: The entries of the corpus, see load_infobox_corpus
+    :param backends: The names of the HTML parsing backends
+    :param seconds: The time spent parsing with each backend
+    :return: A dict mapping each backend to its pages parsed per second
+    """
+
+    from scraper import parse_country_details
+
+    results = {}
+    for backend in backends:
+        runs = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            for _, html, _ in corpus:
+                parse_country_details(html, backend)
+            runs += len(corpus)
+        results[backend] = runs / (time.perf_counter() - start)
+    return results
+
+
+def benchmark_infobox(args):
+    """
+    Measure the pages of the information box corpus parsed per second with
+    each HTML parsing backend
+    """
+
+    from html_backends import BACKENDS
+
+    corpus = load_infobox_corpus()
+
+    size = sum(len(html) for _, html, _ in corpus) / len(corpus) / 1024
+    print(f"pages: {len(corpus)}, average size: {size:.1f} KB")
+    print(f"{'backend':<12} {'pages/s':>9}")
+    for backend, pages in measure_infobox(
+            corpus, sorted(BACKENDS), args.seconds).items():
+        print(f"{backend:<12} {pages:>9.0f}")
+
+
+def benchmark_reparse(args):
+    """
+    Fill an HTML cache from the stub server and measure how long parsing
+    the whole cache again takes with a growing number of parse processes
+    """
+
+    from scraper import scrape_wikipedia
+
+    pages = build_stub_site(filler_kb=args.filler_kb)
+    server, base_url = start_stub_server(pages, latency=0)
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'bench.db')
+        create_database(database)
+        conn = sqlite3.connect(database)
+        options = {'base_url': base_url,
+                   'countries_table_url': base_url + STUB_LIST_PATH,
+                   'connection': conn,
+                   'cache_directory': os.path.join(directory, 'cache'),
+                   'journal': os.path.join(directory, 'journal.db')}
+        with contextlib.redirect_stdout(io.StringIO()):
+            scrape_wikipedia(workers=8, min_interval=0, **options)
+        server.shutdown()
+
+        print(f"pages: {len(pages)}, parser: {args.parser}, "
+              f"cpus: {os.cpu_count()}")
+        for parse_workers in [0] + args.parse_workers:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                scrape_wikipedia(from_cache=True,
+                                 backend=args.parser,
+                                 parse_workers=parse_workers,
+                                 **options)
+            elapsed = time.perf_counter() - start
+            print(f"parse workers {parse_workers:>3}: {elapsed:6.2f} s")
+        conn.close()
+
+
+def start_api_server(app):
+    """
+    Start the given WSGI application on a local multi-threaded werkzeug
+    server running in a background thread
+    :param app: The WSGI application to serve
+    :return: The running server and the base url it can be reached at
+    """
+
+    from werkzeug.serving import make_server
+
+    # Do not log every request
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def load_test(base_url, paths, clients, duration):
+    """
+    Send requests from several client threads, each with its own
+    keep-alive session, for the given number of seconds
+    :param base_url: The base url of the API
+    :param paths: The request paths, sent in turn by each client
+    :param clients: The number of concurrent clients
+    :param duration: The number of seconds the test lasts
+    :return: The requests per second, the 50th and 99th percentile latency
+    in milliseconds and the number of failed requests
+    """
+
+    import requests
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset):
+        session = requests.Session()
+        own_latencies = []
+        own_errors = 0
+        index = offset
+        while time.perf_counter() < deadline:
+            path = paths[index % len(paths)]
+            index += 1
+            start = time.perf_counter()
+            try:
+                if not session.get(base_url + path).ok:
+                    own_errors += 1
+            except requests.RequestException:
+                own_errors += 1
+            own_latencies.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(own_latencies)
+            errors[0] += own_errors
+
+    threads = [threading.Thread(target=client, args=(offset,))
+               for offset in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return (len(latencies) / elapsed, percentile(latencies, 0.5),
+            percentile(latencies, 0.99), errors[0])
+
+
+def percentile(latencies, value):
+    """
+    :param latencies: The sorted latencies in seconds
+    :param value: The percentile, between 0 and 1
+    :return: The latency of the percentile in milliseconds
+    """
+
+    return latencies[int(value * (len(latencies) - 1))] * 1000
+
+
+def benchmark_api_load(args):
+    """
+    Load test the API routes with a growing number of concurrent clients
+    """
+
+    from api import app
+
+    app.config['SNAPSHOT'] = args.snapshot
+    if args.no_response_cache:
+        app.config['RESPONSE_CACHE_SIZE'] = 0
+    server, base_url = start_api_server(app)
+    print(f"{'clients':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7}")
+    try:
+        for clients in args.clients:
+            rate, p50, p99, errors = load_test(
+                base_url, API_REQUESTS, clients, args.duration)
+            print(f"{clients:>7} {rate:>9.0f} {p50:>8.2f} {p99:>8.2f} "
+                  f"{errors:>7}")
+    finally:
+        server.shutdown()
+
+
+def start_server_process(command, environment, timeout=30.0):
+    """
+    Start an API server in a child process on a free local port and wait
+    until it answers
+    :param command: The command, {port} being replaced by the port
+    :param environment: Variables added to the environment of the server
+    :param timeout: Number of seconds to wait for the server
+    :return: The process and the base url the server can be reached at
+    """
+
+    import requests
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen(
+        [part.format(port=port) for part in command],
+        env=dict(os.environ, **environment),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base_url + API_REQUESTS[0], timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"The server {' '.join(command)} did not start")
+
+
+def benchmark_serve(args):
+    """
+    Load test the same routes served by the Flask development server, by
+    gunicorn with several worker processes and by uvicorn through the ASGI
+    entry point, each one in its own process
+    """
+
+    from api import app
+
+    environment = {}
+    if args.snapshot:
+        environment['FLASK_SNAPSHOT'] = 'true'
+    if args.no_response_cache:
+        environment['FLASK_RESPONSE_CACHE_SIZE'] = '0'
+
+    print(f"{'server':>9} {'clients':>7} {'req/s':>9} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'errors':>7}")
+    for name in args.servers:
+        module, command = API_SERVERS[name]
+        if module and not find_spec(module):
+            print(f"{name:>9} skipped, the {module} package is not "
+                  f"installed")
+            continue
+        command = [part.replace('{workers}', str(args.workers))
+                   .replace('{threads}', str(args.threads))
+                   for part in command]
+        process, base_url = start_server_process(command, environment)
+        try:
+            for clients in args.clients:
+                rate, p50, p99, errors = load_test(
+                    base_url, API_REQUESTS, clients, args.duration)
+                print(f"{name:>9} {clients:>7} {rate:>9.0f} {p50:>8.2f} "
+                      f"{p99:>8.2f} {errors:>7}")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def benchmark_serialize(args):
+    """
+    Measure a search route matching most of the countries of a large
+    synthetic table with each serializer, each output mode (whole JSON
+    array, streamed JSON array, NDJSON) and each content coding: output
+    bytes per second and peak memory of the Python allocations
+    """
+
+    import compression
+    import http_cache
+    from api import app
+    from serialization import SERIALIZERS
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'bench.db')
+        build_synthetic_database(database, args.rows)
+        app.config['DATABASE'] = database
+        app.config['RESPONSE_CACHE_SIZE'] = 0
+        http_cache.clear()
+        path = '/tarile-cu-sistem-politic?sistem_politic=republica'
+        modes = [('list', False, ''), ('stream', True, ''),
+                 ('ndjson', True, '&format=ndjson')]
+        encodings = [None] + list(compression.ENCODINGS)
+
+        def run(mode, encoding):
+            _, stream, suffix = mode
+            app.config['STREAM_RESPONSES'] = stream
+            headers = {'Accept-Encoding': encoding} if encoding else {}
+            response = test_client.get(path + suffix, headers=headers,
+                                       buffered=False)
+            size = sum(len(chunk) for chunk in response.response)
+            response.close()
+            return size
+
+        print(f"rows: {args.rows}")
+        print(f"{'serializer':>10} {'mode':>7} {'encoding':>8} "
+              f"{'bytes':>10} {'MB/s':>8} {'peak MB':>8}")
+        with app.test_client() as test_client:
+            for serializer in SERIALIZERS:
+                app.config['JSON_SERIALIZER'] = serializer
+                for mode in modes:
+                    for encoding in encodings:
+                        run(mode, encoding)
+                        start = time.perf_counter()
+                        for _ in range(args.repeat):
+                            size = run(mode, encoding)
+                        elapsed = (time.perf_counter() - start) / args.repeat
+                        tracemalloc.start()
+                        run(mode, encoding)
+                        peak = tracemalloc.get_traced_memory()[1]
+                        tracemalloc.stop()
+                        print(f"{serializer:>10} {mode[0]:>7} "
+                              f"{encoding or '-':>8} {size:>10} "
+                              f"{size / elapsed / 1e6:>8.1f} "
+                              f"{peak / 1e6:>8.1f}")
+
+
+def benchmark_batch(args):
+    """
+    Compare reading the capital and the neighbors of many countries with
+    two GET requests per country against a single batch request
+    """
+
+    import requests
+    from urllib.parse import urlencode
+
+    from api import app
+
+    app.config['SNAPSHOT'] = args.snapshot
+    conn = sqlite3.connect(DATABASE)
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM countries ORDER BY id LIMIT ?",
+        (args.countries,))]
+    conn.close()
+    server, base_url = start_api_server(app)
+    session = requests.Session()
+    try:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for name in names:
+                query = urlencode({'tara': name})
+                session.get(f"{base_url}/capitala-tarii?{query}").json()
+                session.get(f"{base_url}/tarile-vecine-pentru?{query}").json()
+        separate_time = (time.perf_counter() - start) / args.repeat
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            session.post(
+                f"{base_url}/interogare-tari",
+                json={'tari': names,
+                      'campuri': ['capitala', 'vecini']}).json()
+        batch_time = (time.perf_counter() - start) / args.repeat
+    finally:
+        server.shutdown()
+
+    print(f"countries:          {len(names)}")
+    print(f"separate requests:  {separate_time * 1000:.1f} ms "
+          f"({2 * len(names)} requests)")
+    print(f"batch request:      {batch_time * 1000:.1f} ms")
+    print(f"speedup:            {separate_time / batch_time:.1f}x")
+
+
+def benchmark_scrape(args):
+    """
+    Compare the serial scrape loop with the concurrent fetch mode
+    """
+
+    if args.pages:
+        pages = load_saved_pages(args.pages)
+    else:
+        pages = build_stub_site()
+    server, base_url = start_stub_server(pages, args.latency)
+    try:
+        serial_time, _ = timed_scrape(base_url, 1, args.min_interval)
+        pooled_time, rescrape_time, reparse_time = timed_scrape(
+            base_url, args.workers, args.min_interval, passes=2)
+    finally:
+        server.shutdown()
+
+    print(f"pages: {len(pages)}, latency: {args.latency * 1000:.0f} ms")
+    print(f"serial:             {serial_time:.2f} s")
+    print(f"{args.workers} workers:         {pooled_time:.2f} s")
+    print(f"speedup:            {serial_time / pooled_time:.1f}x")
+    print(f"re-scrape (304s):   {rescrape_time:.2f} s")
+    print(f"re-parse (cache):   {reparse_time:.2f} s")
+
+
+def write_large_dump(path, copies):
+    """
+    Write a dump repeating the pages of the sample dump, the copies after
+    the first one being titled "<title> <copy>" so that each is ingested
+    as another country
+    :param path: The path of the bz2 compressed dump
+    :param copies: Number of times the pages are repeated
+    """
+
+    with bz2.open(SAMPLE_DUMP, 'rt', encoding='utf-8') as file:
+        text = file.read()
+    start = text.index('  <page>')
+    end = text.rindex('</page>') + len('</page>\n')
+    pages = text[start:end].split('  <page>')[1:]
+    with bz2.open(path, 'wt', encoding='utf-8') as file:
+        file.write(text[:start])
+        for copy in range(copies):
+            for page in pages:
+                if copy:
+                    page = re.sub(r'<title>(.*?)</title>',
+                                  rf'<title>\1 {copy}</title>', page, count=1)
+                file.write('  <page>' + page)
+        file.write(text[end:])
+
+
+def benchmark_dump(args):
+    """
+    Measure the articles ingested per second and the peak memory of the
+    streaming on the sample pages-articles dump and on a dump repeating
+    its pages many times
+    """
+
+    from storage import connect
+    from wikidump import ingest_dump, iter_articles, parse_country_wikitext
+
+    def ingest(path, database):
+        # Ingest the dump into a new database, returning the summary of
+        # the run and its seconds
+        create_database(database)
+        conn = connect(database)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = ingest_dump(path, conn, known_only=False)
+        seconds = time.perf_counter() - start
+        conn.close()
+        return stats, seconds
+
+    def stream_peak(path):
+        # The peak memory of reading and parsing the articles alone, the
+        # linking of the neighbors at the end of the ingestion depending
+        # on the number of countries stored rather than on the dump
+        tracemalloc.start()
+        for _, text in iter_articles(path):
+            parse_country_wikitext(text)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    with tempfile.TemporaryDirectory() as directory:
+        large = os.path.join(directory, 'large.xml.bz2')
+        write_large_dump(large, args.copies)
+        print(f"{'dump':<8} {'MB':>6} {'articles':>9} {'articles/s':>11} "
+              f"{'stream peak MB':>15}")
+        for label, path in (('sample', SAMPLE_DUMP), ('large', large)):
+            stats, seconds = ingest(path,
+                                    os.path.join(directory, f'{label}.db'))
+            peak = stream_peak(path)
+            print(f"{label:<8} {os.path.getsize(path) / (1024 * 1024):>6.2f} "
+                  f"{stats['articles']:>9} "
+                  f"{stats['articles'] / seconds:>11.0f} "
+                  f"{peak / (1024 * 1024):>15.2f}")
+
+
+def process_memory(pid):
+    """
+    :param pid: The id of a process
+    :return: Its resident and proportional set sizes in bytes, the pages
+    shared with other processes being divided between them in the second,
+    or None if the kernel does not report them
+    """
+
+    sizes = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as file:
+            for line in file:
+                name, _, value = line.partition(':')
+                if name in ('Rss', 'Pss'):
+                    sizes[name] = int(value.split()[0]) * 1024
+    except OSError:
+        return None
+    return sizes.get('Rss'), sizes.get('Pss')
+
+
+def benchmark_mapped(args):
+    """
+    Compare the snapshot loaded from the database by each process with the
+    binary snapshot written by prepare_data.py and mapped by each one: the
+    time it takes to load, the memory of several processes serving from it
+    at once and the requests per second of the routes
+    """
+
+    import snapshot
+    from api import app
+
+    # Code run by each worker process: load the snapshot, read every row
+    # once, as the routes scanning the table do, then wait to be measured
+    worker_code = (
+        "import sys, snapshot\n"
+        "if sys.argv[2] == 'mapped':\n"
+        "    loaded = snapshot.load_mapped_snapshot(sys.argv[1])\n"
+        "else:\n"
+        "    loaded = snapshot.load_snapshot(sys.argv[1])\n"
+        "for column in loaded['values'].values():\n"
+        "    for index in range(len(column)):\n"
+        "        column[index]\n"
+        "print('ready', flush=True)\n"
+        "sys.stdin.read()\n")
+
+    with tempfile.TemporaryDirectory() as directory:
+        datasets = args.datasets or directory
+        os.makedirs(datasets, exist_ok=True)
+        app.config['RESPONSE_CACHE_SIZE'] = 0
+        app.config['SNAPSHOT'] = True
+        for size in args.sizes:
+            database = os.path.join(datasets, f"synthetic-{size}.db")
+            if not os.path.exists(database):
+                build_synthetic_database(database + '.tmp', size)
+                os.replace(database + '.tmp', database)
+            path = os.path.join(directory, f"synthetic-{size}.snapshot")
+            start = time.perf_counter()
+            file_size = snapshot.write_snapshot(database, path)
+            written = time.perf_counter() - start
+            print(f"\nrows: {size}, snapshot: "
+                  f"{file_size / (1024 * 1024):.1f} MB written in "
+                  f"{written:.2f} s")
+
+            print(f"{'snapshot':<9} {'load ms':>9} {'load MB':>8} "
+                  f"{'RSS MB':>7} {'PSS MB':>7}   ({args.workers} processes)")
+            for mode, source in (('database', database), ('mapped', path)):
+                load = (snapshot.load_mapped_snapshot if mode == 'mapped'
+                        else snapshot.load_snapshot)
+                start = time.perf_counter()
+                load(source)
+                seconds = time.perf_counter() - start
+                tracemalloc.start()
+                load(source)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                workers = [subprocess.Popen(
+                    [sys.executable, '-c', worker_code, source, mode],
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                    for _ in range(args.workers)]
+                try:
+                    for worker in workers:
+                        worker.stdout.readline()
+                    sizes = [process_memory(worker.pid)
+                             for worker in workers]
+                finally:
+                    for worker in workers:
+                        worker.stdin.close()
+                        worker.wait()
+                if None in sizes:
+                    rss = pss = float('nan')
+                else:
+                    rss = sum(rss for rss, _ in sizes) / len(sizes)
+                    pss = sum(pss for _, pss in sizes) / len(sizes)
+                print(f"{mode:<9} {seconds * 1000:>9.1f} "
+                      f"{peak / (1024 * 1024):>8.1f} "
+                      f"{rss / (1024 * 1024):>7.1f} "
+                      f"{pss / (1024 * 1024):>7.1f}")
+
+            results = {}
+            for mode in ('database', 'mapped'):
+                use_database(database)
+                app.config['SNAPSHOT_FILE'] = (path if mode == 'mapped'
+                                               else None)
+                with app.test_client() as client:
+                    results[mode] = measure_routes(client, SUITE_REQUESTS,
+                                                   args.seconds)
+            app.config['SNAPSHOT_FILE'] = None
+            print(f"{'route':<60} {'database':>9} {'mapped':>9}")
+            for route, measures in results['database'].items():
+                print(f"{route[:60]:<60} {measures['req_s']:>9.0f} "
+                      f"{results['mapped'][route]['req_s']:>9.0f}")
+
+
+def benchmark_stats(args):
+    """
+    Compare reading the grouped statistics from the summary tables with
+    aggregating every country of the term tables, and measure the time of
+    the writes of a scrape keeping the summary tables up to date
+    """
+
+    from api import app
+    from storage import STATS_TABLES, connect, stats_query, upsert_countries
+
+    with tempfile.TemporaryDirectory() as directory:
+        datasets = args.datasets or directory
+        os.makedirs(datasets, exist_ok=True)
+        app.config['RESPONSE_CACHE_SIZE'] = 0
+        for size in args.sizes:
+            database = os.path.join(datasets, f"synthetic-{size}.db")
+            if not os.path.exists(database):
+                build_synthetic_database(database + '.tmp', size)
+                os.replace(database + '.tmp', database)
+            # Databases kept from before the summary tables get them here
+            create_database(database)
+            print(f"\nrows: {size}")
+            print(f"{'grouping':<24} {'groups':>7} {'summary ms':>11} "
+                  f"{'group by ms':>12}")
+            conn = sqlite3.connect(database)
+            for stats, table in STATS_TABLES:
+                query = stats_query(table, '1')
+                timings = []
+                for statement in (f'SELECT * FROM {stats}', query):
+                    start = time.perf_counter()
+                    for _ in range(args.repeat):
+                        rows = conn.execute(statement).fetchall()
+                    timings.append(
+                        (time.perf_counter() - start) / args.repeat)
+                print(f"{table:<24} {len(rows):>7} {timings[0] * 1000:>11.2f} "
+                      f"{timings[1] * 1000:>12.2f}")
+            conn.close()
+
+            use_database(database)
+            with app.test_client() as client:
+                results = measure_routes(client, [
+                    ('GET', f'/statistici-tari?grupare={grouping}', None)
+                    for grouping in ('fus_orar', 'limba', 'sistem_politic')],
+                    args.seconds)
+            for route, measures in results.items():
+                print(f"{route:<50} {measures['req_s']:>7.0f} req/s "
+                      f"p50 {measures['p50_ms']:.2f} ms")
+
+            # A scrape changing the numbers, languages, timezone and regime
+            # of some countries, written batch by batch on a copy
+            copy = os.path.join(directory, 'written.db')
+            shutil.copy(database, copy)
+            conn = connect(copy)
+            rows = conn.execute(
+                'SELECT name, capital, population, density, area, '
+                'neighbors, languages, timezone, regime, etag, '
+                'last_modified FROM countries ORDER BY random() LIMIT ?',
+                (args.changes,)).fetchall()
+            terms = [row[6:9] for row in rows]
+            generator = random.Random(0)
+            changed = []
+            for row in rows:
+                scale = generator.uniform(0.5, 2.0)
+                changed.append(
+                    row[:2] + (int((row[2] or 0) * scale),
+                               round((row[3] or 0) * scale, 1),
+                               -1 if generator.random() < 0.1 else
+                               int((row[4] or 0) * scale), row[5])
+                    + generator.choice(terms) + row[9:])
+            start = time.perf_counter()
+            for index in range(0, len(changed), args.batch):
+                upsert_countries(conn, changed[index:index + args.batch])
+            written = time.perf_counter() - start
+            conn.close()
+            os.remove(copy)
+            print(f"{len(changed)} countries written in batches of "
+                  f"{args.batch}: {written * 1000:.1f} ms")
+
+
+def use_database(database):
+    """
+    Point the API at another database, closing the pooled connections and
+    dropping the snapshot, the neighbor graph and the dataset version read
+    from the previous one, which are otherwise only checked again after
+    their check interval
+    :param database: Path of the database file
+    """
+
+    import api
+    import graph
+    import http_cache
+    import snapshot
+
+    api.app.config['DATABASE'] = database
+    while not api._pool.empty():
+        api._pool.get_nowait().close()
+    snapshot._snapshot = None
+    graph._graph = None
+    http_cache._version = None
+    http_cache.clear()
+
+
+def measure_routes(client, requests, seconds, min_requests=3):
+    """
+    Send each request to the API in turn, one at a time, for the given
+    number of seconds, after a first request warming up the connection,
+    the snapshot, the graph or the export it needs
+    :param client: The Flask test client of the API
+    :param requests: The list of (method, path, JSON body) requests
+    :param seconds: The time spent sending each request
+    :param min_requests: Minimum number of times each request is sent
+    :return: A dict mapping "METHOD path" to the requests per second, the
+    50th, 95th and 99th percentile latencies in milliseconds, the size of
+    the response body and whether every response had the status 200
+    """
+
+    def send(method, path, body):
+        response = client.open(path, method=method, json=body)
+        size = len(response.get_data())
+        response.close()
+        return response.status_code, size
+
+    results = {}
+    for method, path, body in requests:
+        status, size = send(method, path, body)
+        succeeded = status == 200
+        latencies = []
+        start = time.perf_counter()
+        while (time.perf_counter() - start < seconds
+               or len(latencies) < min_requests):
+            sent = time.perf_counter()
+            succeeded &= send(method, path, body)[0] == 200
+            latencies.append(time.perf_counter() - sent)
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        results[f"{method} {path}"] = {
+            'req_s': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 0.5),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'bytes': size,
+            'ok': succeeded,
+        }
+    return results
+
+
+def compare_results(results, baseline, tolerance):
+    """
+    Compare the measures of a suite run with the ones of the baseline: the
+    latencies (the "_ms" measures) regress when they grow, the rates when
+    they fall, by more than the tolerance. The measures missing from
+    either run and UNCOMPARED_MEASURES are skipped.
+    :param results: The measures of the run, mapping each benchmark name to
+    a dict of its measures
+    :param baseline: The measures of the baseline, in the same form
+    :param tolerance: The relative change tolerated, 0.25 for 25%
+    :return: The list of (benchmark, measure, baseline value, value,
+    relative change) tuples of the regressions
+    """
+
+    regressions = []
+    for name, measures in results.items():
+        for measure, value in measures.items():
+            previous = baseline.get(name, {}).get(measure)
+            if measure in UNCOMPARED_MEASURES or not previous:
+                continue
+            change = value / previous - 1
+            worse = change if measure.endswith('_ms') else -change
+            if worse > tolerance:
+                regressions.append((name, measure, previous, value, change))
+    return regressions
+
+
+def benchmark_suite(args):
+    """
+    Run the benchmarks the regressions are tracked with: every API route
+    on synthetic tables of growing sizes, the writes of the scraper
+    building them, every parser of utils.py and the parsing of the
+    information box corpus. The measures are compared with the stored
+    baseline, the run failing when one of them regressed beyond the
+    tolerance or when a route did not answer with 200.
+    """
+
+    from api import app
+    from html_backends import BACKENDS
+
+    environment = {'python': platform.python_version(),
+                   'machine': platform.machine(),
+                   'system': platform.system(),
+                   'cpus': os.cpu_count()}
+    results = {}
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        datasets = args.datasets or directory
+        os.makedirs(datasets, exist_ok=True)
+        app.config['EXPORT_DIRECTORY'] = os.path.join(directory, 'exports')
+        app.config['SNAPSHOT'] = args.snapshot
+        app.config['RESPONSE_CACHE_SIZE'] = 0
+        for size in args.sizes:
+            database = os.path.join(datasets, f"synthetic-{size}.db")
+            if not os.path.exists(database):
+                start = time.perf_counter()
+                build_synthetic_database(database + '.tmp', size)
+                os.replace(database + '.tmp', database)
+                results[f"storage {size} build"] = {
+                    'rows_s': size / (time.perf_counter() - start)}
+            use_database(database)
+            print(f"\nrows: {size}")
+            print(f"{'route':<60} {'req/s':>8} {'p50 ms':>8} "
+                  f"{'p95 ms':>8} {'p99 ms':>8} {'ok':>5}")
+            with app.test_client() as client:
+                routes = measure_routes(client, SUITE_REQUESTS, args.seconds)
+            for route, measures in routes.items():
+                print(f"{route[:60]:<60} {measures['req_s']:>8.0f} "
+                      f"{measures['p50_ms']:>8.2f} "
+                      f"{measures['p95_ms']:>8.2f} "
+                      f"{measures['p99_ms']:>8.2f} "
+                      f"{str(measures['ok']):>5}")
+                results[f"api {size} {route}"] = measures
+                if not measures['ok']:
+                    failures.append(f"api {size} {route}")
+
+    print(f"\n{'function':<60} {'calls/s':>8}")
+    for name, calls in measure_utils(args.seconds).items():
+        print(f"{name:<60} {calls:>8.0f}")
+        results[f"utils {name}"] = {'calls_s': calls}
+
+    print(f"\n{'information box backend':<60} {'pages/s':>8}")
+    for backend, pages in measure_infobox(
+            load_infobox_corpus(), sorted(BACKENDS), args.seconds).items():
+        print(f"{backend:<60} {pages:>8.0f}")
+        results[f"infobox {backend}"] = {'pages_s': pages}
+
+    run = {'environment': environment, 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(run, file, indent=1)
+        print(f"\nresults written to {args.output}")
+
+    regressions = []
+    if args.save_baseline:
+        # Keep the measures of the baseline this run did not take, such as
+        # the build of the synthetic tables reused from --datasets
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as file:
+                previous = json.load(file)['results']
+            results = dict(previous, **results)
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump({'environment': environment, 'results': results},
+                      file, indent=1)
+        print(f"baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        if baseline['environment'] != environment:
+            print(f"\nthe baseline was measured on {baseline['environment']}"
+                  f", the comparison may not be meaningful")
+        regressions = compare_results(results, baseline['results'],
+                                      args.tolerance)
+        print(f"\n{len(regressions)} regressions beyond "
+              f"{args.tolerance:.0%} compared with {args.baseline}")
+        for name, measure, previous, value, change in regressions:
+            print(f"  {name} {measure}: {previous:.2f} -> {value:.2f} "
+                  f"({change:+.0%})")
+    for name in failures:
+        print(f"failed requests: {name}")
+    if regressions or failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmarks for the scraper and the API")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scrape_parser = subparsers.add_parser(
+        'scrape', help="serial vs concurrent scrape against a stub server")
+    scrape_parser.add_argument('--workers', type=int, default=8)
+    scrape_parser.add_argument('--latency', type=float, default=0.05)
+    scrape_parser.add_argument('--min-interval', type=float, default=0.0)
+    scrape_parser.add_argument(
+        '--pages', help="directory of saved wikipedia HTML pages to serve "
+                        "instead of pages generated from the database")
+    scrape_parser.set_defaults(func=benchmark_scrape)
+
+    parse_parser = subparsers.add_parser(
+        'parse', help="parse time and peak memory of each HTML backend")
+    parse_parser.add_argument(
+        '--cache', help="HTML cache directory whose pages are parsed")
+    parse_parser.add_argument(
+        '--pages', help="directory of saved wikipedia HTML pages to parse")
+    parse_parser.add_argument(
+        '--filler-kb', type=int, default=300,
+        help="KB of article text added to the generated pages")
+    parse_parser.add_argument(
+        '--limit', type=int, default=40,
+        help="maximum number of pages parsed by each backend")
+    parse_parser.add_argument(
+        '--memory-pages', type=int, default=20,
+        help="number of pages the peak memory is measured on")
+    parse_parser.set_defaults(func=benchmark_parse)
+
+    reparse_parser = subparsers.add_parser(
+        'reparse', help="full re-parse of the HTML cache with a growing "
+                        "number of parse processes")
+    reparse_parser.add_argument('--parser', default='html.parser')
+    reparse_parser.add_argument(
+        '--parse-workers', type=int, nargs='+', default=[1, 2, 4],
+        help="numbers of parse processes to measure")
+    reparse_parser.add_argument('--filler-kb', type=int, default=100)
+    reparse_parser.set_defaults(func=benchmark_reparse)
+
+    utils_parser = subparsers.add_parser(
+        'utils', help="calls per second of the functions of utils.py")
+    utils_parser.add_argument(
+        '--seconds', type=float, default=0.5,
+        help="time spent calling each function")
+    utils_parser.set_defaults(func=benchmark_utils)
+
+    infobox_parser = subparsers.add_parser(
+        'infobox', help="pages of the information box corpus parsed per "
+                        "second by each backend")
+    infobox_parser.add_argument(
+        '--seconds', type=float, default=1.0,
+        help="time spent parsing with each backend")
+    infobox_parser.set_defaults(func=benchmark_infobox)
+
+    dump_parser = subparsers.add_parser(
+        'dump', help="articles per second and peak memory of the "
+                     "ingestion of a pages-articles dump")
+    dump_parser.add_argument(
+        '--copies', type=int, default=20,
+        help="times the pages are repeated in the large dump "
+             "(default: 20)")
+    dump_parser.set_defaults(func=benchmark_dump)
+
+    api_load_parser = subparsers.add_parser(
+        'api-load', help="throughput and latency of the API routes with "
+                         "a growing number of concurrent clients")
+    api_load_parser.add_argument(
+        '--clients', type=int, nargs='+', default=[1, 2, 4, 8])
+    api_load_parser.add_argument(
+        '--duration', type=float, default=3.0,
+        help="seconds each load level lasts")
+    api_load_parser.add_argument(
+        '--snapshot', action='store_true',
+        help="serve the routes from the in-memory snapshot")
+    api_load_parser.add_argument(
+        '--no-response-cache', action='store_true',
+        help="run the route of every request instead of answering from "
+             "the response cache")
+    api_load_parser.set_defaults(func=benchmark_api_load)
+
+    serve_parser = subparsers.add_parser(
+        'serve', help="throughput and latency of the Flask development "
+                      "server, gunicorn and uvicorn serving the API")
+    serve_parser.add_argument(
+        '--servers', nargs='+', choices=sorted(API_SERVERS),
+        default=list(API_SERVERS))
+    serve_parser.add_argument(
+        '--clients', type=int, nargs='+', default=[1, 8, 32])
+    serve_parser.add_argument(
+        '--duration', type=float, default=3.0,
+        help="seconds each load level lasts")
+    serve_parser.add_argument(
+        '--workers', type=int, default=4,
+        help="worker processes of gunicorn and uvicorn")
+    serve_parser.add_argument(
+        '--threads', type=int, default=8,
+        help="threads of each gunicorn worker")
+    serve_parser.add_argument(
+        '--snapshot', action='store_true',
+        help="serve the routes from the in-memory snapshot")
+    serve_parser.add_argument(
+        '--no-response-cache', action='store_true',
+        help="run the route of every request instead of answering from "
+             "the response cache")
+    serve_parser.set_defaults(func=benchmark_serve)
+
+    serialize_parser = subparsers.add_parser(
+        'serialize', help="bytes per second and peak memory of the JSON "
+                          "serializers, streaming and compression")
+    serialize_parser.add_argument(
+        '--rows', type=int, default=100000,
+        help="number of countries of the synthetic table")
+    serialize_parser.add_argument('--repeat', type=int, default=3)
+    serialize_parser.set_defaults(func=benchmark_serialize)
+
+    suite_parser = subparsers.add_parser(
+        'suite', help="every route on synthetic tables, the utils parsers "
+                      "and the information box corpus, compared with the "
+                      "stored baseline")
+    suite_parser.add_argument(
+        '--sizes', type=int, nargs='+', default=SUITE_SIZES,
+        help="numbers of countries of the synthetic tables")
+    suite_parser.add_argument(
+        '--seconds', type=float, default=1.0,
+        help="time spent on each route, function or backend")
+    suite_parser.add_argument(
+        '--datasets',
+        help="directory where the synthetic tables are kept and reused "
+             "by the next runs (default: a temporary directory)")
+    suite_parser.add_argument(
+        '--snapshot', action='store_true',
+        help="serve the routes from the in-memory snapshot")
+    suite_parser.add_argument('--baseline', default=SUITE_BASELINE)
+    suite_parser.add_argument(
+        '--save-baseline', action='store_true',
+        help="store the measures of this run as the baseline instead of "
+             "comparing them with it")
+    suite_parser.add_argument(
+        '--tolerance', type=float, default=0.25,
+        help="relative change of a measure reported as a regression "
+             "(default: 0.25)")
+    suite_parser.add_argument(
+        '--output', help="file the measures of the run are written to")
+    suite_parser.set_defaults(func=benchmark_suite)
+
+    mapped_parser = subparsers.add_parser(
+        'mapped-snapshot', help="snapshot loaded from the database by each "
+                                "process vs the binary snapshot mapped by "
+                                "each one: load time, memory and routes")
+    mapped_parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[10000, 100000],
+        help="numbers of countries of the synthetic tables")
+    mapped_parser.add_argument(
+        '--workers', type=int, default=4,
+        help="number of processes loading the snapshot at once")
+    mapped_parser.add_argument(
+        '--seconds', type=float, default=0.5,
+        help="time spent on each route in each mode")
+    mapped_parser.add_argument(
+        '--datasets',
+        help="directory where the synthetic tables are kept and reused "
+             "(default: a temporary directory)")
+    mapped_parser.set_defaults(func=benchmark_mapped)
+
+    batch_parser = subparsers.add_parser(
+        'batch', help="separate GET requests vs one batch request for the "
+                      "capital and neighbors of many countries")
+    batch_parser.add_argument('--countries', type=int, default=50)
+    batch_parser.add_argument('--repeat', type=int, default=5)
+    batch_parser.add_argument(
+        '--snapshot', action='store_true',
+        help="serve the routes from the in-memory snapshot")
+    batch_parser.set_defaults(func=benchmark_batch)
+
+    stats_parser = subparsers.add_parser(
+        'stats', help="grouped statistics read from the summary tables vs "
+                      "aggregated from every country, and the summary "
+                      "tables kept up to date by the writes")
+    stats_parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[10000, 100000])
+    stats_parser.add_argument('--repeat', type=int, default=5)
+    stats_parser.add_argument('--seconds', type=float, default=1.0)
+    stats_parser.add_argument('--changes', type=int, default=5000)
+    stats_parser.add_argument('--batch', type=int, default=50)
+    stats_parser.add_argument(
+        '--datasets',
+        help="directory where the synthetic tables are kept and reused "
+             "(default: a temporary directory)")
+    stats_parser.set_defaults(func=benchmark_stats)
+
+    arguments = parser.parse_args()
+    arguments.func(arguments)
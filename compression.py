@@ -0,0 +1,72 @@
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content codings the API can compress its responses with, from the most
+# preferred one; brotli is only offered when the brotli package is
+# installed
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+# Responses smaller than this are sent as they are, the compression would
+# save less than it costs
+MIN_BYTES = 1024
+# Compression levels, trading a little of the ratio for speed as the
+# responses are compressed on the fly
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def choose_encoding(accept_encodings):
+    """
+    Pick the content coding of a response
+    :param accept_encodings: The parsed Accept-Encoding header of the
+    request (werkzeug's request.accept_encodings)
+    :return: The first of ENCODINGS accepted by the client or None
+    """
+
+    for encoding in ENCODINGS:
+        if accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    """
+    :param body: The body of a response
+    :param encoding: The content coding, one of ENCODINGS
+    :return: The compressed body
+    """
+
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, GZIP_LEVEL)
+
+
+def compress_chunks(chunks, encoding):
+    """
+    Compress a streamed body chunk by chunk
+    :param chunks: An iterable of the chunks of the body as bytes
+    :param encoding: The content coding, one of ENCODINGS
+    :return: A generator of the compressed chunks
+    """
+
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, finish = compressor.process, compressor.finish
+    else:
+        # A window of 16 + 15 bits makes zlib write the gzip format
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+    try:
+        for chunk in chunks:
+            compressed = process(chunk)
+            if compressed:
+                yield compressed
+        yield finish()
+    finally:
+        # Let the body release what it holds if the client went away
+        if hasattr(chunks, 'close'):
+            chunks.close()
@@ -1,14 +1,40 @@
 import sqlite3
 
+from storage import (COUNTRY_FIELDS, GROUP_TABLES, STATS_COLUMNS,
+                     STATS_TABLES, TERM_TABLES, fields_hash, rebuild_stats,
+                     replace_aliases, replace_neighbors, replace_terms)
+from utils import name_key
 
-def create_database():
+# Path of the database file shared by the scraper and the API
+DATABASE = 'states_of_the_world.db'
+
+
+def find_duplicates(cursor, column):
+    """
+    Find the countries a unique index on a column of the countries table
+    could not be created for
+    :param cursor: A cursor of the database
+    :param column: The column of the countries table
+    :return: The list of the names of each group of countries having the
+    same value of the column, joined with commas
+    """
+
+    return [names for (names,) in cursor.execute(
+        f"SELECT group_concat(name, ', ') FROM countries "
+        f"WHERE {column} IS NOT NULL GROUP BY {column} HAVING COUNT(*) > 1")]
+
+
+def create_database(database=DATABASE):
     """
     Create a SQLite database used for storing the scraped information
     from Wikipedia about countries. A country is represented by a name,
     capital, population, density, area, neighbors, language, timezone and
-    regime.
+    regime. An existing database is brought up to the current schema.
+    :param database: Path of the database file to create
+    :raise ValueError: If the countries of an existing database can not be
+    given unique names, nothing being deleted from it
     """
-    conn = sqlite3.connect('states_of_the_world.db')
+    conn = sqlite3.connect(database)
     cursor = conn.cursor()
     cursor.execute('''CREATE TABLE IF NOT EXISTS countries (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -20,7 +46,199 @@ def create_database():
         neighbors TEXT,
         languages TEXT,
         timezone TEXT,
-        regime TEXT
+        regime TEXT,
+        etag TEXT,
+        last_modified TEXT,
+        name_key TEXT,
+        content_hash TEXT
     )''')
 
+    # Add the columns introduced after the first version of the table
+    # to databases created before them
+    columns = [row[1] for row in cursor.execute(
+        'PRAGMA table_info(countries)')]
+    for column, column_type in (('etag', 'TEXT'),
+                                ('last_modified', 'TEXT'),
+                                ('name_key', 'TEXT'),
+                                ('content_hash', 'TEXT')):
+        if column not in columns:
+            cursor.execute(
+                f'ALTER TABLE countries ADD COLUMN {column} {column_type}')
+
+    # Version stamp of the dataset, incremented by every write of the
+    # scraper and used by the API to validate its cached responses
+    cursor.execute('''CREATE TABLE IF NOT EXISTS dataset_version (
+        version INTEGER NOT NULL
+    )''')
+    if not cursor.execute('SELECT 1 FROM dataset_version').fetchone():
+        cursor.execute('INSERT INTO dataset_version (version) VALUES (1)')
+
+    # A country is stored only once. The duplicates left by older versions
+    # are not deleted, which would drop data without telling, they have to
+    # be resolved by hand before the unique index can be created.
+    duplicates = find_duplicates(cursor, 'name')
+    if duplicates:
+        conn.close()
+        raise ValueError(f"{database} has countries stored more than once: "
+                         + '; '.join(duplicates))
+    cursor.execute('''CREATE UNIQUE INDEX IF NOT EXISTS countries_name
+        ON countries (name)''')
+
+    # Key of each name without diacritics and case, looked up through an
+    # index instead of comparing UPPER(name) with every row. Two countries
+    # can not have the same key: the index of older versions, which was
+    # not unique, is replaced once no two names have the same key, and as
+    # for the names the countries colliding are not deleted.
+    cursor.executemany(
+        'UPDATE countries SET name_key = ? WHERE id = ?',
+        [(name_key(name), country_id) for country_id, name in cursor.execute(
+            'SELECT id, name FROM countries WHERE name_key IS NULL '
+            'AND name IS NOT NULL').fetchall()])
+    if any(index[1] == 'countries_name_key' and not index[2]
+           for index in cursor.execute('PRAGMA index_list(countries)')):
+        cursor.execute('DROP INDEX countries_name_key')
+    duplicates = find_duplicates(cursor, 'name_key')
+    if duplicates:
+        # Closing without a commit rolls the keys filled in back
+        conn.close()
+        raise ValueError(f"{database} has countries whose names only differ "
+                         f"by diacritics or case: " + '; '.join(duplicates))
+    cursor.execute('''CREATE UNIQUE INDEX IF NOT EXISTS countries_name_key
+        ON countries (name_key)''')
+
+    # Hash of the fields of each country, compared with the hash of the
+    # fields scraped again to only write the countries that changed
+    cursor.executemany(
+        'UPDATE countries SET content_hash = ? WHERE id = ?',
+        [(fields_hash(row[1:]), row[0]) for row in cursor.execute(
+            f'SELECT id, {", ".join(COUNTRY_FIELDS)} FROM countries '
+            f'WHERE content_hash IS NULL').fetchall()])
+
+    # Log of the fields changed by the scraper, with their old and new
+    # values and the dataset version that changed them, so that the
+    # changes since any version can be read with the index
+    cursor.execute('''CREATE TABLE IF NOT EXISTS country_changes (
+        id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL,
+        country TEXT NOT NULL,
+        field TEXT NOT NULL,
+        old_value,
+        new_value,
+        changed_at TEXT NOT NULL
+    )''')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS country_changes_version
+        ON country_changes (version)''')
+
+    # Covering indexes of the rankings: the countries ordered by each
+    # numeric column and then by id, holding the name too, so that a page
+    # of a ranking is read from the index alone without sorting the table
+    for metric in ('population', 'density', 'area'):
+        cursor.execute(f'''CREATE INDEX IF NOT EXISTS countries_{metric}
+            ON countries ({metric}, id, name)''')
+
+    # One table per indexed text column, with a row for each term of the
+    # column of each country, so that countries are searched by term with
+    # the index on the term instead of scanning the whole table, and one
+    # of the same form per column with the groups of the statistics each
+    # country is in
+    existing_tables = [row[0] for row in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")]
+    for table, _, _ in TERM_TABLES + GROUP_TABLES:
+        cursor.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+            country_id INTEGER REFERENCES countries (id) ON DELETE CASCADE,
+            term TEXT,
+            PRIMARY KEY (country_id, term)
+        ) WITHOUT ROWID''')
+        cursor.execute(f'''CREATE INDEX IF NOT EXISTS {table}_term
+            ON {table} (term)''')
+    if any(table not in existing_tables
+           for table, _, _ in TERM_TABLES + GROUP_TABLES):
+        replace_terms(conn, cursor.execute(
+            'SELECT id, languages, timezone, regime FROM countries'
+        ).fetchall())
+
+    # Summary of the countries of each group of the group tables, kept up
+    # to date by the scraper for the groups it writes to, so that the
+    # grouped statistics are read without aggregating the countries
+    for stats, _ in STATS_TABLES:
+        columns = ',\n'.join(
+            f'            {column} '
+            + ('INTEGER NOT NULL' if column == 'countries'
+               or column.endswith('_count') else
+               'NUMERIC NOT NULL' if column.endswith('_sum') else 'NUMERIC')
+            for column in STATS_COLUMNS)
+        cursor.execute(f'''CREATE TABLE IF NOT EXISTS {stats} (
+            term TEXT PRIMARY KEY,
+{columns}
+        ) WITHOUT ROWID''')
+    if any(stats not in existing_tables for stats, _ in STATS_TABLES):
+        rebuild_stats(conn)
+
+    # Adjacency table of the neighbor graph, one row for each neighbor of
+    # each country that is itself a country of the table
+    cursor.execute('''CREATE TABLE IF NOT EXISTS country_neighbors (
+        country_id INTEGER REFERENCES countries (id) ON DELETE CASCADE,
+        neighbor_id INTEGER REFERENCES countries (id) ON DELETE CASCADE,
+        PRIMARY KEY (country_id, neighbor_id)
+    ) WITHOUT ROWID''')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS country_neighbors_neighbor
+        ON country_neighbors (neighbor_id)''')
+    if 'country_neighbors' not in existing_tables:
+        replace_neighbors(conn)
+
+    # Other names of the countries (English names, ISO 3166-1 codes, other
+    # Romanian spellings) under their key, so that an alias is looked up
+    # with an index like a name
+    cursor.execute('''CREATE TABLE IF NOT EXISTS country_aliases (
+        alias_key TEXT PRIMARY KEY,
+        country_id INTEGER REFERENCES countries (id) ON DELETE CASCADE,
+        alias TEXT NOT NULL,
+        kind TEXT NOT NULL
+    ) WITHOUT ROWID''')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS country_aliases_country
+        ON country_aliases (country_id)''')
+    if 'country_aliases' not in existing_tables:
+        replace_aliases(conn)
+
+    # Optional trigram full-text index of the text columns, kept up to date
+    # by triggers, allowing substring searches that use an index
+    if 'countries_fts' not in existing_tables:
+        try:
+            cursor.execute('''CREATE VIRTUAL TABLE countries_fts USING fts5(
+                languages, timezone, regime,
+                content='countries', content_rowid='id',
+                tokenize='trigram'
+            )''')
+        except sqlite3.OperationalError:
+            # FTS5 or its trigram tokenizer is not available
+            pass
+        else:
+            cursor.executescript('''
+            CREATE TRIGGER countries_fts_insert AFTER INSERT ON countries
+            BEGIN
+                INSERT INTO countries_fts (rowid, languages, timezone, regime)
+                VALUES (new.id, new.languages, new.timezone, new.regime);
+            END;
+            CREATE TRIGGER countries_fts_delete AFTER DELETE ON countries
+            BEGIN
+                INSERT INTO countries_fts
+                (countries_fts, rowid, languages, timezone, regime)
+                VALUES ('delete', old.id, old.languages, old.timezone,
+                        old.regime);
+            END;
+            CREATE TRIGGER countries_fts_update AFTER UPDATE ON countries
+            BEGIN
+                INSERT INTO countries_fts
+                (countries_fts, rowid, languages, timezone, regime)
+                VALUES ('delete', old.id, old.languages, old.timezone,
+                        old.regime);
+                INSERT INTO countries_fts (rowid, languages, timezone, regime)
+                VALUES (new.id, new.languages, new.timezone, new.regime);
+            END;
+            INSERT INTO countries_fts (countries_fts) VALUES ('rebuild');
+            ''')
     conn.commit()
+
+    # Write-ahead logging lets the API read while the scraper writes
+    cursor.execute('PRAGMA journal_mode=WAL').fetchall()
+    conn.close()
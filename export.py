@@ -0,0 +1,284 @@
+import csv
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+
+import compression
+from create_database import DATABASE
+from serialization import DEFAULT_SERIALIZER, SERIALIZERS, ndjson_chunks
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Directory where the exports of the current dataset version are kept
+EXPORT_DIRECTORY = 'exports'
+# Number of rows read from the database and written at a time
+CHUNK_ROWS = 10000
+
+# Tables that can be exported, with their columns and the type of each
+# one in the columnar formats: the countries without the columns only
+# used by the scraper, and the tables derived from them
+TABLES = {
+    'countries': (
+        ('id', 'int64'),
+        ('name', 'string'),
+        ('capital', 'string'),
+        ('population', 'int64'),
+        ('density', 'float64'),
+        ('area', 'int64'),
+        ('neighbors', 'string'),
+        ('languages', 'string'),
+        ('timezone', 'string'),
+        ('regime', 'string'),
+    ),
+    'country_neighbors': (('country_id', 'int64'), ('neighbor_id', 'int64')),
+    'country_languages': (('country_id', 'int64'), ('term', 'string')),
+    'country_timezones': (('country_id', 'int64'), ('term', 'string')),
+    'country_regimes': (('country_id', 'int64'), ('term', 'string')),
+}
+
+# Formats of the exports, mapped to their file extension, their mimetype
+# and whether the file is made of text that is compressed as a whole.
+# Parquet and Arrow IPC compress their columns themselves (zstd) and are
+# only available when the pyarrow package is installed.
+FORMATS = {
+    'csv': ('.csv', 'text/csv', True),
+    'ndjson': ('.ndjson', 'application/x-ndjson', True),
+}
+if pyarrow:
+    FORMATS['parquet'] = ('.parquet', 'application/vnd.apache.parquet',
+                          False)
+    FORMATS['arrow'] = ('.arrow', 'application/vnd.apache.arrow.file',
+                        False)
+
+# File extension of each content coding of the text formats
+ENCODING_EXTENSIONS = {'gzip': '.gz', 'br': '.br'}
+
+_lock = threading.Lock()
+
+
+def read_chunks(cursor, table, chunk_rows=CHUNK_ROWS):
+    """
+    Read the rows of a table in id order, a chunk at a time
+    :param cursor: A cursor on the database
+    :param table: The name of the table, one of TABLES
+    :param chunk_rows: Number of rows in each chunk
+    :return: A generator of the lists of rows
+    """
+
+    columns = [column for column, _ in TABLES[table]]
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {table} "
+                   f"ORDER BY {columns[0]}, {columns[1]}")
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield rows
+
+
+def csv_chunks(table, chunks):
+    """
+    :param table: The name of the table
+    :param chunks: An iterable of the lists of rows
+    :return: A generator of the CSV text, header first, as UTF-8 chunks
+    """
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow([column for column, _ in TABLES[table]])
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def table_ndjson_chunks(table, chunks, serializer=DEFAULT_SERIALIZER):
+    """
+    :param table: The name of the table
+    :param chunks: An iterable of the lists of rows
+    :param serializer: The JSON serializer, one of SERIALIZERS
+    :return: A generator of the NDJSON chunks, one object per row
+    """
+
+    columns = [column for column, _ in TABLES[table]]
+    rows = (dict(zip(columns, row)) for rows in chunks for row in rows)
+    return ndjson_chunks(rows, SERIALIZERS[serializer], CHUNK_ROWS)
+
+
+def write_columnar(table, chunks, output, output_format):
+    """
+    Write the rows of a table as Parquet or Arrow IPC, one record batch
+    (or row group) per chunk, both compressed with zstd
+    :param table: The name of the table
+    :param chunks: An iterable of the lists of rows
+    :param output: The binary file written
+    :param output_format: 'parquet' or 'arrow'
+    """
+
+    schema = pyarrow.schema([(column, getattr(pyarrow, kind)())
+                             for column, kind in TABLES[table]])
+    if output_format == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(output, schema,
+                                               compression='zstd')
+    else:
+        writer = pyarrow.ipc.new_file(
+            output, schema,
+            options=pyarrow.ipc.IpcWriteOptions(compression='zstd'))
+    with writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_batch(pyarrow.record_batch(
+                [pyarrow.array(values, type=field.type)
+                 for values, field in zip(columns, schema)],
+                schema=schema))
+
+
+def write_export(cursor, table, output_format, path, encoding=None):
+    """
+    Export a table into a file, streaming its rows from the database so
+    that they are never all held in memory. The file is written next to
+    its final path and moved there once complete, so a reader never sees
+    a partial export.
+    :param cursor: A cursor on the database
+    :param table: The name of the table, one of TABLES
+    :param output_format: The format, one of FORMATS
+    :param path: The path of the file
+    :param encoding: The content coding the text formats are compressed
+    with, None to leave them uncompressed
+    """
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            chunks = read_chunks(cursor, table)
+            if output_format == 'csv':
+                body = csv_chunks(table, chunks)
+            elif output_format == 'ndjson':
+                body = table_ndjson_chunks(table, chunks)
+            else:
+                write_columnar(table, chunks, output, output_format)
+                body = ()
+            if encoding:
+                body = compression.compress_chunks(body, encoding)
+            for chunk in body:
+                output.write(chunk)
+        # mkstemp creates the file readable by its owner only
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def export_name(table, output_format, version=None, encoding=None):
+    """
+    :param table: The name of the table
+    :param output_format: The format, one of FORMATS
+    :param version: The dataset version, None to leave it out
+    :param encoding: The content coding of the file, None if it is not
+    compressed
+    :return: The file name of the export
+    """
+
+    name = table if version is None else f"{table}-v{version}"
+    return (name + FORMATS[output_format][0]
+            + ENCODING_EXTENSIONS.get(encoding, ''))
+
+
+def cached_export(table, output_format, encoding=None, database=DATABASE,
+                  directory=EXPORT_DIRECTORY):
+    """
+    Get the export of a table for the current dataset version, writing it
+    the first time it is asked for. Later requests of the same version are
+    served from the file as it is; the exports of older versions are
+    removed when a new one is written. The version and the rows are read
+    in the same transaction, so the file always matches its version.
+    :param table: The name of the table, one of TABLES
+    :param output_format: The format, one of FORMATS
+    :param encoding: The content coding of the text formats, None to leave
+    them uncompressed
+    :param database: Path of the database file
+    :param directory: The directory of the exports
+    :return: The path of the file and the dataset version it holds
+    """
+
+    if not FORMATS[output_format][2]:
+        encoding = None
+    conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        version = cursor.execute(
+            'SELECT version FROM dataset_version').fetchone()[0]
+        name = export_name(table, output_format, version, encoding)
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return path, version
+        # One export is written at a time, the requests asking for the
+        # same one meanwhile wait for it instead of writing it again
+        with _lock:
+            if not os.path.exists(path):
+                write_export(cursor, table, output_format, path, encoding)
+                remove_stale_exports(directory, version)
+        return path, version
+    finally:
+        conn.close()
+
+
+def remove_stale_exports(directory, version):
+    """
+    Remove the exports of every dataset version but the given one
+    :param directory: The directory of the exports
+    :param version: The current dataset version
+    """
+
+    for name in os.listdir(directory):
+        if name.endswith('.tmp'):
+            continue
+        stamp = name.split('.', 1)[0].rpartition('-v')[2]
+        if stamp.isdigit() and int(stamp) != version:
+            os.remove(os.path.join(directory, name))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Export the countries database as CSV, NDJSON, "
+                    "Parquet or Arrow IPC files")
+    parser.add_argument('format', choices=sorted(FORMATS))
+    parser.add_argument(
+        '--tables', nargs='+', choices=list(TABLES), default=list(TABLES),
+        help="tables to export (default: all of them)")
+    parser.add_argument(
+        '--output', default='.',
+        help="directory where the files are written (default: .)")
+    parser.add_argument(
+        '--compression', choices=list(ENCODING_EXTENSIONS),
+        help="compress the CSV or NDJSON files")
+    parser.add_argument('--database', default=DATABASE)
+    args = parser.parse_args()
+
+    encoding = args.compression if FORMATS[args.format][2] else None
+    connection = sqlite3.connect(f"file:{args.database}?mode=ro", uri=True)
+    connection_cursor = connection.cursor()
+    # Every table is read in one transaction, from the same version
+    connection_cursor.execute('BEGIN')
+    for export_table in args.tables:
+        export_path = os.path.join(
+            args.output, export_name(export_table, args.format,
+                                     encoding=encoding))
+        write_export(connection_cursor, export_table, args.format,
+                     export_path, encoding)
+        print(f"Wrote {export_path}")
+    connection.close()
@@ -0,0 +1,188 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from snapshot import CHECK_INTERVAL, database_signature
+from utils import name_key
+
+# Graph currently served and time of the last check of the database
+_graph = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def load_graph(database):
+    """
+    Build the neighbor graph of the countries from the country_neighbors
+    table. Countries are the nodes, numbered in id order, and every link is
+    followed both ways, as a border is shared by the two countries even
+    when only one infobox lists it. The connected components are computed
+    once here, so that the queries only walk the adjacency lists.
+    :param database: Path of the database file
+    :return: The graph, a dict of read-only structures
+    """
+
+    signature = database_signature(database)
+    conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    # A single read transaction, so that the graph and its version are
+    # read from the same state of the database
+    conn.execute('BEGIN')
+    version = conn.execute('SELECT version FROM dataset_version').fetchone()
+    countries = conn.execute(
+        'SELECT id, name FROM countries ORDER BY id').fetchall()
+    positions = {country_id: index
+                 for index, (country_id, _) in enumerate(countries)}
+    neighbors = [set() for _ in countries]
+    for country_id, neighbor_id in conn.execute(
+            'SELECT country_id, neighbor_id FROM country_neighbors'):
+        if country_id in positions and neighbor_id in positions:
+            neighbors[positions[country_id]].add(positions[neighbor_id])
+            neighbors[positions[neighbor_id]].add(positions[country_id])
+    aliases = conn.execute(
+        'SELECT alias_key, country_id FROM country_aliases').fetchall()
+    conn.close()
+
+    names = tuple(name for _, name in countries)
+    # Neighbors of each country, in id order
+    adjacency = tuple(tuple(sorted(indexes)) for indexes in neighbors)
+    # Names and aliases without diacritics and case, mapped to their node
+    keys = {}
+    for index, name in enumerate(names):
+        if name is not None:
+            keys.setdefault(name_key(name), index)
+    for key, country_id in aliases:
+        if country_id in positions:
+            keys.setdefault(key, positions[country_id])
+
+    # Component of each node, components being numbered from the largest
+    component_of = [None] * len(names)
+    components = []
+    for start in range(len(names)):
+        if component_of[start] is not None:
+            continue
+        component_of[start] = start
+        members = [start]
+        for node in members:
+            for neighbor in adjacency[node]:
+                if component_of[neighbor] is None:
+                    component_of[neighbor] = start
+                    members.append(neighbor)
+        components.append(tuple(sorted(members)))
+    components.sort(key=lambda members: (-len(members), members[0]))
+    for number, members in enumerate(components):
+        for node in members:
+            component_of[node] = number
+
+    return {
+        'signature': signature,
+        'version': version[0] if version else 0,
+        'names': names,
+        'keys': keys,
+        'adjacency': adjacency,
+        'component_of': tuple(component_of),
+        'components': tuple(components),
+    }
+
+
+def get_graph(database, check_interval=CHECK_INTERVAL):
+    """
+    Get the current neighbor graph of the database, loading it the first
+    time and rebuilding it when the database files changed, checked at
+    most once every check_interval seconds, like snapshot.get_snapshot
+    :param database: Path of the database file
+    :param check_interval: Minimum number of seconds between two checks
+    :return: The graph
+    """
+
+    global _graph, _checked_at
+    now = time.monotonic()
+    if _graph is not None and now - _checked_at < check_interval:
+        return _graph
+    with _lock:
+        if _graph is None or now - _checked_at >= check_interval:
+            if (_graph is None
+                    or _graph['signature'] != database_signature(database)):
+                _graph = load_graph(database)
+            _checked_at = now
+    return _graph
+
+
+def find_country(graph, name):
+    """
+    :param graph: The neighbor graph
+    :param name: The name or an alias of the country, without regard to
+    diacritics and case
+    :return: The node of the country or None if there is none
+    """
+
+    return graph['keys'].get(name_key(name))
+
+
+def neighborhood(graph, start, depth):
+    """
+    Breadth-first walk of the countries reachable from a country by
+    crossing at most depth borders
+    :param graph: The neighbor graph
+    :param start: The node of the country
+    :param depth: The maximum number of borders crossed
+    :return: The list of (node, distance) pairs, the country itself
+    excepted, ordered by distance and then by id
+    """
+
+    adjacency = graph['adjacency']
+    distances = {start: 0}
+    frontier = [start]
+    found = []
+    for distance in range(1, depth + 1):
+        reached = []
+        for node in frontier:
+            for neighbor in adjacency[node]:
+                if neighbor not in distances:
+                    distances[neighbor] = distance
+                    reached.append(neighbor)
+        if not reached:
+            break
+        reached.sort()
+        found.extend((node, distance) for node in reached)
+        frontier = reached
+    return found
+
+
+def shortest_path(graph, start, end):
+    """
+    Find a path between two countries crossing as few borders as possible,
+    with a breadth-first search that stops as soon as the end is reached
+    :param graph: The neighbor graph
+    :param start: The node of the first country
+    :param end: The node of the second country
+    :return: The list of nodes from start to end, or None if the countries
+    are not in the same component
+    """
+
+    if graph['component_of'][start] != graph['component_of'][end]:
+        return None
+    adjacency = graph['adjacency']
+    previous = {start: None}
+    pending = deque([start])
+    while end not in previous:
+        node = pending.popleft()
+        for neighbor in adjacency[node]:
+            if neighbor not in previous:
+                previous[neighbor] = node
+                pending.append(neighbor)
+    path = [end]
+    while path[-1] != start:
+        path.append(previous[path[-1]])
+    path.reverse()
+    return path
+
+
+def components(graph):
+    """
+    :param graph: The neighbor graph
+    :return: The connected components, each one a tuple of nodes in id
+    order, from the largest to the smallest
+    """
+
+    return list(graph['components'])
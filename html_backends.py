@@ -0,0 +1,144 @@
+import re
+
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
+
+# Start and end tags of tables, used to find where a table ends while
+# skipping the tables nested inside of it
+_TABLE_TAG = re.compile(r'<(/?)table\b[^>]*>', re.IGNORECASE)
+
+
+def _table_start(class_name):
+    """
+    Build the pattern matching the start tag of a table having the
+    given class among its classes
+    :param class_name: The class the table must have
+    :return: The compiled pattern
+    """
+
+    return re.compile(
+        r'<table\b[^>]*\bclass\s*=\s*(["\'])(?:[^"\']*\s)?'
+        + re.escape(class_name) + r'(?:\s[^"\']*)?\1[^>]*>',
+        re.IGNORECASE)
+
+
+_INFOBOX_START = _table_start('infocaseta')
+_WIKITABLE_START = _table_start('wikitable')
+
+
+def _table_fragments(html, start_pattern, first_only=False):
+    """
+    Cut the HTML of the tables starting with the given pattern out of a
+    page without parsing the rest of it
+    :param html: The HTML text of the page
+    :param start_pattern: The pattern matching the start tag of the tables
+    :param first_only: Stop after the first table found
+    :return: The list of HTML fragments, one for each table
+    """
+
+    fragments = []
+    position = 0
+    while True:
+        start = start_pattern.search(html, position)
+        if not start:
+            break
+        depth = 0
+        end = len(html)
+        for tag in _TABLE_TAG.finditer(html, start.start()):
+            depth += -1 if tag.group(1) else 1
+            if depth == 0:
+                end = tag.end()
+                break
+        fragments.append(html[start.start():end])
+        if first_only:
+            break
+        position = end
+    return fragments
+
+
+def _infobox_html_parser(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup.find('table', {'class': 'infocaseta'})
+
+
+def _infobox_strainer(html):
+    soup = BeautifulSoup(html, 'html.parser',
+                         parse_only=SoupStrainer('table'))
+    return soup.find('table', {'class': 'infocaseta'})
+
+
+def _infobox_lxml(html):
+    soup = BeautifulSoup(html, 'lxml', parse_only=SoupStrainer('table'))
+    return soup.find('table', {'class': 'infocaseta'})
+
+
+def _infobox_fragment(html):
+    fragments = _table_fragments(html, _INFOBOX_START, first_only=True)
+    if not fragments:
+        return None
+    soup = BeautifulSoup(fragments[0], 'html.parser')
+    return soup.find('table', {'class': 'infocaseta'})
+
+
+def _rows_html_parser(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup.select("table.wikitable tbody tr")
+
+
+def _rows_strainer(html):
+    soup = BeautifulSoup(html, 'html.parser',
+                         parse_only=SoupStrainer('table'))
+    return soup.select("table.wikitable tbody tr")
+
+
+def _rows_lxml(html):
+    soup = BeautifulSoup(html, 'lxml', parse_only=SoupStrainer('table'))
+    return soup.select("table.wikitable tbody tr")
+
+
+def _rows_fragment(html):
+    fragments = _table_fragments(html, _WIKITABLE_START)
+    soup = BeautifulSoup(''.join(fragments), 'html.parser')
+    return soup.select("table.wikitable tbody tr")
+
+
+# Each backend is a pair of functions: the first one returns the
+# information box table of a country page (or None), the second one the
+# rows of the tables marked as "wikitable" of the list page.
+#   html.parser - full BeautifulSoup tree of the whole page (the original)
+#   strainer    - BeautifulSoup tree restricted to the tables of the page
+#   lxml        - the same restricted tree built by the lxml parser
+#   fragment    - the searched tables are cut out of the page text first
+#                 and only they are parsed
+BACKENDS = {
+    'html.parser': (_infobox_html_parser, _rows_html_parser),
+    'strainer': (_infobox_strainer, _rows_strainer),
+    'fragment': (_infobox_fragment, _rows_fragment),
+}
+if builder_registry.lookup('lxml'):
+    BACKENDS['lxml'] = (_infobox_lxml, _rows_lxml)
+
+# Backend used by the scraper unless another one is requested
+DEFAULT_BACKEND = 'fragment'
+
+
+def find_infobox(html, backend=DEFAULT_BACKEND):
+    """
+    Find the information box ("infocaseta") of a country's wikipedia page
+    :param html: The HTML text of the country's page
+    :param backend: The name of the parsing backend to use
+    :return: The BeautifulSoup table element or None if there is none
+    """
+
+    return BACKENDS[backend][0](html)
+
+
+def find_table_rows(html, backend=DEFAULT_BACKEND):
+    """
+    Find the rows of the tables marked as "wikitable" of a wikipedia page
+    :param html: The HTML text of the page
+    :param backend: The name of the parsing backend to use
+    :return: The list of BeautifulSoup row elements
+    """
+
+    return BACKENDS[backend][1](html)
@@ -0,0 +1,166 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Directory where the downloaded wikipedia pages are kept
+CACHE_DIRECTORY = 'html_cache'
+# Once the compressed pages take more than this many bytes the least
+# recently used ones are removed from the cache
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Pages are compressed with zstd when the zstandard package is installed,
+# otherwise with gzip. The file extension records the codec, so a cache
+# written with one of them stays readable with the other one
+EXTENSION = '.zst' if zstandard else '.gz'
+
+# One index connection per cache directory, shared by all threads
+_connections = {}
+_lock = threading.Lock()
+
+
+def _index(directory):
+    """
+    Get the connection to the index of the cache found in the given
+    directory, creating the directory and the index if needed. The index
+    maps each url to the digest of its content and keeps the size and the
+    last access time of each stored object.
+    :param directory: The directory of the cache
+    :return: The connection to the index database
+    """
+
+    if directory not in _connections:
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        conn = sqlite3.connect(os.path.join(directory, 'index.db'),
+                               check_same_thread=False)
+        conn.execute('''CREATE TABLE IF NOT EXISTS pages (
+            url TEXT PRIMARY KEY,
+            digest TEXT
+        )''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS objects (
+            digest TEXT PRIMARY KEY,
+            file TEXT,
+            size INTEGER,
+            last_access REAL
+        )''')
+        conn.commit()
+        _connections[directory] = conn
+    return _connections[directory]
+
+
+def store_page(url, html, directory=CACHE_DIRECTORY):
+    """
+    Save the HTML of a page in the cache. The content is stored once under
+    its sha256 digest, so identical pages share the same file.
+    :param url: The URL the page was downloaded from
+    :param html: The HTML text of the page
+    :param directory: The directory of the cache
+    :return: The digest of the stored content
+    """
+
+    data = html.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    with _lock:
+        conn = _index(directory)
+        if not conn.execute('SELECT 1 FROM objects WHERE digest = ?',
+                            (digest,)).fetchone():
+            file = os.path.join('objects', digest[:2], digest + EXTENSION)
+            path = os.path.join(directory, file)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if zstandard:
+                compressed = zstandard.ZstdCompressor().compress(data)
+            else:
+                compressed = gzip.compress(data)
+            with open(path, 'wb') as output:
+                output.write(compressed)
+            conn.execute('INSERT INTO objects VALUES (?, ?, ?, ?)',
+                         (digest, file, len(compressed), time.time()))
+        conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?)',
+                     (url, digest))
+        conn.commit()
+    return digest
+
+
+def load_page(url, directory=CACHE_DIRECTORY):
+    """
+    Read the HTML of a page from the cache
+    :param url: The URL the page was downloaded from
+    :param directory: The directory of the cache
+    :return: The HTML text of the page or None if it is not cached
+    """
+
+    with _lock:
+        conn = _index(directory)
+        row = conn.execute(
+            '''SELECT objects.digest, objects.file FROM pages
+            JOIN objects ON objects.digest = pages.digest
+            WHERE pages.url = ?''', (url,)).fetchone()
+        if not row:
+            return None
+        conn.execute('UPDATE objects SET last_access = ? WHERE digest = ?',
+                     (time.time(), row[0]))
+        conn.commit()
+
+    with open(os.path.join(directory, row[1]), 'rb') as file:
+        compressed = file.read()
+    if row[1].endswith('.zst'):
+        if not zstandard:
+            raise RuntimeError(
+                "The zstandard package is required to read " + row[1])
+        data = zstandard.ZstdDecompressor().decompress(compressed)
+    else:
+        data = gzip.decompress(compressed)
+    return data.decode('utf-8')
+
+
+def evict_pages(max_bytes=CACHE_MAX_BYTES, directory=CACHE_DIRECTORY):
+    """
+    Remove the least recently used pages from the cache until the size of
+    the stored files is at most max_bytes
+    :param max_bytes: The maximum size of the cache in bytes
+    :param directory: The directory of the cache
+    :return: The number of removed files
+    """
+
+    removed = 0
+    with _lock:
+        conn = _index(directory)
+        total = conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+        if total <= max_bytes:
+            return 0
+        for digest, file, size in conn.execute(
+                '''SELECT digest, file, size FROM objects
+                ORDER BY last_access''').fetchall():
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(os.path.join(directory, file))
+            except FileNotFoundError:
+                pass
+            conn.execute('DELETE FROM objects WHERE digest = ?', (digest,))
+            conn.execute('DELETE FROM pages WHERE digest = ?', (digest,))
+            total -= size
+            removed += 1
+        conn.commit()
+    return removed
+
+
+def cached_urls(directory=CACHE_DIRECTORY):
+    """
+    Get the urls of all the pages found in the cache
+    :param directory: The directory of the cache
+    :return: The list of urls
+    """
+
+    with _lock:
+        conn = _index(directory)
+        return [row[0] for row in conn.execute(
+            'SELECT url FROM pages ORDER BY url')]
@@ -0,0 +1,147 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from snapshot import CHECK_INTERVAL, database_signature
+
+# Maximum number of response bodies kept by default
+CACHE_SIZE = 1024
+
+# Version of the dataset last read, with the signature of the database
+# files it was read from and the time of the last check
+_version = None
+_signature = None
+_checked_at = 0.0
+_version_lock = threading.Lock()
+
+# Cached responses, from the least to the most recently used, and the
+# number of requests answered from them or not
+_responses = OrderedDict()
+_responses_lock = threading.Lock()
+stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+
+
+def read_version(database):
+    """
+    :param database: Path of the database file
+    :return: The version stamp the scraper bumps on each write, 0 if the
+    database has none yet
+    """
+
+    conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    try:
+        row = conn.execute('SELECT version FROM dataset_version').fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return row[0] if row else 0
+
+
+def dataset_version(database, check_interval=CHECK_INTERVAL):
+    """
+    Get the current version of the dataset. The database files are checked
+    at most once every check_interval seconds and the version is only read
+    again if they changed. When the version changes every cached response
+    is dropped.
+    :param database: Path of the database file
+    :param check_interval: Minimum number of seconds between two checks
+    :return: The version stamp
+    """
+
+    global _version, _signature, _checked_at
+    now = time.monotonic()
+    if _version is not None and now - _checked_at < check_interval:
+        return _version
+    with _version_lock:
+        if _version is None or now - _checked_at >= check_interval:
+            signature = database_signature(database)
+            if _version is None or signature != _signature:
+                version = read_version(database)
+                if version != _version:
+                    clear()
+                _version, _signature = version, signature
+            _checked_at = now
+    return _version
+
+
+def cache_key(path, args, encoding=None):
+    """
+    Build the key of a response: its path and its query arguments sorted,
+    so the order they are given in does not matter, and the content coding
+    its body is compressed with
+    :param path: The path of the request
+    :param args: The MultiDict of the query arguments
+    :param encoding: The content coding of the body, None if it is not
+    compressed
+    :return: The key
+    """
+
+    return path, tuple(sorted(args.items(multi=True))), encoding
+
+
+def get_response(key, version):
+    """
+    :param key: The key of the response, see cache_key
+    :param version: The current version of the dataset
+    :return: The cached (body, mimetype, encoding) of the response or
+    None, counting a hit or a miss
+    """
+
+    with _responses_lock:
+        entry = _responses.get(key)
+        if entry is None or entry[0] != version:
+            stats['misses'] += 1
+            return None
+        _responses.move_to_end(key)
+        stats['hits'] += 1
+        return entry[1:]
+
+
+def store_response(key, version, body, mimetype, encoding=None,
+                   max_size=CACHE_SIZE):
+    """
+    Keep the serialized body of a response, removing the least recently
+    used responses beyond max_size
+    :param key: The key of the response, see cache_key
+    :param version: The version of the dataset the body was built from
+    :param body: The serialized body
+    :param mimetype: The mimetype of the body
+    :param encoding: The content coding of the body, None if it is not
+    compressed
+    :param max_size: The maximum number of responses kept
+    """
+
+    with _responses_lock:
+        _responses[key] = (version, body, mimetype, encoding)
+        _responses.move_to_end(key)
+        while len(_responses) > max_size:
+            _responses.popitem(last=False)
+
+
+def count_not_modified():
+    """
+    Count a request answered with 304 Not Modified
+    """
+
+    with _responses_lock:
+        stats['not_modified'] += 1
+
+
+def clear():
+    """
+    Drop every cached response
+    """
+
+    with _responses_lock:
+        _responses.clear()
+
+
+def cache_stats():
+    """
+    :return: A dict with the counters and the number of cached responses
+    """
+
+    with _responses_lock:
+        return dict(stats, entries=len(_responses))
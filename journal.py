@@ -0,0 +1,176 @@
+import sqlite3
+import time
+
+# Database keeping the journal of the scraper runs, apart from the
+# countries database so that recording the progress of a run never
+# touches the files the API serves
+JOURNAL_DATABASE = 'scrape_journal.db'
+
+# Statuses of the runs that did not get through all of their pages and
+# are resumed by the next run: still running when the scraper died,
+# stopped by an exception, or ended with failed pages
+RESUMABLE_STATUSES = ('running', 'interrupted', 'incomplete')
+# A run is only resumed this many times, and until it is this many
+# seconds old, after which it is abandoned (its failed pages are kept as
+# failed in the journal) and the next run starts over from the list, so
+# that pages failing for good cannot keep every later run resuming it
+MAX_RESUMES = 3
+MAX_RUN_AGE = 24 * 60 * 60
+
+
+def _now():
+    """
+    :return: The current UTC time as an ISO 8601 string
+    """
+
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+def open_journal(path=JOURNAL_DATABASE):
+    """
+    Open the journal of the scraper runs, creating its tables if needed.
+    Each run records the status of the country pages it scrapes, only the
+    pending and failed ones being scraped again by a resumed run.
+    :param path: Path of the journal database file
+    :return: The connection to the journal
+    """
+
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL').fetchall()
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('''CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY,
+        database TEXT NOT NULL,
+        source TEXT NOT NULL,
+        status TEXT NOT NULL,
+        started_at TEXT NOT NULL,
+        finished_at TEXT,
+        resumes INTEGER NOT NULL DEFAULT 0
+    )''')
+    # Add the columns introduced after the first version of the table
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(runs)')]
+    if 'resumes' not in columns:
+        conn.execute('ALTER TABLE runs ADD COLUMN resumes INTEGER NOT NULL '
+                     'DEFAULT 0')
+    conn.execute('''CREATE TABLE IF NOT EXISTS pages (
+        run_id INTEGER NOT NULL REFERENCES runs (id),
+        url TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        population INTEGER,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        updated_at TEXT,
+        PRIMARY KEY (run_id, url)
+    ) WITHOUT ROWID''')
+    conn.commit()
+    return conn
+
+
+def start_run(conn, database, source, countries):
+    """
+    Record a new run and the pages it has to scrape
+    :param conn: The connection to the journal
+    :param database: Path of the countries database the run writes to
+    :param source: The url of the page listing the countries
+    :param countries: The list of (name, population, country_url) tuples
+    :return: The id of the run
+    """
+
+    with conn:
+        run_id = conn.execute(
+            'INSERT INTO runs (database, source, status, started_at) '
+            'VALUES (?, ?, ?, ?)',
+            (database, source, 'running', _now())).lastrowid
+        conn.executemany(
+            'INSERT OR IGNORE INTO pages '
+            '(run_id, url, position, name, population) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [(run_id, url, position, name, population)
+             for position, (name, population, url) in enumerate(countries)])
+    return run_id
+
+
+def resumable_run(conn, database, source, max_resumes=MAX_RESUMES,
+                  max_age=MAX_RUN_AGE):
+    """
+    Find the last run writing to the same database from the same list that
+    did not get through all of its pages, and mark it as running again. A
+    run already resumed max_resumes times or started more than max_age
+    seconds ago is marked as abandoned instead, its pages keeping their
+    status (the pages that kept failing stay failed), so that a new run
+    is started.
+    :param conn: The connection to the journal
+    :param database: Path of the countries database
+    :param source: The url of the page listing the countries
+    :param max_resumes: Largest number of times a run is resumed
+    :param max_age: Largest age in seconds of a resumed run
+    :return: The id of the run and the list of the (name, population,
+    country_url, settled) tuples of its pages in the list order, settled
+    being False for the pages to scrape again, or None if there is no run
+    to resume
+    """
+
+    row = conn.execute(
+        'SELECT id, status, resumes, started_at FROM runs '
+        'WHERE database = ? AND source = ? ORDER BY id DESC LIMIT 1',
+        (database, source)).fetchone()
+    if row is None or row[1] not in RESUMABLE_STATUSES:
+        return None
+    oldest = time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                           time.gmtime(time.time() - max_age))
+    if row[2] >= max_resumes or row[3] < oldest:
+        finish_run(conn, row[0], 'abandoned')
+        return None
+    with conn:
+        conn.execute("UPDATE runs SET status = 'running', finished_at = NULL, "
+                     "resumes = resumes + 1 WHERE id = ?", (row[0],))
+    pages = conn.execute(
+        "SELECT name, population, url, status IN ('done', 'error') "
+        "FROM pages WHERE run_id = ? ORDER BY position", (row[0],)).fetchall()
+    return row[0], [page[:3] + (bool(page[3]),) for page in pages]
+
+
+def record_pages(conn, run_id, results):
+    """
+    Checkpoint the pages handled since the last checkpoint, in a single
+    transaction
+    :param conn: The connection to the journal
+    :param run_id: The id of the run
+    :param results: The list of (url, status, attempts, error) tuples,
+    attempts being the number of requests sent for the page in this run
+    """
+
+    now = _now()
+    with conn:
+        conn.executemany(
+            'UPDATE pages SET status = ?, attempts = attempts + ?, '
+            'error = ?, updated_at = ? WHERE run_id = ? AND url = ?',
+            [(status, attempts, error, now, run_id, url)
+             for url, status, attempts, error in results])
+
+
+def finish_run(conn, run_id, status):
+    """
+    :param conn: The connection to the journal
+    :param run_id: The id of the run
+    :param status: 'finished', 'abandoned' once it is not resumed anymore,
+    or one of RESUMABLE_STATUSES if the next run should resume it
+    """
+
+    with conn:
+        conn.execute('UPDATE runs SET status = ?, finished_at = ? '
+                     'WHERE id = ?', (status, _now(), run_id))
+
+
+def run_pages(conn, run_id):
+    """
+    :param conn: The connection to the journal
+    :param run_id: The id of the run
+    :return: A dict with the number of pages of the run in each status
+    """
+
+    return dict(conn.execute(
+        'SELECT status, COUNT(*) FROM pages WHERE run_id = ? '
+        'GROUP BY status', (run_id,)).fetchall())
@@ -0,0 +1,157 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the buckets of the latency histograms
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+           0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Metrics are only collected once enabled, every call below being a no-op
+# otherwise, so that the instrumented code costs nothing by default
+enabled = False
+
+# Type and help text of each metric name, and the values of each metric
+# and label set: a number for the counters, the cumulative bucket counts
+# followed by the sum and the count for the histograms
+_descriptions = {}
+_counters = {}
+_histograms = {}
+_lock = threading.Lock()
+
+
+def enable():
+    """
+    Start collecting the metrics
+    """
+
+    global enabled
+    enabled = True
+
+
+def describe(name, kind, text):
+    """
+    Register the type and the help text of a metric, shown by render
+    :param name: The name of the metric
+    :param kind: 'counter' or 'histogram'
+    :param text: The help text
+    """
+
+    _descriptions[name] = (kind, text)
+
+
+def inc(name, value=1, **labels):
+    """
+    Increment a counter
+    :param name: The name of the counter
+    :param value: The amount added
+    :param labels: The labels of the counter
+    """
+
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """
+    Record a duration in a histogram
+    :param name: The name of the histogram
+    :param seconds: The duration
+    :param labels: The labels of the histogram
+    """
+
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        values = _histograms.get(key)
+        if values is None:
+            values = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                values[index] += 1
+        values[-2] += seconds
+        values[-1] += 1
+
+
+@contextmanager
+def timer(name, **labels):
+    """
+    Record the duration of the block of a with statement in a histogram
+    :param name: The name of the histogram
+    :param labels: The labels of the histogram
+    """
+
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def _format_labels(labels, extra=()):
+    """
+    :param labels: The sorted (name, value) pairs of the labels
+    :param extra: Other pairs appended to them
+    :return: The labels in the Prometheus text format, empty if there are
+    none
+    """
+
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs) + '}'
+
+
+def render():
+    """
+    :return: Every metric collected, in the Prometheus text exposition
+    format
+    """
+
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, list(values))
+                            for key, values in _histograms.items())
+    lines = []
+    described = set()
+
+    def header(name, kind):
+        if name not in described:
+            described.add(name)
+            text = _descriptions.get(name, (kind, name))[1]
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+        header(name, 'counter')
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    for (name, labels), values in histograms:
+        header(name, 'histogram')
+        for bound, count in zip(BUCKETS, values):
+            lines.append(f"{name}_bucket"
+                         f"{_format_labels(labels, [('le', bound)])} "
+                         f"{count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])}"
+                     f" {values[-1]}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]}")
+        lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """
+    Drop every value collected
+    """
+
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
@@ -0,0 +1,201 @@
+import bisect
+import sqlite3
+import threading
+import time
+from array import array
+
+from snapshot import CHECK_INTERVAL, database_signature
+from utils import name_key
+
+# Maximum number of edits (insertions, deletions, substitutions) between a
+# name the client sent and the name it is matched with, a key of
+# FUZZY_KEY_LENGTH characters or more being allowed one edit per that many
+# characters
+FUZZY_MAX_DISTANCE = 2
+FUZZY_KEY_LENGTH = 4
+
+# Index currently served and time of the last check of the database
+_index = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def trigrams(key):
+    """
+    :param key: A name key
+    :return: The set of the three character substrings of the key, padded
+    so that its first and last characters are part of as many of them as
+    the others
+    """
+
+    padded = f"  {key} "
+    return {padded[start:start + 3] for start in range(len(padded) - 2)}
+
+
+def load_index(database):
+    """
+    Build the index of the names and aliases of the countries, by key: the
+    keys sorted, so that the keys starting with a prefix are a range found
+    by binary search, and an inverted index of their trigrams, so that only
+    the keys sharing enough trigrams with a misspelled name are compared
+    with it
+    :param database: Path of the database file
+    :return: The index, a dict of read-only structures
+    """
+
+    signature = database_signature(database)
+    conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    # A single read transaction, so that the index and its version are
+    # read from the same state of the database
+    conn.execute('BEGIN')
+    version = conn.execute('SELECT version FROM dataset_version').fetchone()
+    entries = conn.execute(
+        'SELECT name_key, name, NULL FROM countries '
+        'WHERE name_key IS NOT NULL '
+        'UNION ALL '
+        'SELECT alias_key, name, alias FROM country_aliases '
+        'JOIN countries ON countries.id = country_aliases.country_id '
+        'ORDER BY 1').fetchall()
+    conn.close()
+
+    # Positions of the entries having each trigram, in key order, as
+    # arrays of integers rather than lists, which take about 9 times the
+    # memory on large tables
+    postings = {}
+    for position, (key, _, _) in enumerate(entries):
+        for trigram in trigrams(key):
+            postings.setdefault(trigram, array('I')).append(position)
+
+    return {
+        'signature': signature,
+        'version': version[0] if version else 0,
+        'keys': tuple(entry[0] for entry in entries),
+        'names': tuple(entry[1] for entry in entries),
+        'aliases': tuple(entry[2] for entry in entries),
+        'trigrams': postings,
+    }
+
+
+def get_index(database, check_interval=CHECK_INTERVAL):
+    """
+    Get the current name index of the database, loading it the first time
+    it is needed and rebuilding it when the database files changed,
+    checked at most once every check_interval seconds, like
+    snapshot.get_snapshot
+    :param database: Path of the database file
+    :param check_interval: Minimum number of seconds between two checks
+    :return: The index
+    """
+
+    global _index, _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < check_interval:
+        return _index
+    with _lock:
+        if _index is None or now - _checked_at >= check_interval:
+            if (_index is None
+                    or _index['signature'] != database_signature(database)):
+                _index = load_index(database)
+            _checked_at = now
+    return _index
+
+
+def edit_distance(first, second, limit):
+    """
+    Levenshtein distance between two texts, stopping as soon as it is
+    known to exceed the limit
+    :param first: The first text
+    :param second: The second text
+    :param limit: The largest distance of interest
+    :return: The distance, or limit + 1 if it is larger than the limit
+    """
+
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for row, first_character in enumerate(first, start=1):
+        current = [row]
+        for column, second_character in enumerate(second, start=1):
+            current.append(min(
+                previous[column] + 1,
+                current[column - 1] + 1,
+                previous[column - 1] + (first_character != second_character)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+def complete(index, text, limit):
+    """
+    Find the countries having a name or an alias starting with a text,
+    without regard to diacritics and case
+    :param index: The name index
+    :param text: The beginning of the name
+    :param limit: Maximum number of countries returned
+    :return: The list of (name, alias) pairs of the matching countries in
+    the order of their matching key, alias being the alias that matched or
+    None if the name did, each country appearing once
+    """
+
+    prefix = name_key(text)
+    keys = index['keys']
+    results = []
+    seen = set()
+    position = bisect.bisect_left(keys, prefix)
+    while (position < len(keys) and keys[position].startswith(prefix)
+           and len(results) < limit):
+        name = index['names'][position]
+        if name not in seen:
+            seen.add(name)
+            results.append((name, index['aliases'][position]))
+        position += 1
+    return results
+
+
+def closest(index, text, limit):
+    """
+    Find the countries whose name or alias is within the allowed number of
+    edits of a text, without regard to diacritics and case. A key within d
+    edits of the text shares at least all but 3 * d of its trigrams, so
+    only the keys sharing that many are compared with it.
+    :param index: The name index
+    :param text: The misspelled name
+    :param limit: Maximum number of countries returned
+    :return: The list of (distance, name, alias) tuples of the closest
+    countries, from the closest, each country appearing once
+    """
+
+    key = name_key(text)
+    allowed = min(FUZZY_MAX_DISTANCE, len(key) // FUZZY_KEY_LENGTH)
+    query = trigrams(key)
+    shared = {}
+    for trigram in query:
+        for position in index['trigrams'].get(trigram, ()):
+            shared[position] = shared.get(position, 0) + 1
+
+    found = {}
+    for position, count in shared.items():
+        if count < len(query) - 3 * allowed:
+            continue
+        distance = edit_distance(key, index['keys'][position], allowed)
+        name = index['names'][position]
+        if distance <= allowed and (name not in found
+                                    or distance < found[name][0]):
+            found[name] = (distance, name, index['aliases'][position])
+    return sorted(found.values(), key=lambda match: match[:2])[:limit]
+
+
+def resolve(index, text):
+    """
+    Find the country a misspelled name most likely stands for
+    :param index: The name index
+    :param text: The misspelled name
+    :return: The name of the only country at the smallest distance from
+    the text, or None if there is none or several
+    """
+
+    matches = closest(index, text, 2)
+    if not matches or (len(matches) > 1 and matches[1][0] == matches[0][0]):
+        return None
+    return matches[0][1]
@@ -1,8 +1,179 @@
-from create_database import create_database
-from scraper import scrape_wikipedia
-
-# Create the database if it doesn't exist
-create_database()
-# Start scraping process as well as inserting entries as it goes on
-# Only add countries that are not already found in the database
-scrape_wikipedia()
+import argparse
+import json
+import time
+from functools import partial
+
+import metrics
+from create_database import DATABASE, create_database
+from html_backends import BACKENDS, DEFAULT_BACKEND
+from html_cache import CACHE_DIRECTORY, CACHE_MAX_BYTES
+from journal import JOURNAL_DATABASE
+from scraper import scrape_wikipedia, HOST_MIN_INTERVAL, MAX_RETRIES
+from snapshot import SNAPSHOT_FILE, write_snapshot
+from storage import BATCH_SIZE
+from wikidump import ingest_dump
+
+parser = argparse.ArgumentParser(
+    description="Scrape the countries from wikipedia into the database")
+parser.add_argument(
+    '--workers', type=int, default=1,
+    help="number of country pages downloaded concurrently (default: 1)")
+parser.add_argument(
+    '--parse-workers', type=int, default=0,
+    help="number of processes parsing the pages (default: 0, parse them "
+         "in the main process)")
+parser.add_argument(
+    '--batch-size', type=int, default=BATCH_SIZE,
+    help=f"countries written per transaction (default: {BATCH_SIZE})")
+parser.add_argument(
+    '--min-interval', type=float, default=HOST_MIN_INTERVAL,
+    help="minimum seconds between two requests to the same host")
+parser.add_argument(
+    '--from-cache', action='store_true',
+    help="parse the pages saved in the HTML cache again, without any "
+         "network request")
+parser.add_argument(
+    '--cache-dir', default=CACHE_DIRECTORY,
+    help=f"directory of the HTML cache (default: {CACHE_DIRECTORY})")
+parser.add_argument(
+    '--cache-max-mb', type=int, default=CACHE_MAX_BYTES // (1024 * 1024),
+    help="size in MB the HTML cache is reduced to after scraping")
+parser.add_argument(
+    '--no-cache', action='store_true',
+    help="do not keep the downloaded pages in the HTML cache")
+parser.add_argument(
+    '--parser', choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+    help=f"HTML parsing backend (default: {DEFAULT_BACKEND})")
+parser.add_argument(
+    '--retries', type=int, default=MAX_RETRIES,
+    help=f"times a failed request is retried (default: {MAX_RETRIES})")
+parser.add_argument(
+    '--journal', default=JOURNAL_DATABASE,
+    help=f"database of the run journal (default: {JOURNAL_DATABASE})")
+parser.add_argument(
+    '--no-journal', action='store_true',
+    help="do not record the progress of the run")
+parser.add_argument(
+    '--restart', action='store_true',
+    help="start a new run instead of resuming the last unfinished one")
+parser.add_argument(
+    '--dump', metavar='PATH',
+    help="fill the database from a local pages-articles dump (.xml.bz2) "
+         "instead of scraping the site")
+parser.add_argument(
+    '--dump-all', action='store_true',
+    help="with --dump, also add the articles with a country information "
+         "box not matching a country of the database")
+parser.add_argument(
+    '--snapshot-file', default=SNAPSHOT_FILE, metavar='PATH',
+    help="binary snapshot of the countries written after the run, mapped "
+         f"by the API workers (default: {SNAPSHOT_FILE})")
+parser.add_argument(
+    '--no-snapshot', action='store_true',
+    help="do not write the binary snapshot")
+parser.add_argument(
+    '--summary', metavar='FILE',
+    help="write the summary of the run (counts and stage timings) as JSON")
+parser.add_argument(
+    '--metrics-file', metavar='FILE',
+    help="collect the metrics of the run and write them in the Prometheus "
+         "text format, for example for the textfile collector of the node "
+         "exporter")
+parser.add_argument(
+    '--profile', metavar='FILE',
+    help="profile the run and write the profile: cProfile statistics "
+         "(readable with pstats or snakeviz) or, with --profiler "
+         "pyinstrument, an HTML report")
+parser.add_argument(
+    '--profiler', choices=('cprofile', 'pyinstrument'), default='cprofile',
+    help="profiler used by --profile (default: cprofile)")
+
+
+def run_profiled(function, path, profiler='cprofile'):
+    """
+    Run a function under a profiler and save the profile. Only the main
+    process is profiled, not the processes of --parse-workers.
+    :param function: The function to run, without arguments
+    :param path: The file the profile is written to
+    :param profiler: 'cprofile' or 'pyinstrument' (when installed)
+    :return: The result of the function
+    """
+
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+
+        profile = Profiler()
+        profile.start()
+        try:
+            return function()
+        finally:
+            profile.stop()
+            with open(path, 'w', encoding='utf-8') as output:
+                output.write(profile.output_html())
+            print(profile.output_text(unicode=True))
+
+    import cProfile
+    import pstats
+
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(function)
+    finally:
+        profile.dump_stats(path)
+        pstats.Stats(profile).sort_stats('cumulative').print_stats(25)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.from_cache and args.no_cache:
+        parser.error("--from-cache cannot be used with --no-cache")
+    if args.dump_all and not args.dump:
+        parser.error("--dump-all can only be used with --dump")
+    if args.metrics_file:
+        metrics.enable()
+
+    # Create the database if it doesn't exist
+    create_database()
+    # Start scraping process as well as inserting entries as it goes on
+    # Countries already found in the database are only downloaded and
+    # updated again if their page changed since the last run, and a run
+    # that did not finish is resumed where it stopped. With a dump the
+    # countries are read from its articles instead, with no request.
+    if args.dump:
+        scrape = partial(ingest_dump, args.dump,
+                         batch_size=args.batch_size,
+                         known_only=not args.dump_all)
+    else:
+        scrape = partial(scrape_wikipedia,
+                         workers=args.workers,
+                         min_interval=args.min_interval,
+                         cache_directory=(None if args.no_cache
+                                          else args.cache_dir),
+                         cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+                         from_cache=args.from_cache,
+                         backend=args.parser,
+                         parse_workers=args.parse_workers,
+                         batch_size=args.batch_size,
+                         journal=None if args.no_journal else args.journal,
+                         resume=not args.restart,
+                         retries=args.retries)
+    if args.profile:
+        summary = run_profiled(scrape, args.profile, args.profiler)
+    else:
+        summary = scrape()
+
+    # Write the snapshot the API workers map, replacing the previous one
+    # in a single rename, so they pick it up at their next check
+    if not args.no_snapshot and summary is not None:
+        start = time.perf_counter()
+        size = write_snapshot(DATABASE, args.snapshot_file)
+        print(f"Wrote the snapshot {args.snapshot_file} "
+              f"({size / 1024:.0f} KB) in "
+              f"{(time.perf_counter() - start) * 1000:.1f} ms.")
+
+    if args.summary and summary is not None:
+        with open(args.summary, 'w', encoding='utf-8') as output:
+            json.dump(summary, output, indent=2)
+    if args.metrics_file:
+        with open(args.metrics_file, 'w', encoding='utf-8') as output:
+            output.write(metrics.render())
@@ -1,6 +1,26 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlparse
+
 import requests
-from bs4 import BeautifulSoup
-import sqlite3
+from requests.adapters import HTTPAdapter
+
+import metrics
+from create_database import DATABASE
+from html_backends import DEFAULT_BACKEND, find_infobox, find_table_rows
+from html_cache import (CACHE_DIRECTORY,
+                        CACHE_MAX_BYTES,
+                        store_page,
+                        load_page,
+                        evict_pages)
+from journal import (JOURNAL_DATABASE, finish_run, open_journal,
+                     record_pages, resumable_run, run_pages, start_run)
+from storage import (BATCH_SIZE, connect, load_known_countries,
+                     replace_aliases, replace_neighbors, upsert_countries)
 from utils import (parse_wikipedia_number_string_to_int,
                    parse_population_string_to_int,
                    parse_density_string_to_int,
@@ -8,39 +28,247 @@ from utils import (parse_wikipedia_number_string_to_int,
                    parse_languages_text,
                    parse_neighbors_text,
                    parse_timezone,
-                   general_parse)
+                   general_parse,
+                   fill_density)
 
 # Establish connection with the database to save the scraped data
 # in the countries table
-conn = sqlite3.connect('states_of_the_world.db')
-cursor = conn.cursor()
+conn = connect(DATABASE)
+
+# Prepare the base url used when concatenating it with the
+# href link of each country using romanian version of wikipedia
+BASE_URL = "https://ro.wikipedia.org"
+# Link to the table containing the top of countries sorted by
+# population from where the name of the country, the population
+# as well as the link to each country's page can be extracted
+# to get more details for each entry
+COUNTRIES_TABLE_URL = (
+    "https://ro.wikipedia.org/wiki/Lista_țărilor_după_populație")
+# Minimum number of seconds between two requests sent to the same host,
+# so that concurrent workers stay polite towards wikipedia
+HOST_MIN_INTERVAL = 0.1
+# Seconds a request may wait for the server before it fails
+REQUEST_TIMEOUT = 30
+# Statuses of the answers meaning that the server is overloaded or rate
+# limiting, retried like the network errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# A failed request is retried MAX_RETRIES times, waiting about
+# BACKOFF_BASE * 2 ** n seconds (with random jitter, or the Retry-After
+# header of the answer) before the n-th retry, never more than BACKOFF_MAX
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+# After BREAKER_THRESHOLD failed requests in a row to a host, its circuit
+# opens: the requests to it fail at once, without being sent, for
+# BREAKER_COOLDOWN seconds, after which one failure opens it again
+BREAKER_THRESHOLD = 10
+BREAKER_COOLDOWN = 60
+# Stages of a run timed in its summary: downloading the pages (summed
+# over the fetch threads), parsing them, of which finding the information
+# box and normalizing its values with the parsers of utils.py, writing
+# the countries, checkpointing the journal and linking the neighbors
+STAGES = ('fetch', 'parse', 'infobox', 'normalize', 'write', 'journal',
+          'neighbors')
+
+metrics.describe('scraper_stage_seconds', 'histogram',
+                 "Seconds spent in a stage of the scraper for one page or "
+                 "one batch")
+metrics.describe('scraper_run_seconds', 'histogram',
+                 "Wall clock seconds of the scraper runs")
+metrics.describe('scraper_requests_total', 'counter',
+                 "Requests sent for the country pages, retries included")
+metrics.describe('scraper_pages_total', 'counter',
+                 "Country pages handled, by outcome")
+metrics.describe('scraper_countries_total', 'counter',
+                 "Countries written or found unchanged")
+
+# Time (monotonic clock) of the last request slot reserved for each host
+_host_last_request = {}
+_host_lock = threading.Lock()
+# Number of failed requests in a row to each host and time (monotonic
+# clock) until which the circuit of a host is open
+_host_failures = {}
+_host_open_until = {}
+_breaker_lock = threading.Lock()
+
+# Session shared by every download so that connections to wikipedia are
+# kept alive and reused, with enough pooled connections for all workers
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_maxsize=32))
+session.mount('http://', HTTPAdapter(pool_maxsize=32))
 
 
-def scrape_wikipedia():
+def wait_for_host_slot(url, min_interval=HOST_MIN_INTERVAL):
+    """
+    Block the calling thread until a request to the host of the given url
+    is allowed. Each caller reserves the next free slot for the host under
+    a lock and then sleeps outside of it, so any number of worker threads
+    never send more than one request per min_interval to the same host.
+    :param url: The URL that is about to be requested
+    :param min_interval: Minimum number of seconds between two requests
+    to the same host
+    """
+
+    host = urlparse(url).netloc
+    with _host_lock:
+        now = time.monotonic()
+        slot = max(now, _host_last_request.get(host, 0.0) + min_interval)
+        _host_last_request[host] = slot
+    if slot > now:
+        time.sleep(slot - now)
+
+
+class FetchError(Exception):
+    """
+    A page could not be downloaded
+    """
+
+    def __init__(self, message, attempts, retryable=True):
+        """
+        :param message: The reason of the last failed attempt
+        :param attempts: The number of requests sent for the page
+        :param retryable: Whether a later attempt may succeed, False when
+        the server answered with an error of the request itself (404)
+        """
+
+        super().__init__(message)
+        self.attempts = attempts
+        self.retryable = retryable
+
+
+def check_circuit(url):
+    """
+    :param url: The URL that is about to be requested
+    :raise FetchError: If the circuit of the host of the url is open
+    """
+
+    host = urlparse(url).netloc
+    with _breaker_lock:
+        open_until = _host_open_until.get(host, 0.0)
+    if time.monotonic() < open_until:
+        raise FetchError(f"The circuit of {host} is open after "
+                         f"{BREAKER_THRESHOLD} failed requests", 0)
+
+
+def record_request(url, failed):
+    """
+    Count a request to the host of the url in its circuit breaker: a
+    success closes the circuit, and the failures in a row beyond
+    BREAKER_THRESHOLD open it for BREAKER_COOLDOWN seconds
+    :param url: The URL that was requested
+    :param failed: Whether the request failed with a network error or one
+    of RETRY_STATUSES
+    """
+
+    host = urlparse(url).netloc
+    with _breaker_lock:
+        if not failed:
+            _host_failures[host] = 0
+            return
+        _host_failures[host] = _host_failures.get(host, 0) + 1
+        if _host_failures[host] >= BREAKER_THRESHOLD:
+            _host_open_until[host] = time.monotonic() + BREAKER_COOLDOWN
+
+
+def retry_delay(attempt, response=None):
+    """
+    :param attempt: The number of the failed attempt, from 1
+    :param response: The answer of the failed attempt, if any
+    :return: The seconds to wait before the next attempt: the Retry-After
+    header of the answer when it gives a number of seconds, otherwise an
+    exponential backoff with jitter, at most BACKOFF_MAX
+    """
+
+    # A failed response is falsy (its ok property is False), so it is
+    # compared with None
+    retry_after = (response.headers.get('Retry-After')
+                   if response is not None else None)
+    if retry_after and retry_after.isdigit():
+        delay = int(retry_after)
+    else:
+        delay = BACKOFF_BASE * 2 ** (attempt - 1) * random.uniform(1, 1.5)
+    return min(delay, BACKOFF_MAX)
+
+
+def fetch_page(url, min_interval=HOST_MIN_INTERVAL,
+               etag=None, last_modified=None, retries=MAX_RETRIES):
+    """
+    Download a page through the shared session respecting the per-host
+    politeness delay. When the validators saved from a previous download
+    are given, the request is conditional and an unchanged page is not
+    downloaded again. Network errors and the answers of an overloaded
+    server (RETRY_STATUSES) are retried with an exponential backoff, and
+    stop being retried once the circuit of the host opens.
+    :param url: The URL of the page to download
+    :param min_interval: Minimum number of seconds between two requests
+    to the same host
+    :param etag: The ETag header received the last time the page was
+    downloaded, if any
+    :param last_modified: The Last-Modified header received the last time
+    the page was downloaded, if any
+    :param retries: Maximum number of times a failed request is retried
+    :return: The HTML text of the page (None if the server answered that
+    it did not change) together with its ETag and Last-Modified headers
+    and the number of requests sent
+    :raise FetchError: If the page could not be downloaded
+    """
+
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    attempt = 0
+    while True:
+        try:
+            check_circuit(url)
+        except FetchError as error:
+            raise FetchError(str(error), attempt) from None
+        attempt += 1
+        wait_for_host_slot(url, min_interval)
+        response = None
+        try:
+            response = session.get(url, headers=headers,
+                                   timeout=REQUEST_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            reason = f"{type(error).__name__}: {error}"
+        else:
+            reason = f"HTTP {response.status_code}"
+        failed = response is None or response.status_code in RETRY_STATUSES
+        record_request(url, failed)
+        if not failed:
+            break
+        if attempt > retries:
+            raise FetchError(reason, attempt)
+        time.sleep(retry_delay(attempt, response))
+
+    if response.status_code == 304:
+        return None, etag, last_modified, attempt
+    if response.status_code >= 400:
+        raise FetchError(f"HTTP {response.status_code}", attempt,
+                         retryable=False)
+    return (response.text,
+            response.headers.get('ETag'),
+            response.headers.get('Last-Modified'),
+            attempt)
+
+
+def extract_country_rows(html, base_url=BASE_URL, backend=DEFAULT_BACKEND):
+    """
+    Extract the name, population and page url of each country found in
+    the table of the page listing the countries by population.
+    :param html: The HTML text of the page containing the countries table
+    :param base_url: The url prepended to the href link of each country
+    :param backend: The name of the HTML parsing backend to use
+    :return: A list of (name, population, country_url) tuples in the order
+    they appear in the table
     """
-    Scrape the searched data for each country found in the table. It first
-    gets each row of the table and then parses the content to get the link
-    to each country's page which then scrapes again to get the desired data
-    such as name, population etc. The data is extracted from the romanian
-    wikipedia site.
-    """
-    # Prepare the base url used when concatenating it with the
-    # href link of each country using romanian version of wikipedia
-    base_url = "https://ro.wikipedia.org"
-    # Link to the table containing the top of countries sorted by
-    # population from where the name of the country, the population
-    # as well as the link to each country's page can be extracted
-    # to get more details for each entry
-    countries_table_url = (
-        "https://ro.wikipedia.org/wiki/Lista_țărilor_după_populație")
-    # Make the http request to the wikipedia page
-    response = requests.get(countries_table_url)
-    # Parse the received content using BeautifulSoup
-    soup = BeautifulSoup(response.text, 'html.parser')
 
     # Get each row of the table found on the page with all the countries
-    rows = soup.select("table.wikitable tbody tr")
+    rows = find_table_rows(html, backend)
 
+    countries = []
     # Go through each of the rows and extract the data accordingly
     for row in rows[1:]:
         # Get each cell of the current row containing data
@@ -73,24 +301,239 @@ def scrape_wikipedia():
             if name_link['href'] == "/wiki/Sf%C3%A2nta_Lucia":
                 name_link['href'] = "/wiki/Sf%C3%A2nta_Lucia_(stat)"
 
+            # As the data is saved in string format,
+            # extract as a string first and then
+            # convert to integer if possible, but
+            # the data is consistent here
+            population_as_string = cols[2].text.strip().replace(".", "")
+            population = parse_population_string_to_int(
+                population_as_string)
+
             # Build the url to the current row's country's page
-            country_url = base_url + name_link['href']
-
-            # Check if the country is already added in the
-            # database before proceeding with scraping
-            cursor.execute(
-                '''SELECT COUNT(*) FROM countries
-                WHERE name = ?''', (name,))
-            existing_entry = cursor.fetchone()[0]
-            if existing_entry == 0:
-
-                # As the data is saved in string format,
-                # extract as a string first and then
-                # convert to integer if possible, but
-                # the data is consistent here
-                population_as_string = cols[2].text.strip().replace(".", "")
-                population = parse_population_string_to_int(
-                    population_as_string)
+            countries.append((name, population, base_url + name_link['href']))
+
+    return countries
+
+
+def scrape_wikipedia(workers=1,
+                     min_interval=HOST_MIN_INTERVAL,
+                     base_url=BASE_URL,
+                     countries_table_url=COUNTRIES_TABLE_URL,
+                     connection=None,
+                     cache_directory=CACHE_DIRECTORY,
+                     cache_max_bytes=CACHE_MAX_BYTES,
+                     from_cache=False,
+                     backend=DEFAULT_BACKEND,
+                     parse_workers=0,
+                     batch_size=BATCH_SIZE,
+                     queue_size=None,
+                     journal=JOURNAL_DATABASE,
+                     resume=True,
+                     retries=MAX_RETRIES):
+    """
+    Scrape the searched data for each country found in the table. It first
+    gets each row of the table and then parses the content to get the link
+    to each country's page which then scrapes again to get the desired data
+    such as name, population etc. The data is extracted from the romanian
+    wikipedia site. The pages are fetched, parsed and written in batches
+    by three stages connected by bounded queues, the status of each page
+    being kept in the run journal so that an interrupted run is resumed.
+    :param workers: Maximum number of country pages downloaded at once
+    :param min_interval: Minimum number of seconds between two requests
+    to the same host
+    :param base_url: The url prepended to the href link of each country
+    :param countries_table_url: The url of the page listing the countries
+    :param connection: The database connection to write to, defaults to the
+    module connection to states_of_the_world.db
+    :param cache_directory: The directory of the HTML cache, None to not
+    keep the downloaded pages
+    :param cache_max_bytes: The size the cache is reduced to after scraping
+    :param from_cache: Parse the pages found in the cache instead of
+    downloading them
+    :param backend: The name of the HTML parsing backend to use
+    :param parse_workers: Number of processes parsing the pages, 0 to parse
+    them in the calling thread
+    :param batch_size: Number of countries written in one transaction
+    :param queue_size: Maximum number of pages held by each stage, defaults
+    to twice the largest number of workers
+    :param journal: Path of the journal recording the status of each page
+    of the run, None to keep no journal
+    :param resume: Resume the last run of the journal that did not get
+    through all of its pages instead of starting a new one
+    :param retries: Maximum number of times a failed request is retried
+    :return: The summary of the run, a dict with the number of country
+    pages fetched (read from the cache when scraping from it), answered as
+    not modified and parsed, of countries written and found unchanged, of
+    pages that failed, the seconds spent in each stage ('stages', summed
+    over the workers of the stage) and the wall clock seconds of the run,
+    None if the countries table could not be read
+    """
+    run_start = time.perf_counter()
+    db = connection or conn
+    database = db.execute('PRAGMA database_list').fetchone()[2]
+
+    # The last run writing to the same database that did not get through
+    # its pages is resumed: only its pages not done yet are scraped again,
+    # with the list of countries it recorded
+    journal_conn = open_journal(journal) if journal else None
+    run = None
+    if journal_conn and resume:
+        run = resumable_run(journal_conn, database, countries_table_url)
+    if run:
+        run_id, pages = run
+        countries = [page[:3] for page in pages if not page[3]]
+        print(f"Resuming run {run_id}: {len(countries)} of {len(pages)} "
+              f"country pages left.")
+    else:
+        if from_cache:
+            list_html = load_page(countries_table_url, cache_directory)
+            if list_html is None:
+                print("The page with the countries table is not cached.")
+                return None
+        else:
+            # Make the http request to the wikipedia page
+            try:
+                list_html = fetch_page(countries_table_url, min_interval,
+                                       retries=retries)[0]
+            except FetchError as error:
+                print(f"The page with the countries table could not be "
+                      f"downloaded: {error}")
+                if journal_conn:
+                    journal_conn.close()
+                return None
+            if cache_directory:
+                store_page(countries_table_url, list_html, cache_directory)
+        # Get the countries found in its table
+        countries = extract_country_rows(list_html, base_url, backend)
+        if journal_conn:
+            run_id = start_run(journal_conn, database, countries_table_url,
+                               countries)
+
+    # Check if each country is already added in the database, in which
+    # case its page is only downloaded again if it changed since then
+    known_countries = load_known_countries(db)
+    pending = [(name, population, country_url, known_countries.get(name))
+               for name, population, country_url in countries]
+
+    def download(entry):
+        country_url, existing = entry[2], entry[3]
+        if from_cache:
+            html = load_page(country_url, cache_directory)
+            if html is None or not existing:
+                return html, None, None, 0, None
+            # Keep the validators of the page the cache was filled from
+            return html, existing[1], existing[2], 0, None
+        try:
+            if existing:
+                page = fetch_page(country_url, min_interval,
+                                  existing[1], existing[2], retries)
+            else:
+                page = fetch_page(country_url, min_interval,
+                                  retries=retries)
+        except FetchError as error:
+            status = 'failed' if error.retryable else 'error'
+            return None, None, None, error.attempts, (status, str(error))
+        if cache_directory and page[0] is not None:
+            store_page(country_url, page[0], cache_directory)
+        return page + (None,)
+
+    # Rows waiting to be written, flushed to the database in batches, and
+    # the (url, status, attempts, error) of the pages handled since the
+    # last checkpoint of the journal
+    rows = []
+    handled = []
+    stats = {'fetched': 0, 'not_modified': 0, 'parsed': 0, 'written': 0,
+             'unchanged': 0, 'failed': 0,
+             'stages': dict.fromkeys(STAGES, 0.0), 'seconds': 0.0}
+    stats_lock = threading.Lock()
+
+    def record_stage(stage, seconds):
+        # Add the duration of one page or batch to the time of its stage
+        with stats_lock:
+            stats['stages'][stage] += seconds
+        metrics.observe('scraper_stage_seconds', seconds, stage=stage)
+
+    def fetch(entry):
+        # Download (or read from the cache) a page in the fetch threads,
+        # measuring it
+        start = time.perf_counter()
+        page = download(entry)
+        record_stage('fetch', time.perf_counter() - start)
+        metrics.inc('scraper_requests_total', page[3])
+        return page
+
+    def flush():
+        # Insert the found data in the created database table, updating
+        # the countries that are already stored if they changed, and only
+        # then record their pages as done in the journal, so that a run
+        # resumed after a crash never skips a country that was not written
+        if rows:
+            names, milliseconds = upsert_countries(db, rows)
+            record_stage('write', milliseconds / 1000)
+            written = set(names)
+            for row in rows:
+                if row[0] not in written:
+                    print(f"The country {row[0]} is unchanged.")
+                elif row[0] in known_countries:
+                    print(f"Updated country in table - {row[0]}")
+                else:
+                    print(f"Added country to table - {row[0]}")
+            stats['written'] += len(written)
+            stats['unchanged'] += len(rows) - len(written)
+            metrics.inc('scraper_countries_total', len(written),
+                        result='written')
+            metrics.inc('scraper_countries_total', len(rows) - len(written),
+                        result='unchanged')
+            rows.clear()
+        if journal_conn and handled:
+            start = time.perf_counter()
+            record_pages(journal_conn, run_id, handled)
+            record_stage('journal', time.perf_counter() - start)
+        handled.clear()
+
+    # The stages are chained lazily: the parse stage pulls pages from the
+    # fetch stage only when it has room for them and the store stage below
+    # pulls parsed pages, so each stage holds at most queue_size pages
+    queue_size = queue_size or 2 * max(workers, parse_workers, 1)
+    fetch_executor = ThreadPoolExecutor(workers) if workers > 1 else None
+    parse_executor = (ProcessPoolExecutor(parse_workers)
+                      if parse_workers > 0 else None)
+    try:
+        pages = bounded_map(fetch_executor, fetch, pending, queue_size)
+        parsed_pages = bounded_map(parse_executor,
+                                   partial(parse_fetched_page,
+                                           backend=backend),
+                                   pages, queue_size)
+        for (name, population, country_url, existing), parsed_page in zip(
+                pending, parsed_pages):
+            (details, etag, last_modified, attempts, error,
+             timings) = parsed_page
+            if timings['parse']:
+                for stage in ('parse', 'infobox', 'normalize'):
+                    record_stage(stage, timings[stage])
+            if error:
+                stats['failed'] += 1
+                metrics.inc('scraper_pages_total', status=error[0])
+                handled.append((country_url, error[0], attempts, error[1]))
+                print(f"The country {name} failed: {error[1]}")
+            # Nothing to parse if the page did not change
+            elif details is None:
+                if from_cache:
+                    print(f"The country {name} is not cached.")
+                    metrics.inc('scraper_pages_total', status='not_cached')
+                    handled.append((country_url, 'error', 0, 'not cached'))
+                else:
+                    stats['fetched'] += 1
+                    stats['not_modified'] += 1
+                    metrics.inc('scraper_pages_total', status='not_modified')
+                    handled.append((country_url, 'done', attempts, None))
+                    print(f"The page of the country {name} is not "
+                          f"modified.")
+            else:
+                stats['fetched'] += 1
+                stats['parsed'] += 1
+                metrics.inc('scraper_pages_total', status='parsed')
+                handled.append((country_url, 'done', attempts, None))
 
                 # Get all data from the current page and
                 # store it in its respective variable
@@ -100,61 +543,188 @@ def scrape_wikipedia():
                  neighbors,
                  languages,
                  timezone,
-                 regime) = scrape_country_details(country_url)
+                 regime) = details
 
                 # If no density was found calculate it manually
-                # with a formula that provides an approximate result
-                if density == -1.0:
-                    if area != -1:
-                        density = round(population / area, 1)
-
-                # Insert the found data in the created database table
-                cursor.execute(
-                    '''INSERT INTO countries
-                    (name,
-                    capital,
-                    population,
-                    density,
-                    area,
-                    neighbors,
-                    languages,
-                    timezone,
-                    regime)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                    (name,
-                     capital,
-                     population,
-                     density,
-                     area,
-                     neighbors,
-                     languages,
-                     timezone,
-                     regime))
-                print(f"Added country to table - {name}")
-            else:
-                print(f"The country {name} already exists in the database.")
+                density = fill_density(density, population, area)
+
+                rows.append((name,
+                             capital,
+                             population,
+                             density,
+                             area,
+                             neighbors,
+                             languages,
+                             timezone,
+                             regime,
+                             etag,
+                             last_modified))
+            if len(handled) >= batch_size:
+                flush()
+        flush()
+    except BaseException:
+        # Whatever stopped the run, the pages checkpointed so far are kept
+        # and the next run resumes from them
+        if journal_conn:
+            finish_run(journal_conn, run_id, 'interrupted')
+            journal_conn.close()
+        raise
+    finally:
+        for executor in (fetch_executor, parse_executor):
+            if executor:
+                executor.shutdown(cancel_futures=True)
+    print(f"{'Read' if from_cache else 'Fetched'} {stats['fetched']} "
+          f"country pages ({stats['not_modified']} not modified), parsed "
+          f"{stats['parsed']}, wrote {stats['written']} countries "
+          f"({stats['unchanged']} unchanged) in "
+          f"{stats['stages']['write'] * 1000:.1f} ms.")
+    if journal_conn:
+        status = 'finished'
+        failed = run_pages(journal_conn, run_id).get('failed', 0)
+        if failed:
+            status = 'incomplete'
+            print(f"{failed} country pages failed, run the scraper again "
+                  f"to retry them.")
+        finish_run(journal_conn, run_id, status)
+        journal_conn.close()
+    # Link the countries to their neighbors and aliases now that all of
+    # them are stored
+    start = time.perf_counter()
+    links, unresolved = replace_neighbors(db)
+    aliases = replace_aliases(db)
+    record_stage('neighbors', time.perf_counter() - start)
+    print(f"Linked {links} neighbors, {unresolved} not found among the "
+          f"countries, and {aliases} aliases.")
+
+    if cache_directory and not from_cache:
+        evict_pages(cache_max_bytes, cache_directory)
+    stats['seconds'] = time.perf_counter() - run_start
+    metrics.observe('scraper_run_seconds', stats['seconds'])
+    print("Stage seconds: " + ", ".join(
+        f"{stage} {seconds:.2f}" for stage, seconds
+        in stats['stages'].items()) + f"; total {stats['seconds']:.2f}.")
+    return stats
+
+
+def bounded_map(executor, function, items, window):
+    """
+    Apply the function to each item in the given executor, like
+    executor.map, but pulling a new item from the input only when less
+    than window items are in progress, so that a slow consumer never lets
+    results pile up in memory. Results are returned in the input order.
+    :param executor: The executor running the calls, None to run them
+    one by one in the calling thread
+    :param function: The function to apply
+    :param items: The iterable of items to apply the function to
+    :param window: The maximum number of items in progress at once
+    :return: A generator of the results
+    """
+
+    if executor is None:
+        yield from map(function, items)
+        return
+    futures = deque()
+    for item in items:
+        if len(futures) >= window:
+            yield futures.popleft().result()
+        futures.append(executor.submit(function, item))
+    while futures:
+        yield futures.popleft().result()
+
 
-        conn.commit()
+def parse_fetched_page(page, backend=DEFAULT_BACKEND):
+    """
+    Parse a page returned by the fetch stage of the scraper. Defined at
+    module level so it can be sent to the processes of the parse stage.
+    :param page: The (html, etag, last_modified, attempts, error) tuple of
+    the page, html being None when the page did not change, is not cached
+    or could not be downloaded (error then tells why, see the return)
+    :param backend: The name of the HTML parsing backend to use
+    :return: The (details, etag, last_modified, attempts, error, timings)
+    tuple of the page, details being None when there was nothing to parse
+    or the parsing failed, error being None or the (status, message) of
+    the failure, status being 'failed' if a later run may succeed and
+    'error' otherwise, and timings the seconds spent parsing the page
+    ('parse'), finding its information box ('infobox') and normalizing its
+    values ('normalize'), measured here as the page may be parsed in
+    another process
+    """
+
+    html, etag, last_modified, attempts, error = page
+    timings = {'parse': 0.0, 'infobox': 0.0, 'normalize': 0.0}
+    if html is None:
+        return None, etag, last_modified, attempts, error, timings
+    start = time.perf_counter()
+    try:
+        details = parse_country_details(html, backend, timings)
+    except Exception as parse_error:
+        # A page the parsers do not handle fails alone, not the whole run
+        details = None
+        error = ('error', f"{type(parse_error).__name__}: {parse_error}")
+    timings['parse'] = time.perf_counter() - start
+    return details, etag, last_modified, attempts, error, timings
 
 
-def scrape_country_details(url):
+def scrape_country_details(url, from_cache=False, cache_directory=None,
+                           backend=DEFAULT_BACKEND):
     """
     Extract data from each country's page that is not found in the
-    main table page. The method works for romanian wikipedia country
-    pages, as it looks for specific keywords found in those. It looks
-    in the information box found in the upper right of the page, a
-    table marked as "infocaseta" where most crucial information is
-    found. Some countries miss some datas and as such have default values
+    main table page.
     :param url: The URL of the country's wikipedia page for which the method
     will scrape details
+    :param from_cache: Parse the page found in the HTML cache instead of
+    downloading it
+    :param cache_directory: The directory of the HTML cache the downloaded
+    page is stored in, None to not store it. The page read with from_cache
+    comes from CACHE_DIRECTORY if None.
+    :param backend: The name of the HTML parsing backend to use
     :return: The details of the country after scraping data or default values
     if none were found
     """
 
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
+    if from_cache:
+        html = load_page(url, cache_directory or CACHE_DIRECTORY)
+        if html is None:
+            raise LookupError(f"The page {url} is not cached")
+    else:
+        html = fetch_page(url)[0]
+        if cache_directory:
+            store_page(url, html, cache_directory)
+    return parse_country_details(html, backend)
+
+
+def parse_country_details(html, backend=DEFAULT_BACKEND, timings=None):
+    """
+    Extract data from the HTML of a country's page. The method works for
+    romanian wikipedia country pages, as it looks for specific keywords
+    found in those. It looks in the information box found in the upper
+    right of the page, a table marked as "infocaseta" where most crucial
+    information is found. Some countries miss some datas and as such have
+    default values
+    :param html: The HTML text of the country's wikipedia page
+    :param backend: The name of the HTML parsing backend used to find
+    the information box
+    :param timings: A dict the seconds spent finding the information box
+    ('infobox') and normalizing the values found in it ('normalize') are
+    added to, None to not measure them
+    :return: The details of the country after parsing data or default values
+    if none were found
+    """
+
+    def normalize(parse, value):
+        # Run one of the parsers of utils.py, measuring it if requested
+        if timings is None:
+            return parse(value)
+        start = time.perf_counter()
+        result = parse(value)
+        timings['normalize'] += time.perf_counter() - start
+        return result
+
     # Extract the information box on the upper right side of the wikipedia page
-    infobox = soup.find('table', {'class': 'infocaseta'})
+    start = time.perf_counter()
+    infobox = find_infobox(html, backend)
+    if timings is not None:
+        timings['infobox'] += time.perf_counter() - start
 
     # Set default values to the fields
     (area,
@@ -196,27 +766,28 @@ def scrape_country_details(url):
                 # in the respective variable
                 if 'total' in key and "suprafață" in old_row_title:
                     value = td.get_text().strip()
-                    area = parse_wikipedia_number_string_to_int(value.strip())
+                    area = normalize(parse_wikipedia_number_string_to_int,
+                                     value.strip())
                 elif 'densitate' in key:
                     value = td.get_text().strip()
                     density = round(
-                        parse_density_string_to_int(
-                            value.strip()), 1)
+                        normalize(parse_density_string_to_int,
+                                  value.strip()), 1)
                 elif 'capitala' in key:
                     value = td.get_text().strip()
-                    capital = parse_capital_text(value)
+                    capital = normalize(parse_capital_text, value)
                 elif 'vecini' in key:
                     value = td.get_text().strip()
-                    neighbors = parse_neighbors_text(value)
+                    neighbors = normalize(parse_neighbors_text, value)
                 elif 'limbi oficiale' in key:
                     value = td.get_text(separator=" ").strip()
-                    languages = parse_languages_text(value)
+                    languages = normalize(parse_languages_text, value)
                 elif 'fus orar' in key:
                     value = td.get_text(separator=" ").strip()
-                    timezone = parse_timezone(value)
+                    timezone = normalize(parse_timezone, value)
                 elif 'sistem politic' in key:
                     value = td.get_text().strip()
-                    regime = general_parse(value)
+                    regime = normalize(general_parse, value)
 
                 # Save the previous row title
                 # (specifically for area, because the data is displayed as
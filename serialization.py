@@ -0,0 +1,103 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Number of rows serialized together into one chunk of a streamed response
+CHUNK_ROWS = 256
+
+
+def _dumps_json(value):
+    """
+    Serialize a value with the standard library, producing the same bytes
+    as the compact output of Flask's jsonify: ASCII only, sorted keys and
+    no spaces
+    :param value: The value to serialize
+    :return: The JSON document as bytes
+    """
+
+    return json.dumps(value, ensure_ascii=True, sort_keys=True,
+                      separators=(',', ':')).encode('ascii')
+
+
+def _dumps_orjson(value):
+    """
+    Serialize a value with orjson, keys sorted like the standard output
+    but non-ASCII characters written as UTF-8 instead of escaped
+    :param value: The value to serialize
+    :return: The JSON document as bytes
+    """
+
+    return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+
+
+# The JSON serializers available, orjson being used by default when the
+# orjson package is installed
+SERIALIZERS = {'json': _dumps_json}
+if orjson:
+    SERIALIZERS['orjson'] = _dumps_orjson
+DEFAULT_SERIALIZER = 'orjson' if orjson else 'json'
+
+
+class SerializerJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider of the Flask application writing the responses of
+    jsonify with the serializer named by the JSON_SERIALIZER config key
+    """
+
+    def response(self, *args, **kwargs):
+        value = self._prepare_response_obj(args, kwargs)
+        dumps = SERIALIZERS[self._app.config['JSON_SERIALIZER']]
+        return self._app.response_class(dumps(value) + b'\n',
+                                        mimetype=self.mimetype)
+
+
+def json_array_chunks(items, dumps, chunk_rows=CHUNK_ROWS):
+    """
+    Serialize items as a JSON array one chunk at a time, producing the
+    same bytes as the serialization of the whole list followed by a new
+    line, without ever holding all of the items
+    :param items: An iterable of the values in the array
+    :param dumps: The serializer of a single value
+    :param chunk_rows: Number of items serialized into each chunk
+    :return: A generator of the chunks as bytes
+    """
+
+    separator = b'['
+    batch = []
+    for item in items:
+        batch.append(dumps(item))
+        if len(batch) == chunk_rows:
+            yield separator + b','.join(batch)
+            separator = b','
+            batch = []
+    if batch:
+        yield separator + b','.join(batch) + b']\n'
+    elif separator == b'[':
+        yield b'[]\n'
+    else:
+        yield b']\n'
+
+
+def ndjson_chunks(items, dumps, chunk_rows=CHUNK_ROWS):
+    """
+    Serialize items as newline delimited JSON, one document per line, one
+    chunk at a time
+    :param items: An iterable of the values
+    :param dumps: The serializer of a single value
+    :param chunk_rows: Number of items serialized into each chunk
+    :return: A generator of the chunks as bytes
+    """
+
+    batch = []
+    for item in items:
+        batch.append(dumps(item) + b'\n')
+        if len(batch) == chunk_rows:
+            yield b''.join(batch)
+            batch = []
+    if batch:
+        yield b''.join(batch)
@@ -0,0 +1,773 @@
+import bisect
+import json
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+
+from storage import STATS_COLUMNS, STATS_METRICS, STATS_TABLES
+
+# Numeric columns the countries can be ranked by
+METRICS = ('population', 'density', 'area')
+# Text columns that can be searched with a substring
+TEXT_COLUMNS = ('timezone', 'languages', 'regime')
+# Tables holding the terms each text column is indexed by
+TERM_TABLES = {'languages': 'country_languages',
+               'timezone': 'country_timezones',
+               'regime': 'country_regimes'}
+# Columns that can be read for a country given its name
+NAME_COLUMNS = ('capital', 'neighbors')
+# Minimum number of seconds between two checks of the database files
+CHECK_INTERVAL = 1.0
+# Default path of the binary snapshot written by prepare_data.py
+SNAPSHOT_FILE = 'states_of_the_world.snapshot'
+# First bytes of the binary snapshots and version of their layout, read
+# by load_mapped_snapshot, followed by the length of the JSON header
+SNAPSHOT_MAGIC = b'CTRYSNAP'
+SNAPSHOT_FORMAT = 2
+SNAPSHOT_PREFIX = struct.Struct('<8sII')
+# Each section of a binary snapshot starts at a multiple of this many bytes
+# from the start of the file, so that its values are aligned
+SECTION_ALIGNMENT = 8
+# Type codes of the numeric columns in the binary snapshots, and kinds of
+# their values: stored with the type of the column, NULL, or an integer
+# stored in a float column (SQLite keeps the densities the scraper found as
+# integers and the computed ones as floats, which are serialized apart)
+NUMBER_TYPES = {'population': 'q', 'density': 'd', 'area': 'q'}
+VALUE_KIND, NULL_KIND, INTEGER_KIND = 0, 1, 2
+# Text columns stored in the string heap of the binary snapshots
+STRING_COLUMNS = ('name', 'capital', 'neighbors', 'languages', 'timezone',
+                  'regime', 'name_key')
+
+# Translation used to uppercase only the ASCII letters, like SQLite's UPPER
+_ASCII_UPPER = str.maketrans('abcdefghijklmnopqrstuvwxyz',
+                             'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+# Snapshot currently served and time of the last check of the database
+_snapshot = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def ascii_upper(text):
+    """
+    Uppercase the ASCII letters of a text, leaving every other character
+    as it is, which is what SQLite's UPPER function does
+    :param text: The text to uppercase
+    :return: The uppercased text
+    """
+
+    return text.translate(_ASCII_UPPER)
+
+
+def database_signature(database):
+    """
+    Get a value that changes whenever the database is written: the
+    modification time and size of the database file and of its write-ahead
+    log, as a write in WAL mode only touches the log until a checkpoint
+    :param database: Path of the database file
+    :return: A tuple identifying the current state of the files
+    """
+
+    signature = []
+    for path in (database, database + '-wal'):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def load_snapshot(database):
+    """
+    Load the countries table into memory, with the rankings and the indexes
+    needed to answer the API routes without any SQL query. Rows are kept
+    in id order, the order SQLite returns them in when scanning the table.
+    :param database: Path of the database file
+    :return: The snapshot, a dict of read-only structures
+    """
+
+    signature = database_signature(database)
+    conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    # A single read transaction, so that the rows, the terms and the
+    # version are read from the same state of the database
+    conn.execute('BEGIN')
+    rows = conn.execute(
+        'SELECT name, capital, population, density, area, neighbors, '
+        'languages, timezone, regime, name_key, id FROM countries '
+        'ORDER BY id'
+    ).fetchall()
+    positions = {row[-1]: index for index, row in enumerate(rows)}
+    # For each text column its sorted terms, each one mapped to the
+    # indexes of the rows having it
+    terms = {}
+    for column, table in TERM_TABLES.items():
+        rows_by_term = {}
+        for country_id, term in conn.execute(
+                f'SELECT country_id, term FROM {table} '
+                f'ORDER BY term, country_id'):
+            if country_id in positions:
+                rows_by_term.setdefault(term, []).append(
+                    positions[country_id])
+        terms[column] = (tuple(rows_by_term),
+                         {term: tuple(indexes)
+                          for term, indexes in rows_by_term.items()})
+    aliases = conn.execute(
+        'SELECT alias_key, country_id FROM country_aliases').fetchall()
+    version = conn.execute('SELECT version FROM dataset_version').fetchone()
+    # The summary tables of the grouped statistics, a few rows per group
+    stats = {table: tuple(conn.execute(
+        f'SELECT term, {", ".join(STATS_COLUMNS)} FROM {table} '
+        f'ORDER BY term').fetchall()) for table, _ in STATS_TABLES}
+    conn.close()
+    columns = ('name', 'capital', 'population', 'density', 'area',
+               'neighbors', 'languages', 'timezone', 'regime', 'name_key')
+    values = {column: tuple(row[index] for row in rows)
+              for index, column in enumerate(columns)}
+
+    # For each metric the row indexes having a known value (not the -1 the
+    # scraper stores for an unknown one), sorted by value and then by id
+    # like the ranking indexes of the database, with their (value, id)
+    # keys used to resume a ranking after a given row
+    ids = tuple(row[-1] for row in rows)
+    orders = {}
+    sort_keys = {}
+    for metric in METRICS:
+        column = values[metric]
+        orders[metric] = tuple(sorted(
+            (index for index in range(len(rows))
+             if column[index] is not None and column[index] >= 0),
+            key=lambda index: (column[index], ids[index])))
+        sort_keys[metric] = tuple((column[index], ids[index])
+                                  for index in orders[metric])
+
+    # Keys of the names without diacritics and case, mapped to the index
+    # of the row having them, and keys of the aliases, mapped to the index
+    # of the row of their country
+    keys = {}
+    for index, key in enumerate(values['name_key']):
+        if key is not None:
+            keys.setdefault(key, index)
+    alias_keys = {key: positions[country_id] for key, country_id in aliases
+                  if country_id in positions}
+
+    return {
+        'signature': signature,
+        'version': version[0] if version else 0,
+        'stats': stats,
+        'values': values,
+        'ids': ids,
+        'orders': orders,
+        'sort_keys': sort_keys,
+        'upper_text': {column: tuple(None if text is None
+                                     else ascii_upper(text)
+                                     for text in values[column])
+                       for column in TEXT_COLUMNS},
+        'keys': keys,
+        'aliases': alias_keys,
+        'terms': terms,
+    }
+
+
+def get_snapshot(database, check_interval=CHECK_INTERVAL, path=None):
+    """
+    Get the current snapshot of the database, loading it the first time.
+    At most once every check_interval seconds the database files are
+    checked and the snapshot is rebuilt if they changed. The new snapshot
+    replaces the old one in a single assignment, so readers always see a
+    complete snapshot.
+    :param database: Path of the database file
+    :param check_interval: Minimum number of seconds between two checks
+    :param path: Path of a binary snapshot written by write_snapshot to map
+    instead of reading the database, checked and mapped again the same way
+    when it is replaced
+    :return: The snapshot
+    """
+
+    global _snapshot, _checked_at
+    now = time.monotonic()
+    if _snapshot is not None and now - _checked_at < check_interval:
+        return _snapshot
+    with _lock:
+        if _snapshot is None or now - _checked_at >= check_interval:
+            if (_snapshot is None
+                    or _snapshot['signature']
+                    != database_signature(path or database)):
+                _snapshot = (load_mapped_snapshot(path) if path
+                             else load_snapshot(database))
+            _checked_at = now
+    return _snapshot
+
+
+class StringColumn:
+    """
+    Read-only sequence of the texts of a binary snapshot, each one decoded
+    from the string heap when it is read
+    """
+
+    __slots__ = ('mapped', 'base', 'offsets', 'nulls')
+
+    def __init__(self, mapped, base, offsets, nulls=None):
+        """
+        :param mapped: The mapped file
+        :param base: The position of the string heap in the file
+        :param offsets: The n + 1 offsets in the heap where the texts start,
+        the last one being where the last text ends
+        :param nulls: A byte for each text, 1 if it is NULL, None if none
+        of them is
+        """
+
+        self.mapped = mapped
+        self.base = base
+        self.offsets = offsets
+        self.nulls = nulls
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        return iter(self.take(range(len(self))))
+
+    def take(self, indexes):
+        """
+        :param indexes: An iterable of row indexes
+        :return: The list of the texts of the rows, decoded in a single loop
+        """
+
+        # Slicing the mmap object copies the bytes of a text at once,
+        # which is faster than slicing a memoryview of it
+        mapped, base, offsets, nulls = (self.mapped, self.base,
+                                        self.offsets, self.nulls)
+        if nulls is None:
+            return [mapped[base + offsets[index]:
+                           base + offsets[index + 1]].decode('utf-8')
+                    for index in indexes]
+        return [None if nulls[index]
+                else mapped[base + offsets[index]:
+                            base + offsets[index + 1]].decode('utf-8')
+                for index in indexes]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if self.nulls is not None and self.nulls[index]:
+            return None
+        return self.mapped[self.base + self.offsets[index]:
+                           self.base + self.offsets[index + 1]].decode(
+            'utf-8')
+
+
+class NumberColumn:
+    """
+    Read-only sequence of the values of a numeric column of a binary
+    snapshot, None for the NULL ones
+    """
+
+    __slots__ = ('values', 'kinds')
+
+    def __init__(self, values, kinds):
+        """
+        :param values: The fixed-width values, 0 for the NULL ones
+        :param kinds: The kind of each value, see VALUE_KIND
+        """
+
+        self.values = values
+        self.kinds = kinds
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        kind = self.kinds[index]
+        if kind == VALUE_KIND:
+            return self.values[index]
+        return None if kind == NULL_KIND else int(self.values[index])
+
+
+class SortKeys:
+    """
+    Read-only sequence of the (value, id) keys of a metric in the order of
+    its ranking, the sort_keys of a snapshot, built from the ranking order
+    of a binary snapshot when read
+    """
+
+    __slots__ = ('order', 'column', 'ids')
+
+    def __init__(self, order, column, ids):
+        self.order = order
+        self.column = column
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, position):
+        index = self.order[position]
+        return self.column[index], self.ids[index]
+
+
+class SortedIndex:
+    """
+    Read-only mapping of the sorted texts of a binary snapshot to their
+    values, the row indexes of the keys or the row indexes of the terms,
+    found by bisection
+    """
+
+    __slots__ = ('texts', 'values', 'offsets')
+
+    def __init__(self, texts, values, offsets=None):
+        """
+        :param texts: The StringColumn of the sorted texts
+        :param values: The value of each text, or the concatenated lists of
+        values of the texts when offsets are given
+        :param offsets: The n + 1 offsets in values where the list of each
+        text starts, None if each text has a single value
+        """
+
+        self.texts = texts
+        self.values = values
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __getitem__(self, text):
+        position = bisect.bisect_left(self.texts, text)
+        if position == len(self.texts) or self.texts[position] != text:
+            raise KeyError(text)
+        if self.offsets is None:
+            return self.values[position]
+        return self.values[self.offsets[position]:
+                           self.offsets[position + 1]]
+
+    def get(self, text, default=None):
+        try:
+            return self[text]
+        except KeyError:
+            return default
+
+
+def write_snapshot(database, path=SNAPSHOT_FILE):
+    """
+    Write the snapshot of the database into a read-only binary file that
+    the API processes map into memory with load_mapped_snapshot instead of
+    each one loading its own copy. The file is written next to its final
+    path and moved there once complete.
+    :param database: Path of the database file
+    :param path: Path of the binary snapshot
+    :return: The size of the file in bytes
+    """
+
+    loaded = load_snapshot(database)
+    values = loaded['values']
+    heap = bytearray()
+    sections = {}
+
+    def add_strings(name, texts):
+        # Append the texts to the heap, with their offsets and NULL bytes
+        offsets = array('q', [len(heap)])
+        for text in texts:
+            if text is not None:
+                heap.extend(text.encode('utf-8'))
+            offsets.append(len(heap))
+        sections[name + '.offsets'] = offsets
+        if None in texts:
+            sections[name + '.nulls'] = array(
+                'B', [text is None for text in texts])
+
+    def add_index(name, mapping, lists=False):
+        # The keys of a mapping sorted, with their value or list of values
+        texts = sorted(mapping)
+        add_strings(name, texts)
+        if lists:
+            offsets = array('q', [0])
+            rows = array('I')
+            for text in texts:
+                rows.extend(mapping[text])
+                offsets.append(len(rows))
+            sections[name + '.postings'] = offsets
+            sections[name + '.rows'] = rows
+        else:
+            sections[name + '.rows'] = array(
+                'I', [mapping[text] for text in texts])
+
+    sections['ids'] = array('q', loaded['ids'])
+    for column, typecode in NUMBER_TYPES.items():
+        sections[column + '.values'] = array(
+            typecode, [value or 0 for value in values[column]])
+        sections[column + '.kinds'] = array('B', [
+            NULL_KIND if value is None
+            else INTEGER_KIND if typecode == 'd' and isinstance(value, int)
+            else VALUE_KIND for value in values[column]])
+        sections[column + '.order'] = array('I', loaded['orders'][column])
+    for column in STRING_COLUMNS:
+        add_strings(column, values[column])
+    for column in TEXT_COLUMNS:
+        add_strings('upper_' + column, loaded['upper_text'][column])
+        add_index('terms_' + column, loaded['terms'][column][1], lists=True)
+    add_index('keys', loaded['keys'])
+    add_index('aliases', loaded['aliases'])
+    sections['heap'] = heap
+
+    # Lay out the sections after the header, whose length depends on
+    # their offsets, until the offsets no longer change
+    def layout(start):
+        directory = {}
+        position = start
+        for name, section in sections.items():
+            position += -position % SECTION_ALIGNMENT
+            typecode = section.typecode if isinstance(section, array) else 'B'
+            directory[name] = [position, len(section), typecode]
+            position += len(section) * (
+                section.itemsize if isinstance(section, array) else 1)
+        return json.dumps({'rows': len(loaded['ids']),
+                           'version': loaded['version'],
+                           'stats': loaded['stats'],
+                           'byteorder': sys.byteorder,
+                           'sections': directory}).encode('utf-8')
+
+    header = b''
+    while True:
+        start = SNAPSHOT_PREFIX.size + len(header)
+        new_header = layout(start + -start % SECTION_ALIGNMENT)
+        if len(new_header) == len(header):
+            header = new_header
+            break
+        header = new_header
+    header += b' ' * (-(SNAPSHOT_PREFIX.size + len(header))
+                      % SECTION_ALIGNMENT)
+
+    directory = os.path.dirname(path) or '.'
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            output.write(SNAPSHOT_PREFIX.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT,
+                                              len(header)))
+            output.write(header)
+            for section in sections.values():
+                output.write(b'\0' * (-output.tell() % SECTION_ALIGNMENT))
+                output.write(section)
+            size = output.tell()
+        # mkstemp creates the file readable by its owner only
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return size
+
+
+def load_mapped_snapshot(path=SNAPSHOT_FILE):
+    """
+    Map a binary snapshot written by write_snapshot into memory, read-only
+    and shared, so that every process mapping the same file uses the same
+    pages of the page cache. Nothing is copied or decoded when it is
+    loaded: the columns, orders and indexes of the returned snapshot read
+    the mapped file when they are accessed, which makes loading it take
+    the same time whatever the number of countries.
+    :param path: Path of the binary snapshot
+    :return: The snapshot, with the same structures as load_snapshot
+    """
+
+    signature = database_signature(path)
+    with open(path, 'rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, length = SNAPSHOT_PREFIX.unpack_from(mapped)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_FORMAT:
+        raise ValueError(f"{path} is not a snapshot of format "
+                         f"{SNAPSHOT_FORMAT}")
+    header = json.loads(mapped[SNAPSHOT_PREFIX.size:
+                               SNAPSHOT_PREFIX.size + length])
+    if header['byteorder'] != sys.byteorder:
+        raise ValueError(f"{path} was written on a {header['byteorder']} "
+                         f"endian machine")
+    view = memoryview(mapped)
+
+    def section(name):
+        offset, count, typecode = header['sections'][name]
+        size = count * array(typecode).itemsize
+        return view[offset:offset + size].cast(typecode)
+
+    heap = header['sections']['heap'][0]
+
+    def strings(name):
+        return StringColumn(mapped, heap, section(name + '.offsets'),
+                            section(name + '.nulls')
+                            if name + '.nulls' in header['sections']
+                            else None)
+
+    ids = section('ids')
+    values = {column: strings(column) for column in STRING_COLUMNS}
+    orders = {}
+    sort_keys = {}
+    for column in NUMBER_TYPES:
+        values[column] = NumberColumn(section(column + '.values'),
+                                      section(column + '.kinds'))
+        orders[column] = section(column + '.order')
+        sort_keys[column] = SortKeys(orders[column], values[column], ids)
+    terms = {}
+    for column in TEXT_COLUMNS:
+        sorted_terms = strings('terms_' + column)
+        terms[column] = (sorted_terms, SortedIndex(
+            sorted_terms, section(f'terms_{column}.rows'),
+            section(f'terms_{column}.postings')))
+
+    return {
+        'signature': signature,
+        'version': header['version'],
+        'stats': {table: tuple(map(tuple, rows))
+                  for table, rows in header['stats'].items()},
+        'values': values,
+        'ids': ids,
+        'orders': orders,
+        'sort_keys': sort_keys,
+        'upper_text': {column: strings('upper_' + column)
+                       for column in TEXT_COLUMNS},
+        'keys': SortedIndex(strings('keys'), section('keys.rows')),
+        'aliases': SortedIndex(strings('aliases'), section('aliases.rows')),
+        'terms': terms,
+    }
+
+
+def take(column, indexes):
+    """
+    :param column: A column of a snapshot, a tuple or a column of a binary
+    snapshot
+    :param indexes: An iterable of row indexes
+    :return: The list of the values of the column at the given rows
+    """
+
+    if isinstance(column, StringColumn):
+        return column.take(indexes)
+    return [column[index] for index in indexes]
+
+
+def like_pattern(pattern):
+    """
+    Translate a SQL LIKE pattern into a regular expression, "%" matching
+    any text and "_" any single character
+    :param pattern: The LIKE pattern
+    :return: The compiled regular expression
+    """
+
+    parts = []
+    for character in pattern:
+        if character == '%':
+            parts.append('.*')
+        elif character == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(character))
+    return re.compile(''.join(parts), re.DOTALL)
+
+
+def ranking(snapshot, metric, descending, limit, offset=0, after=None,
+            minimum=None, maximum=None, allowed=None):
+    """
+    Same rows as the ranking query of the API: the countries having a
+    known value of the metric ordered by (value, id), walked from the end
+    when descending
+    :param snapshot: The snapshot to rank
+    :param metric: The numeric column the countries are ranked by
+    :param descending: Rank from the highest value
+    :param limit: Maximum number of rows returned
+    :param offset: Number of matching rows skipped
+    :param after: The (value, id) key of the row the ranking resumes after
+    :param minimum: Smallest value of the metric allowed
+    :param maximum: Largest value of the metric allowed
+    :param allowed: Set of the row indexes allowed, None for all of them
+    :return: The (id, name, value) rows
+    """
+
+    order = snapshot['orders'][metric]
+    sort_keys = snapshot['sort_keys'][metric]
+    # Range of the order kept by the bounds, found by bisection
+    start = 0 if minimum is None else bisect.bisect_left(
+        sort_keys, (minimum,))
+    end = len(order) if maximum is None else bisect.bisect_left(
+        sort_keys, (maximum, float('inf')))
+    if after is not None:
+        if descending:
+            end = min(end, bisect.bisect_left(sort_keys, tuple(after)))
+        else:
+            start = max(start, bisect.bisect_right(sort_keys, tuple(after)))
+    positions = range(end - 1, start - 1, -1) if descending else range(
+        start, end)
+
+    ids = snapshot['ids']
+    names = snapshot['values']['name']
+    column = snapshot['values'][metric]
+    rows = []
+    for position in positions:
+        index = order[position]
+        if allowed is not None and index not in allowed:
+            continue
+        if offset:
+            offset -= 1
+            continue
+        rows.append((ids[index], names[index], column[index]))
+        if len(rows) == limit:
+            break
+    return rows
+
+
+def names_containing(snapshot, column, text):
+    """
+    Same rows as "SELECT name FROM countries WHERE UPPER(column) LIKE ?"
+    with f"%{text}%" as parameter
+    :param snapshot: The snapshot to search
+    :param column: The text column to search in
+    :param text: The uppercased searched text
+    :return: The (name,) rows of the matching countries
+    """
+
+    pattern = like_pattern(f"%{text}%")
+    return [(name,) for name in take(snapshot['values']['name'], [
+        index for index, value in enumerate(snapshot['upper_text'][column])
+        if value is not None and pattern.fullmatch(value)])]
+
+
+def find_key(snapshot, key):
+    """
+    :param snapshot: The snapshot to search
+    :param key: The name key of a name or an alias of a country
+    :return: The index of the row of the country or None if there is none
+    """
+
+    index = snapshot['keys'].get(key)
+    if index is None:
+        index = snapshot['aliases'].get(key)
+    return index
+
+
+def column_by_key(snapshot, column, key):
+    """
+    Same rows as the query of the API reading a column of the country
+    having the given name key, or the given alias key
+    :param snapshot: The snapshot to search
+    :param column: The column to read
+    :param key: The name key of a name or an alias of the country
+    :return: The (value,) row of the country, or no row
+    """
+
+    index = find_key(snapshot, key)
+    if index is None:
+        return []
+    return [(snapshot['values'][column][index],)]
+
+
+def countries_by_keys(snapshot, keys, columns):
+    """
+    Same rows as the batch query of the API: the countries whose name key
+    or one of whose alias keys is one of the given keys
+    :param snapshot: The snapshot to search
+    :param keys: The name or alias keys searched
+    :param columns: The columns read for each country
+    :return: The (key, name, *columns) rows of the countries found, key
+    being the searched key, in the order of the rows
+    """
+
+    values = snapshot['values']
+    found = []
+    for key in keys:
+        index = find_key(snapshot, key)
+        if index is not None:
+            found.append((index, key))
+    found.sort()
+    return [(key, values['name'][index])
+            + tuple(values[column][index] for column in columns)
+            for index, key in found]
+
+
+def rows_with_terms(snapshot, column, terms, prefix):
+    """
+    Find the rows having every one of the given terms (or a term starting
+    with it) in the term table of a text column
+    :param snapshot: The snapshot to search
+    :param column: The text column whose terms are searched
+    :param terms: The searched terms
+    :param prefix: Whether the terms are matched as prefixes
+    :return: The set of the matching row indexes
+    """
+
+    sorted_terms, rows_by_term = snapshot['terms'][column]
+    matching = None
+    for term in terms:
+        if prefix:
+            start = bisect.bisect_left(sorted_terms, term)
+            end = bisect.bisect_left(sorted_terms, term + '\U0010ffff')
+            indexes = {index for found in sorted_terms[start:end]
+                       for index in rows_by_term[found]}
+        else:
+            indexes = set(rows_by_term.get(term, ()))
+        matching = indexes if matching is None else matching & indexes
+    return matching
+
+
+def names_with_terms(snapshot, column, terms, prefix):
+    """
+    Same rows as the term table search of the API: the countries having
+    every one of the given terms (or a term starting with it)
+    :param snapshot: The snapshot to search
+    :param column: The text column whose terms are searched
+    :param terms: The searched terms
+    :param prefix: Whether the terms are matched as prefixes
+    :return: The (name,) rows of the matching countries, in id order
+    """
+
+    return [(name,) for name in take(snapshot['values']['name'], sorted(
+        rows_with_terms(snapshot, column, terms, prefix)))]
+
+
+def group_stats(snapshot, table, metric=None, aggregate='sum',
+                descending=True, limit=None):
+    """
+    Same rows as the summary table query of the API, read from the copy
+    of the summary tables kept in the snapshot
+    :param snapshot: The snapshot to read
+    :param table: The summary table of the grouping
+    :param metric: The numeric column the groups are ordered by, None to
+    order them by their number of countries
+    :param aggregate: The aggregate of the metric the groups are ordered by
+    (count, sum, avg, min or max), the groups without a known value of the
+    metric coming last
+    :param descending: Whether the groups are ordered from the highest
+    :param limit: The largest number of groups returned, None for all
+    :return: The (term, countries, then count, sum, min and max of each of
+    STATS_METRICS) rows of the groups, ties ordered by term
+    """
+
+    if metric is None:
+        def value(row):
+            return row[1]
+    else:
+        start = 2 + 4 * STATS_METRICS.index(metric)
+
+        def value(row):
+            count, total, minimum, maximum = row[start:start + 4]
+            if aggregate == 'count':
+                return count
+            if aggregate in ('sum', 'avg') and not count:
+                return None
+            if aggregate == 'sum':
+                return total
+            if aggregate == 'avg':
+                return total / count
+            return minimum if aggregate == 'min' else maximum
+
+    # The rows are kept in term order, which the stable sort leaves the
+    # ties in
+    rows = snapshot['stats'][table]
+    known = sorted((row for row in rows if value(row) is not None),
+                   key=value, reverse=descending)
+    ordered = known + [row for row in rows if value(row) is None]
+    return ordered if limit is None else ordered[:limit]
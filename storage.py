@@ -0,0 +1,454 @@
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from utils import (language_groups, name_key, regime_groups, text_terms,
+                   timezone_groups, timezone_terms)
+
+# Insert a country or, if a country with the same name key is already
+# stored, update it in place keeping its id (and renaming it if its name
+# only differs by diacritics or case)
+UPSERT_COUNTRY = '''INSERT INTO countries
+    (name,
+    capital,
+    population,
+    density,
+    area,
+    neighbors,
+    languages,
+    timezone,
+    regime,
+    etag,
+    last_modified,
+    name_key,
+    content_hash)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(name_key) DO UPDATE SET
+    name = excluded.name,
+    capital = excluded.capital,
+    population = excluded.population,
+    density = excluded.density,
+    area = excluded.area,
+    neighbors = excluded.neighbors,
+    languages = excluded.languages,
+    timezone = excluded.timezone,
+    regime = excluded.regime,
+    etag = excluded.etag,
+    last_modified = excluded.last_modified,
+    name_key = excluded.name_key,
+    content_hash = excluded.content_hash'''
+
+# Columns of a country compared between two scrapes, in the order they
+# follow the name in the rows written by upsert_countries
+COUNTRY_FIELDS = ('capital', 'population', 'density', 'area', 'neighbors',
+                  'languages', 'timezone', 'regime')
+
+# Number of countries written to the database in one transaction
+BATCH_SIZE = 50
+
+# Side tables holding one row per country and term of a text column,
+# with the function splitting the column into terms
+TERM_TABLES = (
+    ('country_languages', 'languages', text_terms),
+    ('country_timezones', 'timezone', timezone_terms),
+    ('country_regimes', 'regime', text_terms),
+)
+# Side tables of the same form holding the groups of the statistics each
+# country is in: its languages, the UTC offsets of its timezone and its
+# whole regime (see utils.language_groups, timezone_groups, regime_groups)
+GROUP_TABLES = (
+    ('country_language_groups', 'languages', language_groups),
+    ('country_timezone_groups', 'timezone', timezone_groups),
+    ('country_regime_groups', 'regime', regime_groups),
+)
+# Numeric columns summarized for each group, a negative value standing for
+# an unknown one
+STATS_METRICS = ('population', 'area', 'density')
+# Summary tables of the group tables, holding for each group the number of
+# countries in it and the count of the known values, their sum, minimum
+# and maximum for each of STATS_METRICS, so that the statistics of the
+# groups are read in one row per group instead of aggregating every
+# country of the group
+STATS_TABLES = (
+    ('language_stats', 'country_language_groups'),
+    ('timezone_stats', 'country_timezone_groups'),
+    ('regime_stats', 'country_regime_groups'),
+)
+STATS_COLUMNS = ('countries',) + tuple(
+    f'{metric}_{aggregate}' for metric in STATS_METRICS
+    for aggregate in ('count', 'sum', 'min', 'max'))
+
+# Separator put between the neighbors of a country by parse_neighbors_text
+NEIGHBOR_SEPARATOR = ' / '
+# Other names the infoboxes give to some countries in their neighbors,
+# mapped to the name the country is stored with
+NEIGHBOR_ALIASES = {
+    'Azerbaidjan': 'Azerbaijan',
+    'Cehia': 'Republica Cehă',
+    'Guineea': 'Guinea',
+    'Guineea-Bissau': 'Guinea-Bissau',
+    'Kargazstan': 'Kîrgîzstan',
+    'Kazahstan': 'Kazakhstan',
+    'Kuweit': 'Kuwait',
+    'Micronezia': 'Statele Federate ale Microneziei',
+    'Regatul tarilor de Jos': 'Țările de Jos',
+    'Republica Congo': 'Congo',
+    'Republica Democratica Congo': 'Republica Democrată Congo',
+    'Republica Moldova': 'Moldova',
+    'Republica Populara Chineza': 'China',
+    'Taiwan': 'Republica China (Taiwan)',
+    'Trinidad si Tobago': 'Trinidad-Tobago',
+}
+# File giving the English name and the ISO 3166-1 alpha-2 and alpha-3
+# codes of the countries, by the name they are stored with
+ALIASES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'country_aliases.csv')
+
+
+def connect(database):
+    """
+    Open a connection used for writing the scraped countries. As the
+    database uses write-ahead logging (enabled by create_database), syncing
+    to disk only at checkpoints is safe and makes each batch cheaper.
+    :param database: Path of the database file
+    :return: The connection to the database
+    """
+
+    conn = sqlite3.connect(database)
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def bump_dataset_version(conn):
+    """
+    Increment the version stamp of the dataset, to be called in the
+    transaction of every write so that the API knows its cached responses
+    are out of date
+    :param conn: The connection to the database
+    """
+
+    conn.execute('UPDATE dataset_version SET version = version + 1')
+
+
+def fields_hash(fields):
+    """
+    Digest of the values of COUNTRY_FIELDS of a country, used to tell
+    whether a country changed without comparing every field. Floats without
+    a fractional part are hashed as the integers SQLite stores them as in
+    the INTEGER columns, so the digest of the values read back from the
+    database is the same as the digest of the parsed ones.
+    :param fields: The tuple of the values of the fields
+    :return: The digest as a hexadecimal string
+    """
+
+    values = [int(value) if isinstance(value, float) and value.is_integer()
+              else value for value in fields]
+    return hashlib.blake2b(json.dumps(values).encode('ascii'),
+                           digest_size=16).hexdigest()
+
+
+def load_known_countries(conn):
+    """
+    Read the countries already stored, with a single query
+    :param conn: The connection to the database
+    :return: A dict mapping each country name to its
+    (id, etag, last_modified) tuple
+    """
+
+    return {row[0]: row[1:] for row in conn.execute(
+        'SELECT name, id, etag, last_modified FROM countries')}
+
+
+def load_name_keys(conn):
+    """
+    Read the name keys the stored countries are known by, their own and the
+    ones of their aliases (see replace_aliases), used to find the country
+    a differently written name refers to
+    :param conn: The connection to the database
+    :return: A dict mapping each name key to the name the country is
+    stored with
+    """
+
+    names = dict(conn.execute(
+        'SELECT a.alias_key, c.name FROM country_aliases a '
+        'JOIN countries c ON c.id = a.country_id'))
+    # The names take precedence over the aliases, as in replace_aliases
+    names.update(conn.execute('SELECT name_key, name FROM countries'))
+    return names
+
+
+def replace_terms(conn, countries):
+    """
+    Index the text columns of the given countries in the term tables and
+    the group tables, replacing the terms and groups they had before
+    :param conn: The connection to the database
+    :param countries: The list of (id, languages, timezone, regime) tuples
+    """
+
+    ids = [(country[0],) for country in countries]
+    # Position of each text column in the tuples
+    positions = {'languages': 1, 'timezone': 2, 'regime': 3}
+    for table, column, split in TERM_TABLES + GROUP_TABLES:
+        index = positions[column]
+        conn.executemany(f'DELETE FROM {table} WHERE country_id = ?', ids)
+        conn.executemany(
+            f'INSERT INTO {table} (country_id, term) VALUES (?, ?)',
+            [(country[0], term)
+             for country in countries for term in split(country[index])])
+
+
+def stats_query(table, condition):
+    """
+    :param table: The group table the countries are grouped by
+    :param condition: The SQL condition choosing the (term, country)
+    rows of the table aggregated, using the alias t for the group table
+    :return: The query computing, for each group of the chosen rows, the
+    values of STATS_COLUMNS of its countries
+    """
+
+    aggregates = ['COUNT(*)']
+    for metric in STATS_METRICS:
+        known = f'CASE WHEN c.{metric} >= 0 THEN c.{metric} END'
+        aggregates.extend([f'COUNT({known})', f'COALESCE(SUM({known}), 0)',
+                           f'MIN({known})', f'MAX({known})'])
+    return (f'SELECT t.term, {", ".join(aggregates)} FROM {table} t '
+            f'JOIN countries c ON c.id = t.country_id WHERE {condition} '
+            f'GROUP BY t.term')
+
+
+def rebuild_stats(conn):
+    """
+    Compute the summary tables again from every country, when they are
+    created
+    :param conn: The connection to the database
+    """
+
+    for stats, table in STATS_TABLES:
+        conn.execute(f'DELETE FROM {stats}')
+        conn.execute(f'INSERT INTO {stats} (term, {", ".join(STATS_COLUMNS)}) '
+                     f'{stats_query(table, "1")}')
+
+
+def stats_groups(conn, ids):
+    """
+    :param conn: The connection to the database
+    :param ids: The list of the ids of the countries
+    :return: A dict mapping each summary table to the set of the terms of
+    the groups the countries are in
+    """
+
+    condition = f'country_id IN ({", ".join("?" * len(ids))})'
+    return {stats: {row[0] for row in conn.execute(
+        f'SELECT DISTINCT term FROM {table} WHERE {condition}', ids)}
+        for stats, table in STATS_TABLES}
+
+
+def refresh_stats(conn, groups):
+    """
+    Compute the given groups of the summary tables again from their
+    countries, the groups left without countries being dropped
+    :param conn: The connection to the database
+    :param groups: A dict mapping each summary table to the terms of its
+    groups, as returned by stats_groups
+    """
+
+    for stats, table in STATS_TABLES:
+        terms = sorted(groups[stats])
+        if not terms:
+            continue
+        placeholders = ", ".join("?" * len(terms))
+        conn.execute(f'DELETE FROM {stats} WHERE term IN ({placeholders})',
+                     terms)
+        conn.execute(
+            f'INSERT INTO {stats} (term, {", ".join(STATS_COLUMNS)}) '
+            f'{stats_query(table, f"t.term IN ({placeholders})")}', terms)
+
+
+def upsert_countries(conn, rows):
+    """
+    Write a batch of countries in a single transaction, inserting the new
+    ones and updating the stored ones whose fields changed, with their
+    terms, groups and summary tables. Each written field is recorded in
+    the country_changes log, and the countries that did not change are
+    left as they are.
+    :param conn: The connection to the database
+    :param rows: The list of (name, capital, population, density, area,
+    neighbors, languages, timezone, regime, etag, last_modified) tuples
+    :return: The list of the names of the countries written and the
+    number of milliseconds the write took
+    """
+
+    start = time.perf_counter()
+    keys = [name_key(row[0]) for row in rows]
+    placeholders = ", ".join("?" * len(keys))
+    stored = {row[0]: row[1:] for row in conn.execute(
+        f'SELECT name_key, id, content_hash, etag, last_modified, name, '
+        f'{", ".join(COUNTRY_FIELDS)} FROM countries '
+        f'WHERE name_key IN ({placeholders})', keys)}
+
+    changed = []
+    removed = []
+    validators = []
+    changes = []
+    changed_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    for row, key in zip(rows, keys):
+        fields = row[1:1 + len(COUNTRY_FIELDS)]
+        digest = fields_hash(fields)
+        old = stored.get(key)
+        if old is None:
+            changes.append((row[0], 'name', None, row[0]))
+        elif old[1] == digest and old[4] == row[0]:
+            if old[2:4] != row[-2:]:
+                validators.append(row[-2:] + (old[0],))
+            continue
+        else:
+            changes.extend(
+                (row[0], field, old_value, new_value)
+                for field, old_value, new_value in zip(
+                    ('name',) + COUNTRY_FIELDS, old[4:], row)
+                if old_value != new_value)
+            removed.append(old[0])
+        changed.append(row + (key, digest))
+
+    with conn:
+        conn.executemany('UPDATE countries SET etag = ?, last_modified = ? '
+                         'WHERE id = ?', validators)
+        if changed:
+            # The groups the changed countries leave and the ones they
+            # join are computed again
+            groups = stats_groups(conn, removed)
+            conn.executemany(UPSERT_COUNTRY, changed)
+            written = [row[0] for row in changed]
+            countries = conn.execute(
+                f'SELECT id, languages, timezone, regime FROM countries '
+                f'WHERE name IN ({", ".join("?" * len(written))})',
+                written).fetchall()
+            replace_terms(conn, countries)
+            for stats, terms in stats_groups(
+                    conn, [country[0] for country in countries]).items():
+                groups[stats] |= terms
+            refresh_stats(conn, groups)
+            bump_dataset_version(conn)
+            version = conn.execute(
+                'SELECT version FROM dataset_version').fetchone()[0]
+            conn.executemany(
+                'INSERT INTO country_changes (version, country, field, '
+                'old_value, new_value, changed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(version,) + change + (changed_at,) for change in changes])
+    return ([row[0] for row in changed],
+            (time.perf_counter() - start) * 1000)
+
+
+def replace_neighbors(conn):
+    """
+    Resolve the neighbors text of every country into links between country
+    ids in the country_neighbors table, replacing its previous content.
+    Names are matched without diacritics and case, directly or through
+    NEIGHBOR_ALIASES; the neighbors that are not countries of the table
+    (seas, organizations, parsing leftovers) are left out. The whole table
+    is rebuilt at once, as a neighbor may be written in a later batch than
+    the country listing it, and only if the links changed.
+    :param conn: The connection to the database
+    :return: The number of links written and of neighbors not resolved
+    """
+
+    countries = conn.execute(
+        'SELECT id, name, neighbors FROM countries ORDER BY id').fetchall()
+    ids = {}
+    for country_id, name, _ in countries:
+        if name:
+            ids.setdefault(name_key(name), country_id)
+    for alias, name in NEIGHBOR_ALIASES.items():
+        if name_key(name) in ids:
+            ids.setdefault(name_key(alias), ids[name_key(name)])
+
+    links = set()
+    unresolved = 0
+    for country_id, _, neighbors in countries:
+        if not neighbors:
+            continue
+        for neighbor in neighbors.split(NEIGHBOR_SEPARATOR):
+            neighbor_id = ids.get(name_key(neighbor))
+            if neighbor_id is None:
+                unresolved += 1
+            elif neighbor_id != country_id:
+                links.add((country_id, neighbor_id))
+
+    # Leave the table and the dataset version alone if nothing changed
+    if links == set(conn.execute(
+            'SELECT country_id, neighbor_id FROM country_neighbors')):
+        return len(links), unresolved
+    with conn:
+        conn.execute('DELETE FROM country_neighbors')
+        conn.executemany('INSERT INTO country_neighbors '
+                         '(country_id, neighbor_id) VALUES (?, ?)',
+                         sorted(links))
+        bump_dataset_version(conn)
+    return len(links), unresolved
+
+
+def load_aliases(path=ALIASES_FILE):
+    """
+    Read the other names the countries are known by: their English name
+    and ISO 3166-1 codes from the aliases file, and the other Romanian
+    names of NEIGHBOR_ALIASES
+    :param path: Path of the aliases file
+    :return: A list of (name, alias, kind) tuples, name being the name the
+    country is stored with and kind one of 'english', 'iso2', 'iso3' and
+    'romanian'
+    """
+
+    aliases = []
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.DictReader(file):
+            for kind, column in (('english', 'english'),
+                                 ('iso2', 'alpha_2'),
+                                 ('iso3', 'alpha_3')):
+                if row[column]:
+                    aliases.append((row['name'], row[column], kind))
+    aliases.extend((name, alias, 'romanian')
+                   for alias, name in NEIGHBOR_ALIASES.items())
+    return aliases
+
+
+def replace_aliases(conn, aliases=None):
+    """
+    Resolve the aliases of the countries into the country_aliases table,
+    replacing its previous content. Each alias is stored under its name
+    key, so it is looked up like a name; the aliases of countries that are
+    not stored are left out, and so are the ones whose key is already the
+    key of a stored name (names take precedence) or of an earlier alias.
+    Like replace_neighbors, the table and the dataset version are only
+    written if the aliases changed.
+    :param conn: The connection to the database
+    :param aliases: The list of (name, alias, kind) tuples, read with
+    load_aliases if None
+    :return: The number of aliases stored
+    """
+
+    if aliases is None:
+        aliases = load_aliases()
+    ids = dict(conn.execute('SELECT name_key, id FROM countries '
+                            'WHERE name_key IS NOT NULL'))
+    rows = {}
+    for name, alias, kind in aliases:
+        key = name_key(alias)
+        country_id = ids.get(name_key(name))
+        if country_id is not None and key and key not in ids:
+            rows.setdefault(key, (key, country_id, alias, kind))
+
+    if set(rows.values()) == set(conn.execute(
+            'SELECT alias_key, country_id, alias, kind '
+            'FROM country_aliases')):
+        return len(rows)
+    with conn:
+        conn.execute('DELETE FROM country_aliases')
+        conn.executemany('INSERT INTO country_aliases '
+                         '(alias_key, country_id, alias, kind) '
+                         'VALUES (?, ?, ?, ?)', sorted(rows.values()))
+        bump_dataset_version(conn)
+    return len(rows)
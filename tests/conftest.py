@@ -0,0 +1,60 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+# The modules of the project are at the root of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from create_database import DATABASE, create_database  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    A copy of the countries of the repository brought up to the current
+    schema, in a temporary directory
+    """
+
+    path = str(tmp_path / 'countries.db')
+    shutil.copy(os.path.join(ROOT, DATABASE), path)
+    create_database(path)
+    return path
+
+
+def reset_api():
+    """
+    Drop the connections and the data the API keeps between the requests,
+    so that the next request reads its database again
+    """
+
+    import api
+    import graph
+    import http_cache
+    import name_index
+    import snapshot
+
+    while not api._pool.empty():
+        api._pool.get_nowait().close()
+    snapshot._snapshot = None
+    graph._graph = None
+    name_index._index = None
+    http_cache._version = None
+    http_cache.clear()
+
+
+@pytest.fixture
+def client(database, monkeypatch):
+    """
+    A test client of the API serving the database fixture
+    """
+
+    import api
+
+    monkeypatch.setitem(api.app.config, 'DATABASE', database)
+    reset_api()
+    with api.app.test_client() as test_client:
+        yield test_client
+    reset_api()
@@ -0,0 +1,422 @@
+"""
+Builders of the corpora of benchmark_data the tests compare the parsers
+with. Run "python tests/corpora.py utils" to write the golden outputs of
+utils.py again from the current implementation, after a deliberate change
+of a parser, "python tests/corpora.py infobox" to write the fields of the
+information box corpus the same way, or "python tests/corpora.py dump" to
+write the sample dump.
+"""
+
+import argparse
+import bz2
+import gzip
+import json
+import os
+import random
+import sqlite3
+import sys
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+# The modules of the project are at the root of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from create_database import DATABASE  # noqa: E402
+
+# Inputs of the utils parsers together with their expected outputs
+UTILS_GOLDEN = os.path.join(ROOT, 'benchmark_data', 'utils_golden.json')
+# Country pages made of wikipedia-like information boxes, together with
+# the fields parsed from each one
+INFOBOX_CORPUS = os.path.join(ROOT, 'benchmark_data',
+                              'infobox_corpus.json.gz')
+# Pages-articles dump of wikipedia-like articles, the countries of the
+# database among a few pages the dump ingestion has to skip
+SAMPLE_DUMP = os.path.join(ROOT, 'benchmark_data',
+                           'rowiki-sample-pages-articles.xml.bz2')
+
+
+def read_countries(database):
+    """
+    :param database: Path of the database the values are read from
+    :return: The (name, capital, population, density, area, neighbors,
+    languages, timezone, regime) rows of its countries, in id order
+    """
+
+    conn = sqlite3.connect(database)
+    rows = conn.execute(
+        'SELECT name, capital, population, density, area, neighbors, '
+        'languages, timezone, regime FROM countries ORDER BY id').fetchall()
+    conn.close()
+    return rows
+
+
+def build_utils_corpus(database=os.path.join(ROOT, DATABASE), seed=0):
+    """
+    Build inputs for each function of utils.py out of the values stored in
+    the database, adding the noise found in raw wikipedia text: references,
+    superscripts, zero width spaces, diacritics, coordinates, notes and
+    irregular whitespace
+    :param database: Path of the database the values are read from
+    :param seed: Seed of the random generator, for a reproducible corpus
+    :return: A dict mapping each function name to its list of inputs
+    """
+
+    rng = random.Random(seed)
+    rows = read_countries(database)
+
+    diacritics = {'a': 'ăâĂÂ', 'i': 'îÎ', 's': 'șȘ', 't': 'țȚ'}
+    noises = ['[1]', '[nota 2]', '[12][13]', '¹', '²³', '\u200b', '\ufeff',
+              ' 4 ', '7', '\n', '\t', '  ', ' ,', ', ', '( )', '{{PAGENAME}}',
+              '(din 1862)', '(note a)', '44.43°N', '26°06′E', ')x', ' - ',
+              '+ ', ' +', 'Ş', 'ţ', 'é']
+
+    def noisy(text):
+        characters = []
+        for character in text:
+            if character in diacritics and rng.random() < 0.2:
+                character = rng.choice(diacritics[character])
+            characters.append(character)
+            if rng.random() < 0.08:
+                characters.append(rng.choice(noises))
+        return ''.join(characters)
+
+    def number(value, unit):
+        text = f"{value:,}".replace(',', rng.choice(['.', ' ', ',', '']))
+        if rng.random() < 0.3:
+            text += rng.choice([',5', '.25', ' 1/2'])
+        return (text + rng.choice([' ', '', '\u00a0']) + unit
+                + rng.choice(['', '[2]', ' (2020)', '[nota 1] (2011)']))
+
+    corpus = {name: [] for name in (
+        'remove_diacritics', 'general_parse', 'parse_capital_text',
+        'parse_neighbors_text', 'parse_languages_text', 'parse_timezone',
+        'parse_wikipedia_number_string_to_int',
+        'parse_density_string_to_int', 'parse_population_string_to_int')}
+    for (_, capital, _, density, area, neighbors, languages, timezone,
+         regime) in rows:
+        texts = [capital, neighbors, languages, timezone, regime]
+        for text in texts:
+            corpus['remove_diacritics'].append(noisy(text))
+            corpus['general_parse'].append(noisy(text))
+        corpus['parse_capital_text'].append(noisy(capital))
+        corpus['parse_neighbors_text'].append(
+            noisy(neighbors.replace(' / ', rng.choice(['', '\n', ' ']))))
+        corpus['parse_languages_text'].append(noisy(languages))
+        corpus['parse_timezone'].append(noisy(timezone))
+        corpus['parse_wikipedia_number_string_to_int'].append(
+            number(abs(area), rng.choice(['km²', 'km2', 'kmp'])))
+        corpus['parse_density_string_to_int'].append(
+            number(abs(density), rng.choice(['loc./km²', 'locuitori/km2'])))
+        corpus['parse_population_string_to_int'].append(
+            f"{rng.randrange(10 ** 9):,}".replace(',', rng.choice('. ,')))
+
+    # The keys and terms the countries are looked up and grouped by, from
+    # the stored values as well as noisy ones, drawn from a generator of
+    # their own so that the inputs above stay the same
+    rng = random.Random(seed + 1)
+    for name in ('name_key', 'text_terms', 'timezone_terms',
+                 'language_groups', 'timezone_groups', 'regime_groups'):
+        corpus[name] = []
+    for (name, _, _, _, _, neighbors, languages, timezone,
+         regime) in rows:
+        corpus['name_key'] += [name, noisy(name).upper()]
+        corpus['text_terms'] += [languages, regime, noisy(neighbors)]
+        corpus['timezone_terms'] += [timezone, noisy(timezone)]
+        corpus['language_groups'] += [languages, noisy(languages)]
+        corpus['timezone_groups'] += [timezone, noisy(timezone)]
+        corpus['regime_groups'] += [regime, noisy(regime)]
+    corpus['name_key'] += ['', 'ȘTEFAN  cel Mare', 'Côte d’Ivoire']
+    corpus['text_terms'] += [None, '', 'limba ROMÂNĂ; maghiară']
+    corpus['timezone_terms'] += [
+        None, '', 'UTC', 'GMT', 'UTC 1', 'UTC +1', 'UTC−5', 'UTC+5:30',
+        'UTC+5½', 'UTC±0', '+2', 'CET ( UTC+1 ) DST UTC+2']
+    return corpus
+
+
+def write_utils_golden(path=UTILS_GOLDEN):
+    """
+    Write each input of build_utils_corpus with the output the current
+    implementation returns for it
+    :param path: Path of the golden file
+    """
+
+    import utils
+
+    golden = {name: [[value, getattr(utils, name)(value)]
+                     for value in values]
+              for name, values in build_utils_corpus().items()}
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(golden, file, ensure_ascii=False, indent=1)
+
+
+def build_sample_dump(database=os.path.join(ROOT, DATABASE), seed=0):
+    """
+    Build a pages-articles dump shaped like the dumps of ro.wikipedia.org:
+    an article for each country of the database, its information box
+    written with the wikitext found in the articles (links, references,
+    templates, comments, lists, parameters the ingestion does not read),
+    together with a redirect, a template page and an article without a
+    country information box, which the ingestion has to skip
+    :param database: Path of the database the values are read from
+    :param seed: Seed of the random generator, for a reproducible dump
+    :return: A generator of the chunks of the XML text
+    """
+
+    rng = random.Random(seed)
+    rows = read_countries(database)
+    # The different spellings of the template name found in the articles
+    templates = ['Infocaseta Țară', 'Infocaseta Ţară', 'infocaseta țară',
+                 'Infocaseta_Țară']
+
+    def reference():
+        if rng.random() < 0.4:
+            return ''
+        return ('<ref>{{Citat web|url=https://www.insse.ro/|titlu=Date '
+                f'statistice|accesdata={rng.randrange(1, 28)} mai 2023}}}}'
+                '</ref>')
+
+    def number(value):
+        return (f'{{{{formatnum:{value}}}}}' if rng.random() < 0.5
+                else str(value))
+
+    def link(text, label=None):
+        # The few stored values holding brackets are written as they are
+        if '[' in text or ']' in text:
+            return label or text
+        return f'[[{text}|{label}]]' if label else f'[[{text}]]'
+
+    def page(identifier, title, namespace, text, redirect=None):
+        return ''.join([
+            '  <page>\n',
+            f'    <title>{escape(title)}</title>\n',
+            f'    <ns>{namespace}</ns>\n',
+            f'    <id>{identifier}</id>\n',
+            f'    <redirect title="{escape(redirect)}" />\n'
+            if redirect else '',
+            '    <revision>\n',
+            f'      <id>{identifier * 10}</id>\n',
+            '      <timestamp>2024-05-01T00:00:00Z</timestamp>\n',
+            '      <model>wikitext</model>\n',
+            '      <format>text/x-wiki</format>\n',
+            f'      <text bytes="{len(text.encode())}" '
+            f'xml:space="preserve">{escape(text)}</text>\n',
+            '    </revision>\n',
+            '  </page>\n'])
+
+    yield ('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/" '
+           'version="0.11" xml:lang="ro">\n'
+           '  <siteinfo>\n'
+           '    <sitename>Wikipedia</sitename>\n'
+           '    <dbname>rowiki</dbname>\n'
+           '    <namespaces>\n'
+           '      <namespace key="0" case="first-letter" />\n'
+           '      <namespace key="10" case="first-letter">Format</namespace>\n'
+           '    </namespaces>\n'
+           '  </siteinfo>\n')
+    yield page(1, 'Format:Infocaseta Țară', 10,
+               '{{Infocaseta Țară\n|capitala = {{{capitala|}}}\n}}')
+    yield page(2, 'Romania', 0, '#REDIRECT [[România]]',
+               redirect='România')
+    yield page(3, 'București', 0,
+               '{{Infocaseta Așezare\n|nume = București\n'
+               '|populație = 1716961\n}}\n'
+               "'''București''' este capitala [[România|României]].")
+    identifier = 4
+    for (name, capital, population, density, area, neighbors,
+         languages, timezone, regime) in rows:
+        parameters = [
+            ('nume_nativ', f"''{name}''"),
+            ('imagine_drapel', f"Flag of {name}.svg"),
+            ('imn_național', '[[Imnul național]]' + reference()),
+            ('monedă', '[[Euro]] (EUR)'),
+            ('suprafață_apă', f'{rng.randrange(1, 10)},'
+                              f'{rng.randrange(10)}'),
+            ('prefix_telefonic', f'+{rng.randrange(1, 999)}'),
+        ]
+        if capital != "Unknown":
+            coordinates = ''
+            if rng.random() < 0.5:
+                coordinates = ('<br />{{coord|'
+                               f'{rng.randrange(90)}|{rng.randrange(60)}'
+                               f'|N|{rng.randrange(180)}|'
+                               f'{rng.randrange(60)}|E|type:city}}}}')
+            parameters.append(('capitala', link(capital)
+                               + reference() + coordinates))
+        if languages != "Unknown":
+            parameters.append(('limbi_oficiale', ', '.join(
+                link(f'Limba {language.strip()}', language.strip())
+                for language in languages.split(',')) + reference()))
+        if regime != "Unknown":
+            parameters.append(('sistem_politic', link(regime)))
+        if area != -1:
+            parameters.append(('suprafață_totală',
+                               number(area) + reference()))
+        if population is not None and population != -1:
+            parameters.append(('populație_estimare',
+                               number(population) + reference()))
+            parameters.append(('populație_estimare_an', '2023'))
+        # A density computed by the scraper from the population and the
+        # area is left out, the ingestion computes it the same way
+        if density != -1.0 and density == int(density):
+            parameters.append(('densitate', str(int(density))))
+        if timezone != "Unknown":
+            parameters.append(('fus_orar', timezone if rng.random() < 0.5
+                               else f'{{{{nowrap|{timezone}}}}}'))
+        if neighbors != "Unknown":
+            neighbor_names = neighbors.split(' / ')
+            if rng.random() < 0.5:
+                parameters.append(('vecini', '{{plainlist|\n' + ''.join(
+                    f'* {link(neighbor)}\n'
+                    for neighbor in neighbor_names) + '}}'))
+            else:
+                parameters.append(('vecini', '<br />'.join(
+                    link(neighbor) for neighbor in neighbor_names)))
+        rng.shuffle(parameters)
+        infobox = ('{{' + rng.choice(templates) + '\n' + ''.join(
+            f'|{parameter} = {value}\n'
+            for parameter, value in parameters) + '}}\n')
+        article = (f"'''{name}''' este o țară situată în [[Europa]]"
+                   f"{reference()}, cu capitala la {link(capital)}. "
+                   "<!-- de verificat | sursa -->\n") * rng.randrange(3, 10)
+        yield page(identifier, name, 0,
+                   infobox + article + '\n[[Categorie:Țări]]')
+        identifier += 1
+    yield '</mediawiki>\n'
+
+
+def write_sample_dump(path=SAMPLE_DUMP):
+    """
+    Write the dump built by build_sample_dump compressed with bz2
+    :param path: Path of the dump file
+    """
+
+    with bz2.open(path, 'wt', encoding='utf-8') as output:
+        for chunk in build_sample_dump():
+            output.write(chunk)
+
+
+def build_infobox_corpus(database=os.path.join(ROOT, DATABASE),
+                         seed=0):
+    """
+    Build a country page for each country of the database shaped like the
+    pages of ro.wikipedia.org: the information box marked up the way
+    wikipedia renders it (links, references, flag icons, non-breaking
+    spaces, line breaks, rows the scraper does not read) followed by a
+    few paragraphs of article text
+    :param database: Path of the database the values are read from
+    :param seed: Seed of the random generator, for a reproducible corpus
+    :return: A list of (url path, HTML text) pairs
+    """
+
+    rng = random.Random(seed)
+    rows = read_countries(database)
+    references = [0]
+
+    def reference():
+        if rng.random() < 0.4:
+            return ''
+        references[0] += 1
+        return (f'<sup id="cite_ref-{references[0]}" class="reference">'
+                f'<a href="#cite_note-{references[0]}">'
+                f'[{references[0]}]</a></sup>')
+
+    def link(text):
+        return (f'<a href="/wiki/{quote(text.replace(" ", "_"))}" '
+                f'title="{text}">{text}</a>')
+
+    def number(value):
+        return f"{value:,}".replace(',', '.')
+
+    def row(title, value, header_class=''):
+        return (f'<tr><th scope="row"{header_class}>{title}</th>'
+                f'<td>{value}</td></tr>')
+
+    paragraph = (
+        '<p><b>{name}</b> este o țară situată în <a href="/wiki/Europa">'
+        'Europa</a>{reference}, cu capitala la {capital}. Are o populație '
+        'de {population} de locuitori.</p>')
+    pages = []
+    for (name, capital, population, density, area, neighbors, languages,
+         timezone, regime) in rows:
+        neighbor_names = neighbors.split(' / ') if neighbors else []
+        capital_html = link(capital) + reference()
+        if rng.random() < 0.5:
+            capital_html += ('<br><span class="geo-dms">'
+                             f'{rng.randrange(90)}°{rng.randrange(60)}′N '
+                             f'{rng.randrange(180)}°{rng.randrange(60)}′E'
+                             '</span>')
+        infobox = ''.join([
+            '<table class="infocaseta" style="width:22em">',
+            f'<caption>{name}</caption>',
+            '<tr><td colspan="2"><span class="flagicon"><img alt="Drapel" '
+            'src="//upload.wikimedia.org/flag.svg" width="125"></span>'
+            '</td></tr>',
+            row('Imn național', link('Imnul național') + reference()),
+            row('Capitala', capital_html),
+            row('Cel mai mare oraș', link(capital)),
+            row('Limbi oficiale', '<br>'.join(
+                link(language.strip()) for language
+                in languages.split(',')) + reference()),
+            row('Sistem politic', link(regime) + reference()),
+            '<tr class="mergedtoprow"><th>Suprafață</th><td></td></tr>',
+            row('&#160;-&#160;Total', f'{number(area)}&#160;km²'
+                + reference()),
+            row('&#160;-&#160;Apă (%)', f'{rng.randrange(1, 10)},'
+                                        f'{rng.randrange(10)}'),
+            '<tr class="mergedtoprow"><th>Populație</th><td></td></tr>',
+            row('&#160;-&#160;Estimare', f'{number(population or 0)}'
+                + reference()),
+            row('&#160;-&#160;Densitate', f'{density}&#160;loc./km²'),
+            row('PIB (PPC)', f'{rng.randrange(10, 900)} miliarde $'
+                + reference()),
+            row('Monedă', link('Euro')),
+            row('Fus orar', f'{timezone}<br>'
+                            f'<small>(ora de vară {timezone})</small>'),
+            row('Vecini', '<br>'.join(link(neighbor)
+                                      for neighbor in neighbor_names)),
+            row('Prefix telefonic', f'+{rng.randrange(1, 999)}'),
+            '</table>'])
+        article = paragraph.format(
+            name=name, reference=reference(), capital=link(capital),
+            population=number(population or 0)) * rng.randrange(3, 10)
+        pages.append((
+            "/wiki/" + quote(name.replace(" ", "_")),
+            '<html><body><div class="mw-parser-output">' + infobox
+            + article + '</div></body></html>'))
+    return pages
+
+
+def write_infobox_corpus(path=INFOBOX_CORPUS):
+    """
+    Write the information box corpus with the fields parse_country_details
+    extracts from each page, for the tests to compare with
+    :param path: The path of the gzip compressed JSON file
+    """
+
+    from scraper import parse_country_details
+
+    corpus = [[page_path, html, list(parse_country_details(html))]
+              for page_path, html in build_infobox_corpus()]
+    # The timestamp of the gzip header is left out, so that writing the
+    # same corpus again gives the same file
+    with open(path, 'wb') as file, \
+            gzip.GzipFile(fileobj=file, mode='wb', mtime=0) as output:
+        output.write(json.dumps(corpus, ensure_ascii=False,
+                                indent=1).encode('utf-8'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Write the corpora of benchmark_data again")
+    parser.add_argument('corpus', choices=['utils', 'infobox', 'dump'])
+    arguments = parser.parse_args()
+    if arguments.corpus == 'utils':
+        write_utils_golden()
+        print(f"golden outputs written to {UTILS_GOLDEN}")
+    elif arguments.corpus == 'infobox':
+        write_infobox_corpus()
+        print(f"information box corpus written to {INFOBOX_CORPUS}")
+    else:
+        write_sample_dump()
+        print(f"sample dump written to {SAMPLE_DUMP}")
@@ -0,0 +1,94 @@
+import pytest
+
+import api
+import benchmark
+import snapshot
+from conftest import reset_api
+from storage import connect, upsert_countries
+
+
+@pytest.mark.parametrize('text_search, in_snapshot', [
+    ('terms', False), ('terms', True), ('like', False)])
+def test_timezone_search_with_unencoded_plus(client, monkeypatch,
+                                             text_search, in_snapshot):
+    # An unencoded "+" reaches the route as a space: "UTC 1" is searched
+    # as "UTC+1" and not as a plain "UTC" matching the UTC+0 countries
+    monkeypatch.setitem(api.app.config, 'TEXT_SEARCH', text_search)
+    monkeypatch.setitem(api.app.config, 'SNAPSHOT', in_snapshot)
+    names = {row['name'] for row in client.get(
+        '/tarile-cu-fus-orar?fus_orar=UTC+1').get_json()}
+    encoded = {row['name'] for row in client.get(
+        '/tarile-cu-fus-orar?fus_orar=UTC%2B1').get_json()}
+    assert 'Portugalia' not in names
+    assert 'Regatul Unit' not in names
+    if text_search == 'terms':
+        assert names == encoded
+        assert 'Germania' in names
+
+
+@pytest.mark.parametrize('grouping', ['fus_orar', 'limba', 'sistem_politic'])
+def test_group_stats_of_the_snapshot_equal_the_database(
+        client, database, monkeypatch, grouping):
+    # Write some countries first, so the summary tables were updated by
+    # the writes and not only built by create_database
+    conn = connect(database)
+    rows = conn.execute(
+        'SELECT name, capital, population, density, area, neighbors, '
+        'languages, timezone, regime, etag, last_modified FROM countries '
+        'ORDER BY id LIMIT 30').fetchall()
+    upsert_countries(conn, [
+        row[:2] + (row[2] * 3 // 2, round(row[3] * 1.5 + 0.3, 1))
+        + row[4:6] + rows[-index - 1][6:9] + row[9:]
+        for index, row in enumerate(rows)])
+    conn.close()
+    reset_api()
+
+    results = {}
+    for in_snapshot in (False, True):
+        monkeypatch.setitem(api.app.config, 'SNAPSHOT', in_snapshot)
+        for criterion in ('populatie', 'densitate', 'suprafata'):
+            response = client.get(f'/statistici-tari?grupare={grouping}'
+                                  f'&criteriu={criterion}&agregare=medie')
+            assert response.status_code == 200
+            results[in_snapshot, criterion] = response.get_json()
+    for criterion in ('populatie', 'densitate', 'suprafata'):
+        assert results[True, criterion] == results[False, criterion]
+
+
+@pytest.mark.parametrize('in_snapshot', [False, True])
+def test_batch_request_equals_the_separate_ones(client, monkeypatch,
+                                                in_snapshot):
+    monkeypatch.setitem(api.app.config, 'SNAPSHOT', in_snapshot)
+    names = ['China', 'Japonia', 'Romania', 'DEU', 'Franta']
+    separate = {}
+    for name in names:
+        capital = client.get('/capitala-tarii', query_string={'tara': name})
+        neighbors = client.get('/tarile-vecine-pentru',
+                               query_string={'tara': name})
+        separate[name] = (capital.get_json()[0]['capital'],
+                          neighbors.get_json()[0]['neighbors'])
+    response = client.post('/interogare-tari', json={
+        'tari': names, 'campuri': ['capitala', 'vecini']})
+    assert response.status_code == 200
+    assert {result['tara']: (result['capital'], result['neighbors'])
+            for result in response.get_json()} == separate
+
+
+def test_mapped_snapshot_answers_like_the_database(client, database,
+                                                   monkeypatch, tmp_path):
+    monkeypatch.setitem(api.app.config, 'RESPONSE_CACHE_SIZE', 0)
+    monkeypatch.setitem(api.app.config, 'SNAPSHOT', True)
+    bodies = {}
+    for mode in ('database', 'mapped'):
+        if mode == 'mapped':
+            path = str(tmp_path / 'countries.snapshot')
+            snapshot.write_snapshot(database, path)
+            monkeypatch.setitem(api.app.config, 'SNAPSHOT_FILE', path)
+            reset_api()
+        responses = [client.get(path) for path in benchmark.API_REQUESTS]
+        responses.append(client.post('/interogare-tari', json={
+            'tari': ['China', 'Japnia', 'Atlantida'],
+            'campuri': ['capitala', 'vecini', 'populatie']}))
+        assert all(response.status_code == 200 for response in responses)
+        bodies[mode] = [response.get_data() for response in responses]
+    assert bodies['mapped'] == bodies['database']
@@ -0,0 +1,83 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from conftest import ROOT
+from create_database import DATABASE, create_database
+
+
+@pytest.fixture
+def legacy(tmp_path):
+    # A copy of the database in the form it is shipped in, with the
+    # countries table alone
+    path = str(tmp_path / 'legacy.db')
+    shutil.copy(os.path.join(ROOT, DATABASE), path)
+    return path
+
+
+def copy_country(database, name, new_name):
+    conn = sqlite3.connect(database)
+    conn.execute(
+        'INSERT INTO countries (name, capital, population, density, area, '
+        'neighbors, languages, timezone, regime) SELECT ?, capital, '
+        'population, density, area, neighbors, languages, timezone, regime '
+        'FROM countries WHERE name = ?', (new_name, name))
+    conn.commit()
+    conn.close()
+
+
+def read_countries(database):
+    conn = sqlite3.connect(database)
+    rows = conn.execute(
+        'SELECT id, name, capital, population FROM countries ORDER BY id'
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def test_duplicate_names_are_not_deleted(legacy):
+    copy_country(legacy, 'Germania', 'Germania')
+    rows = read_countries(legacy)
+    with pytest.raises(ValueError, match='Germania, Germania'):
+        create_database(legacy)
+    assert read_countries(legacy) == rows
+
+    # Once the duplicate is resolved the database is migrated
+    conn = sqlite3.connect(legacy)
+    conn.execute("UPDATE countries SET name = 'Germania (copie)' "
+                 "WHERE id = ?", (rows[-1][0],))
+    conn.commit()
+    conn.close()
+    create_database(legacy)
+    assert len(read_countries(legacy)) == len(rows)
+
+
+def test_colliding_name_keys_are_not_deleted(legacy):
+    copy_country(legacy, 'România', 'ROMANIA')
+    rows = read_countries(legacy)
+    with pytest.raises(ValueError, match='România, ROMANIA'):
+        create_database(legacy)
+    assert read_countries(legacy) == rows
+    conn = sqlite3.connect(legacy)
+    assert conn.execute('SELECT COUNT(*) FROM countries '
+                        'WHERE name_key IS NOT NULL').fetchone()[0] == 0
+    conn.close()
+
+
+def test_non_unique_name_key_index_is_replaced(database):
+    # The name_key index of older versions was not unique
+    conn = sqlite3.connect(database)
+    conn.execute('DROP INDEX countries_name_key')
+    conn.execute('CREATE INDEX countries_name_key ON countries (name_key)')
+    conn.commit()
+    conn.close()
+    rows = read_countries(database)
+    create_database(database)
+    assert read_countries(database) == rows
+    conn = sqlite3.connect(database)
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("UPDATE countries SET name_key = 'ROMANIA' "
+                     "WHERE name = 'Germania'")
+    conn.close()
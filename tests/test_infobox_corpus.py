@@ -0,0 +1,17 @@
+import pytest
+
+from corpora import INFOBOX_CORPUS
+from html_backends import BACKENDS
+from scraper import parse_country_details
+
+import benchmark
+
+CORPUS = benchmark.load_infobox_corpus(INFOBOX_CORPUS)
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+def test_infobox_corpus_fields(backend):
+    # Every backend extracts the fields stored with each page
+    wrong = [path for path, html, fields in CORPUS
+             if list(parse_country_details(html, backend)) != fields]
+    assert wrong == []
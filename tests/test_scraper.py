@@ -0,0 +1,304 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+import pytest
+import requests
+
+import scraper
+from create_database import create_database
+from html_backends import BACKENDS
+from storage import connect
+
+# Path of the page listing the countries on the stub server
+LIST_PATH = '/wiki/Lista_tarilor'
+# Number of countries of the database served by the stub server
+COUNTRIES = 8
+
+
+class StubWikipedia(ThreadingHTTPServer):
+    """
+    Local HTTP server answering like ro.wikipedia.org with the pages
+    given to it: with an ETag on each page and 304 for a conditional
+    request of an unchanged page. The requests of each path are counted,
+    and a path can be made to fail with a list of (status, headers)
+    answers given before its page, or with the same answer every time.
+    """
+
+    def __init__(self, pages):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.pages = pages
+        self.requests = {}
+        self.failures = {}
+        self.always_failing = {}
+        self.lock = threading.Lock()
+        self.base_url = f"http://127.0.0.1:{self.server_port}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests[self.path] = server.requests.get(
+                self.path, 0) + 1
+            failures = server.failures.get(self.path)
+            failure = (failures.pop(0) if failures
+                       else server.always_failing.get(self.path))
+        if failure:
+            status, headers = failure
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        html = server.pages.get(self.path)
+        if html is None:
+            self.send_error(404)
+            return
+        body = html.encode('utf-8')
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def build_pages(rows):
+    """
+    :param rows: The (name, capital, population, density, area, neighbors,
+    languages, timezone, regime) rows of the countries
+    :return: A dict mapping the path of the list page and of the page of
+    each country to its HTML, shaped like the pages of ro.wikipedia.org
+    """
+
+    pages = {}
+    table_rows = ['<tr><th>Nr.</th><th>Țara</th><th>Populație</th></tr>']
+    for index, (name, capital, population, density, area, neighbors,
+                languages, timezone, regime) in enumerate(rows, start=1):
+        path = '/wiki/' + quote(name.replace(' ', '_'))
+        table_rows.append(
+            f'<tr><td>{index}</td><td><a href="{path}">{name}</a></td>'
+            f'<td>{population:,}</td></tr>'.replace(',', '.'))
+        pages[path] = (
+            '<html><body><table class="infocaseta">'
+            '<tr><th>Suprafață</th><td></td></tr>'
+            f'<tr><th>Total</th><td>{area} km²</td></tr>'
+            f'<tr><th>Densitate</th><td>{density} loc./km²</td></tr>'
+            f'<tr><th>Capitala</th><td>{capital}</td></tr>'
+            f'<tr><th>Vecini</th><td>{neighbors}</td></tr>'
+            f'<tr><th>Limbi oficiale</th><td>{languages}</td></tr>'
+            f'<tr><th>Fus orar</th><td>{timezone}</td></tr>'
+            f'<tr><th>Sistem politic</th><td>{regime}</td></tr>'
+            '</table></body></html>')
+    pages[LIST_PATH] = (
+        '<html><body><table class="wikitable"><tbody>'
+        + ''.join(table_rows) + '</tbody></table></body></html>')
+    return pages
+
+
+@pytest.fixture
+def countries(database):
+    conn = sqlite3.connect(database)
+    rows = conn.execute(
+        'SELECT name, capital, population, density, area, neighbors, '
+        'languages, timezone, regime FROM countries '
+        'WHERE population > 0 AND area > 0 ORDER BY id LIMIT ?',
+        (COUNTRIES,)).fetchall()
+    conn.close()
+    return rows
+
+
+@pytest.fixture
+def stub(countries):
+    server = StubWikipedia(build_pages(countries))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def target(tmp_path):
+    # An empty database the scraper writes to
+    path = str(tmp_path / 'scraped.db')
+    create_database(path)
+    conn = connect(path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    # The delays the scraper would wait before its retries, not waited
+    waited = []
+    retry_delay = scraper.retry_delay
+
+    def record_delay(attempt, response=None):
+        waited.append(retry_delay(attempt, response))
+        return 0
+
+    monkeypatch.setattr(scraper, 'retry_delay', record_delay)
+    return waited
+
+
+def scrape(stub, target, tmp_path, cache_directory=None, **options):
+    return scraper.scrape_wikipedia(
+        min_interval=0, base_url=stub.base_url,
+        countries_table_url=stub.base_url + LIST_PATH, connection=target,
+        cache_directory=cache_directory,
+        journal=str(tmp_path / 'journal.db'), **options)
+
+
+def country_path(name):
+    return '/wiki/' + quote(name.replace(' ', '_'))
+
+
+@pytest.mark.parametrize('options', [
+    {}, {'workers': 4}, {'workers': 4, 'parse_workers': 2, 'queue_size': 2}])
+def test_scrape_and_revalidate(stub, target, tmp_path, countries, options):
+    stats = scrape(stub, target, tmp_path, **options)
+    assert (stats['fetched'], stats['parsed'], stats['written'],
+            stats['failed']) == (COUNTRIES, COUNTRIES, COUNTRIES, 0)
+    rows = target.execute(
+        'SELECT name, capital, timezone FROM countries ORDER BY id'
+    ).fetchall()
+    assert rows == [(name, capital, timezone) for name, capital, _, _, _,
+                    _, _, timezone, _ in countries]
+
+    # A second run only revalidates the pages, which did not change
+    stats = scrape(stub, target, tmp_path, **options)
+    assert (stats['fetched'], stats['not_modified'], stats['parsed'],
+            stats['written']) == (COUNTRIES, COUNTRIES, 0, 0)
+
+
+def test_retry_after_is_honored(stub, countries, delays):
+    path = country_path(countries[0][0])
+    stub.failures[path] = [(429, {'Retry-After': '7'}),
+                           (503, {'Retry-After': '3'})]
+    html, _, _, attempts = scraper.fetch_page(stub.base_url + path, 0)
+    assert html == stub.pages[path]
+    assert attempts == 3
+    assert stub.requests[path] == 3
+    assert delays == [7, 3]
+
+
+def test_failed_page_gives_up_after_the_retries(stub, countries, delays):
+    path = country_path(countries[0][0])
+    stub.always_failing[path] = (503, {})
+    with pytest.raises(scraper.FetchError) as error:
+        scraper.fetch_page(stub.base_url + path, 0, retries=2)
+    assert error.value.attempts == 3
+    assert error.value.retryable
+    assert stub.requests[path] == 3
+    assert len(delays) == 2
+
+
+def test_circuit_breaker_opens(stub, countries, delays, monkeypatch):
+    monkeypatch.setattr(scraper, 'BREAKER_THRESHOLD', 3)
+    failing = country_path(countries[0][0])
+    stub.always_failing[failing] = (503, {})
+    with pytest.raises(scraper.FetchError):
+        scraper.fetch_page(stub.base_url + failing, 0, retries=10)
+    # The circuit opened after the third failure in a row
+    assert stub.requests[failing] == 3
+
+    # The other pages of the host fail at once, without any request
+    other = country_path(countries[1][0])
+    with pytest.raises(scraper.FetchError) as error:
+        scraper.fetch_page(stub.base_url + other, 0)
+    assert error.value.attempts == 0
+    assert other not in stub.requests
+
+
+def test_resumed_run_only_fetches_the_remaining_pages(
+        stub, target, tmp_path, countries, delays):
+    failing = [country_path(name) for name, *_ in countries[2:5]]
+    for path in failing:
+        stub.always_failing[path] = (503, {})
+    stats = scrape(stub, target, tmp_path, retries=0)
+    assert stats['failed'] == len(failing)
+    assert stats['written'] == COUNTRIES - len(failing)
+
+    # The next run resumes the journal run: no list page, and only the
+    # pages that failed are requested again
+    stub.always_failing.clear()
+    stub.requests.clear()
+    stats = scrape(stub, target, tmp_path, retries=0)
+    assert sorted(stub.requests) == sorted(failing)
+    assert (stats['fetched'], stats['written'], stats['failed']) == (
+        len(failing), len(failing), 0)
+    assert target.execute(
+        'SELECT COUNT(*) FROM countries').fetchone()[0] == COUNTRIES
+
+
+def test_unreachable_list_page(stub, target, tmp_path, delays):
+    stub.always_failing[LIST_PATH] = (503, {'Retry-After': '1'})
+    assert scrape(stub, target, tmp_path, retries=1) is None
+    assert stub.requests[LIST_PATH] == 2
+    assert delays == [1]
+
+
+def test_retry_delay_of_a_failed_response():
+    # A failed response is falsy, its Retry-After must still be used
+    response = requests.Response()
+    response.status_code = 429
+    response.headers['Retry-After'] = '12'
+    assert scraper.retry_delay(1, response) == 12
+    assert 0 < scraper.retry_delay(1) <= scraper.BACKOFF_MAX
+
+
+def test_bounded_map_keeps_the_order_and_the_window():
+    in_progress = []
+    peak = []
+    lock = threading.Lock()
+
+    def work(item):
+        with lock:
+            in_progress.append(item)
+            peak.append(len(in_progress))
+        time.sleep(0.01)
+        with lock:
+            in_progress.remove(item)
+        return item * 2
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(scraper.bounded_map(executor, work, range(50), 3))
+    assert results == [item * 2 for item in range(50)]
+    assert max(peak) <= 3
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+def test_backends_extract_the_same_rows(stub, backend):
+    html = stub.pages[LIST_PATH]
+    assert (scraper.extract_country_rows(html, stub.base_url, backend)
+            == scraper.extract_country_rows(html, stub.base_url,
+                                            'html.parser'))
+
+
+@pytest.mark.parametrize('parse_workers', [0, 2])
+def test_parse_again_from_the_cache(stub, target, tmp_path, parse_workers):
+    cache_directory = str(tmp_path / 'cache')
+    scrape(stub, target, tmp_path, cache_directory, workers=4)
+    rows = target.execute('SELECT * FROM countries ORDER BY id').fetchall()
+    stub.requests.clear()
+    stats = scrape(stub, target, tmp_path, cache_directory, from_cache=True,
+                   parse_workers=parse_workers)
+    assert stats['parsed'] == COUNTRIES
+    assert stub.requests == {}
+    assert target.execute(
+        'SELECT * FROM countries ORDER BY id').fetchall() == rows
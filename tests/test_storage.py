@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from storage import (STATS_COLUMNS, STATS_TABLES, connect, rebuild_stats,
+                     upsert_countries)
+
+FIELDS = ('name, capital, population, density, area, neighbors, languages, '
+          'timezone, regime, etag, last_modified')
+
+
+def read_stats(conn):
+    return {stats: conn.execute(
+        f'SELECT term, {", ".join(STATS_COLUMNS)} FROM {stats} ORDER BY term'
+    ).fetchall() for stats, _ in STATS_TABLES}
+
+
+def changed_rows(conn, seed, count=40):
+    """
+    :return: Rows of randomly chosen countries with their numbers scaled,
+    some of them unknown, and their languages, timezone and regime taken
+    from other countries, so that they move between groups
+    """
+
+    generator = random.Random(seed)
+    rows = conn.execute(f'SELECT {FIELDS} FROM countries').fetchall()
+    terms = [row[6:9] for row in rows]
+    changed = []
+    for row in generator.sample(rows, count):
+        scale = generator.uniform(0.5, 2.0)
+        changed.append(
+            row[:2] + (int(row[2] * scale), round(row[3] * scale + 0.1, 1),
+                       -1 if generator.random() < 0.1 else
+                       int(row[4] * scale), row[5])
+            + generator.choice(terms) + row[9:])
+    return changed
+
+
+@pytest.mark.parametrize('batch', [1, 7, 40])
+def test_written_stats_equal_the_rebuilt_ones(database, batch):
+    conn = connect(database)
+    for seed in range(3):
+        rows = changed_rows(conn, seed)
+        for index in range(0, len(rows), batch):
+            upsert_countries(conn, rows[index:index + batch])
+    written = read_stats(conn)
+    with conn:
+        rebuild_stats(conn)
+    assert read_stats(conn) == written
+    conn.close()
@@ -0,0 +1,25 @@
+import json
+
+import pytest
+
+import utils
+from corpora import UTILS_GOLDEN
+
+with open(UTILS_GOLDEN, encoding='utf-8') as golden_file:
+    GOLDEN = json.load(golden_file)
+
+
+@pytest.mark.parametrize('function', sorted(GOLDEN))
+def test_golden_outputs(function):
+    # Every input of the corpus gives the output stored with it, the
+    # outputs being compared as JSON gives them back (tuples as lists)
+    parse = getattr(utils, function)
+    mismatches = [(value, expected, parse(value))
+                  for value, expected in GOLDEN[function]
+                  if json.loads(json.dumps(parse(value))) != expected]
+    assert not mismatches
+
+
+def test_every_parser_has_cases():
+    parsers = {name for name in dir(utils) if name.startswith('parse_')}
+    assert parsers <= set(GOLDEN)
@@ -0,0 +1,113 @@
+import os
+import sqlite3
+
+import pytest
+
+from conftest import ROOT
+from corpora import SAMPLE_DUMP
+from create_database import DATABASE, create_database
+from storage import connect
+from wikidump import ingest_dump
+
+COLUMNS = ('name, capital, population, density, area, neighbors, languages, '
+           'timezone, regime')
+
+
+def write_dump(path, articles):
+    """
+    Write an uncompressed pages-articles dump of the given articles
+    :param path: The path of the dump
+    :param articles: The list of (title, wikitext) pairs of the articles
+    """
+
+    pages = ''.join(
+        f'<page><title>{title}</title><ns>0</ns><id>{index}</id>'
+        f'<revision><text xml:space="preserve">{text}</text></revision>'
+        f'</page>'
+        for index, (title, text) in enumerate(articles, start=1))
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('<mediawiki xmlns="http://www.mediawiki.org/xml/'
+                   f'export-0.11/">{pages}</mediawiki>')
+
+
+def infobox(capital, population, area, density=None):
+    density = f'|densitate = {density}\n' if density is not None else ''
+    return (f'{{{{Infocaseta Țară\n|capitala = [[{capital}]]\n'
+            f'|populație_estimare = {population}\n'
+            f'|suprafață_totală = {area}\n{density}'
+            f'|fus_orar = UTC+1\n}}}}')
+
+
+def read_rows(database, names):
+    conn = sqlite3.connect(database)
+    rows = conn.execute(
+        f'SELECT {COLUMNS} FROM countries WHERE name IN '
+        f'({", ".join("?" * len(names))}) ORDER BY name', names).fetchall()
+    conn.close()
+    return rows
+
+
+def count_countries(database):
+    conn = sqlite3.connect(database)
+    count = conn.execute('SELECT COUNT(*) FROM countries').fetchone()[0]
+    conn.close()
+    return count
+
+
+def ingest(database, path, **options):
+    conn = connect(database)
+    try:
+        return ingest_dump(path, conn, **options)
+    finally:
+        conn.close()
+
+
+def test_sample_dump_into_an_empty_database(tmp_path):
+    database = str(tmp_path / 'dump.db')
+    create_database(database)
+    stats = ingest(database, SAMPLE_DUMP, known_only=False)
+    # The template page and the redirect are skipped, the article of the
+    # capital has no country information box
+    assert (stats['articles'], stats['countries'], stats['written']) == (
+        241, 240, 240)
+    names = ['Germania', 'Japonia', 'România', 'Regatul Unit']
+    assert read_rows(database, names) == read_rows(
+        os.path.join(ROOT, DATABASE), names)
+
+
+def test_article_titled_after_an_alias(database, tmp_path):
+    path = str(tmp_path / 'dump.xml')
+    write_dump(path, [('Germany', infobox('Bonn', 80000000, 357000))])
+    count = count_countries(database)
+    stats = ingest(database, path)
+    assert stats['written'] == 1
+    assert count_countries(database) == count
+    (row,) = read_rows(database, ['Germania'])
+    # The density missing from the information box is calculated
+    assert row[1:5] == ('Bonn', 80000000, 224.1, 357000)
+
+
+@pytest.mark.parametrize('known_only', [True, False])
+def test_unknown_articles(database, tmp_path, known_only):
+    path = str(tmp_path / 'dump.xml')
+    write_dump(path, [('Regatul Prusiei',
+                       infobox('Berlin', 24000000, 348000, 69))])
+    count = count_countries(database)
+    stats = ingest(database, path, known_only=known_only)
+    assert stats['countries'] == (0 if known_only else 1)
+    rows = read_rows(database, ['Regatul Prusiei'])
+    if known_only:
+        assert rows == []
+        assert count_countries(database) == count
+    else:
+        assert rows[0][1:5] == ('Berlin', 24000000, 69, 348000)
+        assert count_countries(database) == count + 1
+
+
+def test_given_connection_is_left_open(database, tmp_path):
+    path = str(tmp_path / 'dump.xml')
+    write_dump(path, [])
+    conn = connect(database)
+    ingest_dump(path, conn)
+    assert conn.execute('SELECT COUNT(*) FROM countries').fetchone()[0] > 0
+    conn.close()
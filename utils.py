@@ -1,5 +1,91 @@
 import re
 
+# Patterns used by the parsers below, compiled once when the module is
+# imported instead of being looked up in the re cache on every call
+REFERENCE_PATTERN = re.compile(r'\[.*?\]')
+PARENTHESES_PATTERN = re.compile(r'\(.*?\)')
+AREA_NUMBER_PATTERN = re.compile(r'([\d., ]+)\s*k')
+DENSITY_NUMBER_PATTERN = re.compile(r'([\d., ]+)\s*l')
+DECIMAL_COORDINATES_PATTERN = re.compile(r'\d+\.\d+°[NSVE]')
+DEGREE_COORDINATES_PATTERN = re.compile(r'\d+°\d+′[NSVE]')
+CAPITAL_NOTE_PATTERN = re.compile(r'\([^)]*?(din|note).*?\)', re.IGNORECASE)
+PLACEHOLDER_PATTERN = re.compile(r'\{\{.*?\}\}')
+CLOSING_PARENTHESIS_PATTERN = re.compile(r'\)(\S)')
+EMPTY_PARENTHESES_PATTERN = re.compile(r'\(\s*\)')
+LOWER_UPPER_PATTERN = re.compile(r'([a-z])([A-Z])')
+COMMA_PATTERN = re.compile(r'\s*,\s*')
+TRAILING_COMMA_PATTERN = re.compile(r',\s*$')
+LANGUAGE_REFERENCE_PATTERN = re.compile(r'([a-z])(?: \d+| [¹-⁰]+)')
+SIGN_PATTERN = re.compile(r'\s*([+-])\s*')
+LETTER_REFERENCE_PATTERN = re.compile(
+    r'([a-z])(?: \d+ | [¹-⁰]+ |\d+|[¹-⁰]+)')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+WORD_PATTERN = re.compile(r'\w+')
+TIMEZONE_OFFSET_PATTERN = re.compile(r'([+-])\s*(\d{1,2})(?:[:.](\d{2})|(½))?')
+TIMEZONE_NAME_PATTERN = re.compile(r'\b[A-Z]{2,5}\b')
+# "UTC" or "GMT" followed by an offset without its sign, which is how an
+# unencoded "+" of a query string arrives ("UTC+1" read as "UTC 1")
+UNSIGNED_OFFSET_PATTERN = re.compile(r'\b(UTC|GMT)\s+(?=\d)')
+
+# Table used by str.translate to remove the romanian diacritics in a
+# single pass. Note that the uppercase "Î", "Ș" and "Ț" are intentionally
+# mapped to lowercase letters, as the scraped data has always been stored
+# this way
+DIACRITICS_TABLE = str.maketrans({
+    'ă': 'a', 'â': 'a', 'Ă': 'A', 'Â': 'A',
+    'î': 'i', 'Î': 'i',
+    'ș': 's', 'Ș': 's',
+    'ț': 't', 'Ț': 't',
+})
+# The same table also deleting the zero width spaces, used by general_parse
+GENERAL_PARSE_TABLE = {**DIACRITICS_TABLE, 0x200B: None, 0xFEFF: None}
+# Table replacing the other dashes and the plus-minus sign found in
+# timezones with plain signs
+TIMEZONE_SIGN_TABLE = str.maketrans({'−': '-', '–': '-', '±': '+'})
+# Value the scraper stores for a text it could not find
+UNKNOWN_TEXT = 'Unknown'
+# Words found in the languages of the infoboxes that do not name a
+# language, left out of the language groups of the statistics
+LANGUAGE_STOPWORDS = frozenset({
+    'ALE', 'ALTE', 'ALTEDE', 'CA', 'CU', 'D', 'DAR', 'DE', 'DIALECTE',
+    'EFECTUEAZA', 'ESTE', 'FACTO', 'FARA', 'FEDERAL', 'IN', 'INDIGENE',
+    'JURE', 'LA', 'LIMBA', 'LIMBI', 'LIMBII', 'LIMBILE', 'LOCALE', 'MOD',
+    'NATIONAL', 'NATIONALE', 'NIVEL', 'NORD', 'NU', 'OFICIAL', 'OFICIALA',
+    'OFICIALE', 'RECUNOSCUTA', 'RECUNOSCUTE', 'REGIONALA', 'REGIONALE',
+    'SCRISA', 'SE', 'SI', 'SIALTE', 'SPECIAL', 'SPECIFICATA', 'STANDARD',
+    'STATUT', 'SUD', 'SUNT', 'TOATE', 'TRADITIONALA', 'TRANZACTIILE',
+    'UNKNOWN', 'VARIANTE', 'VORBESC',
+})
+# UTC offsets of the timezone abbreviations found alone in the infoboxes
+# that stand for a single offset
+TIMEZONE_ABBREVIATION_OFFSETS = {
+    'AST': 'UTC-4', 'CET': 'UTC+1', 'EAT': 'UTC+3', 'EET': 'UTC+2',
+    'GMT': 'UTC+0', 'PKT': 'UTC+5', 'SAST': 'UTC+2', 'WAT': 'UTC+1',
+    'WET': 'UTC+0',
+}
+
+
+def join_number_groups(result):
+    """
+    Function to join the groups of digits of a number written with spaces,
+    dots or commas as thousands separators, dropping the decimal part
+    :param result: The string containing the digits and the separators
+    :return: The string containing only the digits of the integer part
+    """
+
+    parts = result.split()
+    result = ''.join(
+        [parts[0]] + [part for part in parts[1:] if len(part) == 3])
+    if "." in result and "," in result:
+        result = result.split(',')[0]
+    parts = result.split('.')
+    result = ''.join(
+        [parts[0]] + [part for part in parts[1:] if len(part) == 3])
+    parts = result.split(',')
+    result = ''.join(
+        [parts[0]] + [part for part in parts[1:] if len(part) == 3])
+    return result.replace('.', '').replace(',', '').replace(' ', '')
+
 
 def parse_wikipedia_number_string_to_int(number_string):
     """
@@ -15,26 +101,14 @@ def parse_wikipedia_number_string_to_int(number_string):
     if number_string is None:
         return -1
     # Filter out wikipedia references such as [2]
-    number_string = re.sub(r'\[.*?\]', '', number_string)
-    match = re.search(r'([\d., ]+)\s*k', number_string)
+    number_string = REFERENCE_PATTERN.sub('', number_string)
+    match = AREA_NUMBER_PATTERN.search(number_string)
     if match:
         result = match.group(1)
     else:
         return -1
-    parts = result.split()
-    result = ''.join(
-        [parts[0]] + [part for part in parts[1:] if len(part) == 3])
-    if "." in result and "," in result:
-        result = result.split(',')[0]
-    parts = result.split('.')
-    result = ''.join(
-        [parts[0]] + [part for part in parts[1:] if len(part) == 3])
-    parts = result.split(',')
-    result = ''.join(
-        [parts[0]] + [part for part in parts[1:] if len(part) == 3])
-    result = result.replace('.', '').replace(',', '').replace(' ', '')
     # Return converted value
-    return int(result)
+    return int(join_number_groups(result))
 
 
 def parse_population_string_to_int(number_string):
@@ -66,27 +140,33 @@ def parse_density_string_to_int(number_string):
     if number_string is None:
         return -1
     # Filter out wikipedia references such as [2]
-    number_string = re.sub(r'\[.*?\]', '', number_string)
-    number_string = re.sub(r'\(.*?\)', '', number_string)
-    match = re.search(r'([\d., ]+)\s*l', number_string)
+    number_string = REFERENCE_PATTERN.sub('', number_string)
+    number_string = PARENTHESES_PATTERN.sub('', number_string)
+    match = DENSITY_NUMBER_PATTERN.search(number_string)
     if match:
         result = match.group(1)
     else:
         return -1
-    parts = result.split()
-    result = ''.join(
-        [parts[0]] + [part for part in parts[1:] if len(part) == 3])
-    if "." in result and "," in result:
-        result = result.split(',')[0]
-    parts = result.split('.')
-    result = ''.join(
-        [parts[0]] + [part for part in parts[1:] if len(part) == 3])
-    parts = result.split(',')
-    result = ''.join(
-        [parts[0]] + [part for part in parts[1:] if len(part) == 3])
-    result = result.replace('.', '').replace(',', '').replace(' ', '')
     # Return converted value
-    return int(result)
+    return int(join_number_groups(result))
+
+
+def fill_density(density, population, area):
+    """
+    Function to calculate the density of a country whose page does not
+    give it, with a formula that provides an approximate result
+    :param density: The parsed density, -1 if none was found
+    :param population: The population of the country, -1 if unknown
+    :param area: The area of the country, -1 if unknown
+    :return: The given density if one was found, otherwise the population
+    per km² rounded to one decimal, or -1.0 if it can not be calculated
+    """
+
+    if density != -1.0:
+        return density
+    if population is None or population < 0 or area is None or area <= 0:
+        return -1.0
+    return round(population / area, 1)
 
 
 def parse_capital_text(capital):
@@ -101,19 +181,18 @@ def parse_capital_text(capital):
     """
 
     # Filter out coordinates
-    result = re.sub(r'\d+\.\d+°[NSVE]', '', capital)
-    result = re.sub(r'\d+°\d+′[NSVE]', '', result)
+    result = DECIMAL_COORDINATES_PATTERN.sub('', capital)
+    result = DEGREE_COORDINATES_PATTERN.sub('', result)
     # Filter out useless parentheses (such as the date since
     # when a capital has become one)
-    result = re.sub(
-        r'\([^)]*?(din|note).*?\)', '', result, flags=re.IGNORECASE)
+    result = CAPITAL_NOTE_PATTERN.sub('', result)
     # Filter out placeholders (Bolivia {{PAGENAME}})
-    result = re.sub(r'\{\{.*?\}\}', '', result)
+    result = PLACEHOLDER_PATTERN.sub('', result)
     # Add a space between closing parenthesis and
     # the following letter if it's the case
-    result = re.sub(r'\)(\S)', r') \1', result)
+    result = CLOSING_PARENTHESIS_PATTERN.sub(r') \1', result)
     # Filter out empty parenthesis
-    result = re.sub(r'\(\s*\)', '', result)
+    result = EMPTY_PARENTHESES_PATTERN.sub('', result)
     # Parse with general parsing
     result = general_parse(result)
 
@@ -132,7 +211,7 @@ def parse_neighbors_text(neighbors):
     # Pre-parse with general parsing
     result = general_parse(neighbors)
     # Add " / " between neighbors
-    result = re.sub(r'([a-z])([A-Z])', r'\1 / \2', result)
+    result = LOWER_UPPER_PATTERN.sub(r'\1 / \2', result)
 
     return result
 
@@ -149,13 +228,13 @@ def parse_languages_text(languages):
     # Pre-parse with general parsing
     result = general_parse(languages)
     # Fix spacing for commas
-    result = re.sub(r'\s*,\s*', r', ', result)
+    result = COMMA_PATTERN.sub(r', ', result)
     # Add space between languages if missing
-    result = re.sub(r'([a-z])([A-Z])', r'\1 \2', result)
+    result = LOWER_UPPER_PATTERN.sub(r'\1 \2', result)
     # Remove commas if they are the last character
-    result = re.sub(r',\s*$', '', result)
+    result = TRAILING_COMMA_PATTERN.sub('', result)
     # Remove remaining references
-    result = re.sub(r'([a-z])(?: \d+| [¹-⁰]+)', r'\1', result)
+    result = LANGUAGE_REFERENCE_PATTERN.sub(r'\1', result)
 
     return result
 
@@ -169,10 +248,8 @@ def parse_timezone(timezone):
     """
 
     result = general_parse(timezone)
-    # Remove spaces around '+'
-    result = re.sub(r'\s*\+\s*', '+', result)
-    # Remove spaces around '-'
-    result = re.sub(r'\s*-\s*', '-', result)
+    # Remove spaces around '+' and '-'
+    result = SIGN_PATTERN.sub(r'\1', result)
 
     return result
 
@@ -187,14 +264,14 @@ def general_parse(value):
     to the wikipedia page
     """
 
+    # Remove diacritics and filter out zero width spaces in a single pass
+    result = value.translate(GENERAL_PARSE_TABLE)
     # Filter out wikipedia references such as [2]
-    result = re.sub(r'\[.*?\]', '', remove_diacritics(value))
-    # Filter out zero width space
-    result = re.sub(r'[\u200B\uFEFF]', '', result)
+    result = REFERENCE_PATTERN.sub('', result)
     # Filter out numbers following letters (remaining references)
-    result = re.sub(r'([a-z])(?: \d+ | [¹-⁰]+ |\d+|[¹-⁰]+)', r'\1', result)
+    result = LETTER_REFERENCE_PATTERN.sub(r'\1', result)
     # Replace multiple whitespaces with a single space
-    result = re.sub(r'\s+', ' ', result).strip()
+    result = WHITESPACE_PATTERN.sub(' ', result).strip()
 
     return result
 
@@ -206,13 +283,112 @@ def remove_diacritics(string):
     :return: the cleaned string
     """
 
-    string = re.sub(r'[ăâ]', 'a', string)
-    string = re.sub(r'[ĂÂ]', 'A', string)
-    string = re.sub(r'[î]', 'i', string)
-    string = re.sub(r'[Î]', 'i', string)
-    string = re.sub(r'[ș]', 's', string)
-    string = re.sub(r'[ÎȘ]', 's', string)
-    string = re.sub(r'[ț]', 't', string)
-    string = re.sub(r'[Ț]', 't', string)
+    return string.translate(DIACRITICS_TABLE)
+
+
+def name_key(name):
+    """
+    Function to get the key a country name is matched by: the name without
+    diacritics, uppercased, with single spaces between its words
+    :param name: The name of the country
+    :return: The key of the name
+    """
+
+    return ' '.join(remove_diacritics(name).upper().split())
+
+
+def text_terms(text):
+    """
+    Function to split a text (languages, regime) into the terms it is
+    indexed by: its words without diacritics, uppercased
+    :param text: The text to split
+    :return: The list of distinct terms in the order they appear
+    """
+
+    if text is None:
+        return []
+    words = WORD_PATTERN.findall(remove_diacritics(text).upper())
+    return list(dict.fromkeys(words))
+
+
+def timezone_terms(timezone):
+    """
+    Function to extract the terms a timezone is indexed by: each UTC offset
+    written in a normalized way (for example "UTC+5:30", "UTC-4", "UTC+0")
+    and each abbreviation such as "CET". Plain "UTC" or "GMT" without any
+    offset count as "UTC+0", and an offset written after them without its
+    sign ("UTC 1") as a positive one.
+    :param timezone: The timezone text, as returned by parse_timezone
+    :return: The list of distinct terms in the order they appear
+    """
+
+    if timezone is None:
+        return []
+    text = UNSIGNED_OFFSET_PATTERN.sub(
+        r'\1+', timezone.translate(TIMEZONE_SIGN_TABLE))
+    terms = []
+    for sign, hours, minutes, half in TIMEZONE_OFFSET_PATTERN.findall(text):
+        hours = int(hours)
+        minutes = 30 if half else int(minutes or 0)
+        if hours == 0 and minutes == 0:
+            sign = '+'
+        term = f"UTC{sign}{hours}"
+        if minutes:
+            term += f":{minutes:02d}"
+        terms.append(term)
+    names = TIMEZONE_NAME_PATTERN.findall(text)
+    if not terms and ('UTC' in names or 'GMT' in names):
+        terms.append('UTC+0')
+    terms += [name for name in names if name not in ('UTC', 'DST')]
+    return list(dict.fromkeys(terms))
+
+
+def language_groups(languages):
+    """
+    Function to get the languages a country is grouped by in the
+    statistics: the words of its languages without diacritics, uppercased,
+    leaving out the numbers and LANGUAGE_STOPWORDS ("limba", "si",
+    "oficiala", ...)
+    :param languages: The languages text, as returned by parse_languages
+    :return: The list of distinct languages in the order they appear
+    """
+
+    return [term for term in text_terms(languages)
+            if term not in LANGUAGE_STOPWORDS and not term.isdigit()]
+
+
+def timezone_groups(timezone):
+    """
+    Function to get the UTC offsets a country is grouped by in the
+    statistics: the offsets of its timezone terms, or the offsets of its
+    abbreviations found in TIMEZONE_ABBREVIATION_OFFSETS when it gives no
+    offset, so that a country is not counted again under the abbreviation
+    of an offset it already has
+    :param timezone: The timezone text, as returned by parse_timezone
+    :return: The list of distinct offsets in the order they appear
+    """
+
+    terms = timezone_terms(timezone)
+    offsets = [term for term in terms if term.startswith('UTC')]
+    if not offsets:
+        offsets = [TIMEZONE_ABBREVIATION_OFFSETS[term] for term in terms
+                   if term in TIMEZONE_ABBREVIATION_OFFSETS]
+    return list(dict.fromkeys(offsets))
+
+
+def regime_groups(regime):
+    """
+    Function to get the regime a country is grouped by in the statistics:
+    its whole regime without diacritics and punctuation, uppercased, with
+    single spaces between its words and the words written with a hyphen
+    joined ("semi-prezidentiala" being "SEMIPREZIDENTIALA"), so that a
+    country is counted once
+    :param regime: The regime text, as returned by parse_regime
+    :return: A list with the regime, empty if it is not known
+    """
 
-    return string
+    if regime is None or regime == UNKNOWN_TEXT:
+        return []
+    words = WORD_PATTERN.findall(
+        remove_diacritics(regime.replace('-', '')).upper())
+    return [' '.join(words)] if words else []
@@ -0,0 +1,399 @@
+import bz2
+import html
+import re
+import time
+import unicodedata
+from contextlib import closing, nullcontext
+from xml.etree import ElementTree
+
+import metrics
+from create_database import DATABASE
+from storage import (BATCH_SIZE, connect, load_name_keys, replace_aliases,
+                     replace_neighbors, upsert_countries)
+from utils import (AREA_NUMBER_PATTERN,
+                   DENSITY_NUMBER_PATTERN,
+                   WHITESPACE_PATTERN,
+                   parse_wikipedia_number_string_to_int,
+                   parse_population_string_to_int,
+                   parse_density_string_to_int,
+                   parse_capital_text,
+                   parse_languages_text,
+                   parse_neighbors_text,
+                   parse_timezone,
+                   general_parse,
+                   fill_density,
+                   name_key)
+
+# Information box templates marking the articles about a country, compared
+# through template_key so that the case, the diacritics (with comma or
+# cedilla) and the underscores they are written with do not matter
+COUNTRY_TEMPLATES = ('Infocaseta Țară', 'Infocaseta Stat', 'Infobox country')
+
+# Parameters of the information box each field is read from, the first one
+# found being used, compared through template_key as well. Only the first
+# name of each field is used by the current version of the romanian
+# template, the others are found in older revisions and in the articles
+# still using the english template.
+INFOBOX_FIELDS = {
+    'capital': ('capitala', 'capital'),
+    'population': ('populație_estimare', 'populație_recensământ',
+                   'populație', 'population_estimate', 'population_census'),
+    'density': ('densitate', 'population_density_km2'),
+    'area': ('suprafață_totală', 'suprafață', 'area_km2'),
+    'neighbors': ('vecini',),
+    'languages': ('limbi_oficiale', 'official_languages'),
+    'timezone': ('fus_orar', 'time_zone', 'utc_offset'),
+    'regime': ('sistem_politic', 'government_type'),
+}
+# Text the line breaks of each field are replaced with, the same as the
+# separator the scraper extracts the text of the rendered row with, so the
+# normalizers get the values the way they get them from the HTML pages
+FIELD_SEPARATORS = {'languages': ' ', 'timezone': ' '}
+
+# Templates kept when the wikitext of a value is turned into text, with the
+# argument they are replaced with: the first or the last positional one,
+# all of them for the lists, or the value and the unit for the conversions.
+# Every other template (coordinates, notes, icons) is dropped.
+TEXT_TEMPLATES = {
+    'formatnum': 'first', 'nowrap': 'first', 'nts': 'first',
+    'small': 'first', 'flag': 'first', 'flagcountry': 'first',
+    'steag': 'first', 'lang': 'last', 'lang-ro': 'last',
+    'plainlist': 'list', 'unbulleted list': 'list', 'ubl': 'list',
+    'hlist': 'list', 'flatlist': 'list',
+    'convert': 'convert', 'cvt': 'convert',
+}
+
+COMMENT_PATTERN = re.compile(r'<!--.*?(?:-->|$)', re.DOTALL)
+REF_PATTERN = re.compile(r'<ref[^>]*?/>|<ref[^>]*>.*?</ref>',
+                         re.DOTALL | re.IGNORECASE)
+FILE_LINK_PATTERN = re.compile(
+    r'\[\[(?:Fișier|Fişier|File|Imagine|Image|Categorie|Category):'
+    r'[^\[\]]*(?:\[\[[^\[\]]*\]\][^\[\]]*)*\]\]', re.IGNORECASE)
+LINK_PATTERN = re.compile(r'\[\[(?:[^|\[\]]*\|)?([^\[\]]*)\]\]')
+EXTERNAL_LINK_PATTERN = re.compile(r'\[(?:https?:)?//[^\s\]]+\s*([^\]]*)\]')
+TEMPLATE_PATTERN = re.compile(r'\{\{([^{}]*)\}\}')
+TEMPLATE_START_PATTERN = re.compile(r'\{\{\s*([^{}|\n]+?)\s*(?=\||\}\}|\n)')
+TEMPLATE_TOKEN_PATTERN = re.compile(r'\{\{|\}\}|\[\[|\]\]|\|')
+LINE_BREAK_PATTERN = re.compile(r'<br\s*/?>|\n', re.IGNORECASE)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+BULLET_PATTERN = re.compile(r'^[ \t]*[*#:;]+[ \t]*', re.MULTILINE)
+POPULATION_NUMBER_PATTERN = re.compile(r'\d+(?:[., ]\d{3})*')
+
+
+def template_key(name):
+    """
+    :param name: The name of a template or of one of its parameters
+    :return: The name without diacritics, in lowercase, with single spaces
+    between its words and without the namespace of the templates
+    """
+
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(character for character in name
+                   if not unicodedata.combining(character))
+    name = WHITESPACE_PATTERN.sub(' ', name.replace('_', ' ')).strip().lower()
+    for namespace in ('format:', 'template:'):
+        if name.startswith(namespace):
+            name = name[len(namespace):].strip()
+    return name
+
+
+COUNTRY_TEMPLATE_KEYS = frozenset(map(template_key, COUNTRY_TEMPLATES))
+# The parameter names of the fields, mapped to the field and the position
+# of the name in its alternatives
+PARAMETER_FIELDS = {template_key(parameter): (field, rank)
+                    for field, parameters in INFOBOX_FIELDS.items()
+                    for rank, parameter in enumerate(parameters)}
+
+
+def iter_articles(path):
+    """
+    Read the articles of a pages-articles dump one page at a time. The XML
+    is parsed incrementally, straight from the bz2 stream, and each page is
+    dropped from the tree once read, so the memory used does not depend on
+    the size of the dump. Redirects and the pages of the other namespaces
+    (templates, categories, talk pages) are skipped.
+    :param path: Path of the dump, compressed with bz2 if its name ends
+    with .bz2
+    :return: A generator of the (title, wikitext) pairs of the articles
+    """
+
+    opener = bz2.open if path.endswith('.bz2') else open
+    with opener(path, 'rb') as dump:
+        events = ElementTree.iterparse(dump, events=('start', 'end'))
+        _, root = next(events)
+        title = namespace = text = None
+        redirect = False
+        for event, element in events:
+            if event != 'end':
+                continue
+            # The tags are in the namespace of the version of the export
+            # schema, which changes from one dump to the other
+            tag = element.tag.rpartition('}')[2]
+            if tag == 'title':
+                title = element.text
+            elif tag == 'ns':
+                namespace = element.text
+            elif tag == 'redirect':
+                redirect = True
+            elif tag == 'text':
+                text = element.text or ''
+            elif tag == 'page':
+                if namespace == '0' and not redirect and text is not None:
+                    yield title, text
+                title = namespace = text = None
+                redirect = False
+                root.clear()
+
+
+def find_template_parameters(text, names=COUNTRY_TEMPLATE_KEYS):
+    """
+    Find the first template of the given names in the wikitext of a page
+    and split it into its named parameters, the pipes of the templates and
+    links nested in a value not separating parameters
+    :param text: The wikitext of the page, without comments
+    :param names: The keys of the template names, see template_key
+    :return: A dict of the key of each parameter name mapped to its
+    wikitext value, or None if the page has no such template
+    """
+
+    for start in TEMPLATE_START_PATTERN.finditer(text):
+        if template_key(start.group(1)) in names:
+            break
+    else:
+        return None
+    parameters = {}
+
+    def add_parameter(segment):
+        name, equals, value = segment.partition('=')
+        if equals:
+            parameters[template_key(name)] = value.strip()
+
+    braces = links = 0
+    position = start.end()
+    for token in TEMPLATE_TOKEN_PATTERN.finditer(text, position):
+        value = token.group()
+        if value == '{{':
+            braces += 1
+        elif value == '[[':
+            links += 1
+        elif value == ']]':
+            links = max(links - 1, 0)
+        elif value == '}}':
+            if not braces:
+                add_parameter(text[position:token.start()])
+                break
+            braces -= 1
+        elif not braces and not links:
+            add_parameter(text[position:token.start()])
+            position = token.end()
+    return parameters
+
+
+def render_template(match):
+    """
+    Replace a template without nested templates by its text, see
+    TEXT_TEMPLATES, the items of the lists being put on separate lines
+    :param match: The match of TEMPLATE_PATTERN
+    :return: The text of the template
+    """
+
+    parts = match.group(1).split('|')
+    # The parser functions take their first argument after a colon, as in
+    # {{formatnum:238391}}
+    name, colon, argument = parts[0].partition(':')
+    arguments = ([argument] if colon else []) + parts[1:]
+    name = template_key(name)
+    kind = TEXT_TEMPLATES.get(name)
+    if kind is None and name.startswith('lang-'):
+        kind = 'last'
+    positional = [argument.strip() for argument in arguments
+                  if '=' not in argument]
+    if kind is None or not positional:
+        return ''
+    if kind == 'first':
+        return positional[0]
+    if kind == 'last':
+        return positional[-1]
+    if kind == 'convert':
+        return ' '.join(positional[:2])
+    return '\n'.join(positional)
+
+
+def wikitext_to_text(value, separator=''):
+    """
+    Turn the wikitext of an information box value into the text wikipedia
+    renders for it: references dropped, links replaced by their label,
+    templates by their text (see TEXT_TEMPLATES), markup and list bullets
+    removed and the line breaks replaced with the separator
+    :param value: The wikitext, without comments
+    :param separator: The text the line breaks are replaced with
+    :return: The text
+    """
+
+    value = REF_PATTERN.sub('', value)
+    value = FILE_LINK_PATTERN.sub('', value)
+    value = LINK_PATTERN.sub(r'\1', value)
+    # The templates are replaced from the innermost ones out
+    count = 1
+    while count:
+        value, count = TEMPLATE_PATTERN.subn(render_template, value)
+    value = EXTERNAL_LINK_PATTERN.sub(r'\1', value)
+    value = value.replace("'''", '').replace("''", '')
+    value = BULLET_PATTERN.sub('', value)
+    value = LINE_BREAK_PATTERN.sub(separator, value)
+    value = TAG_PATTERN.sub('', value)
+    return html.unescape(value).strip()
+
+
+def parse_country_wikitext(text):
+    """
+    Extract the data of a country from the wikitext of its article, the
+    counterpart of scraper.parse_country_details for the dumps: the values
+    of the information box parameters are turned into the text shown on the
+    rendered page and normalized by the same parsers of utils.py, with the
+    same default values for the missing ones
+    :param text: The wikitext of the article
+    :return: The population and the details of the country, in the order
+    returned by parse_country_details, or None if the article has no
+    country information box
+    """
+
+    parameters = find_template_parameters(COMMENT_PATTERN.sub('', text))
+    if parameters is None:
+        return None
+    # Take the value of each field from the first of its parameters found
+    # with a value
+    values = {}
+    for parameter, value in parameters.items():
+        if value and parameter in PARAMETER_FIELDS:
+            field, rank = PARAMETER_FIELDS[parameter]
+            if field not in values or rank < values[field][0]:
+                values[field] = rank, value
+    values = {field: wikitext_to_text(value,
+                                      FIELD_SEPARATORS.get(field, ''))
+              for field, (_, value) in values.items()}
+
+    def number(field, parse, pattern, unit):
+        # The parameters usually hold the bare number and the template
+        # adds the unit, which the number parsers look for
+        value = values.get(field, '')
+        if not any(character.isdigit() for character in value):
+            return -1
+        if not pattern.search(value):
+            value += unit
+        return parse(value)
+
+    def text_field(field, parse):
+        value = values.get(field)
+        return parse(value) if value else "Unknown"
+
+    population = POPULATION_NUMBER_PATTERN.search(
+        values.get('population', ''))
+    population = (parse_population_string_to_int(population.group())
+                  if population else -1)
+    area = number('area', parse_wikipedia_number_string_to_int,
+                  AREA_NUMBER_PATTERN, ' km²')
+    density = round(number('density', parse_density_string_to_int,
+                           DENSITY_NUMBER_PATTERN, ' loc./km²'), 1)
+    return population, (area,
+                        density,
+                        text_field('capital', parse_capital_text),
+                        text_field('neighbors', parse_neighbors_text),
+                        text_field('languages', parse_languages_text),
+                        text_field('timezone', parse_timezone),
+                        text_field('regime', general_parse))
+
+
+def ingest_dump(path, connection=None, batch_size=BATCH_SIZE,
+                known_only=True):
+    """
+    Fill the database from a local pages-articles dump of ro.wikipedia.org
+    instead of scraping the site. The articles with a country information
+    box are written in batches by the same upsert as the scraper, an
+    article titled after an alias updating the country it is about.
+    :param path: Path of the dump, compressed with bz2 if its name ends
+    with .bz2
+    :param connection: The database connection to write to, defaults to a
+    connection to states_of_the_world.db, closed at the end of the run
+    :param batch_size: Number of countries written in one transaction
+    :param known_only: Only update the countries already in the database,
+    otherwise the other articles are added as new countries
+    :return: The summary of the run, a dict with the number of articles
+    read, of countries found among them, written and found unchanged, and
+    the seconds of each stage and of the whole run
+    """
+
+    run_start = time.perf_counter()
+    # A connection opened here is closed at the end of the run, one given
+    # by the caller is left open
+    opened = (closing(connect(DATABASE)) if connection is None
+              else nullcontext(connection))
+    with opened as db:
+        names = load_name_keys(db)
+        # Name keys of the countries already written by this run
+        written = set()
+        rows = []
+        stats = {'articles': 0, 'countries': 0, 'written': 0, 'unchanged': 0,
+                 'stages': dict.fromkeys(('read', 'parse', 'write',
+                                          'neighbors'), 0.0),
+                 'seconds': 0.0}
+
+        def flush():
+            if rows:
+                written_names, milliseconds = upsert_countries(db, rows)
+                stats['stages']['write'] += milliseconds / 1000
+                stats['written'] += len(written_names)
+                stats['unchanged'] += len(rows) - len(written_names)
+                metrics.inc('scraper_countries_total', len(written_names),
+                            result='written')
+                metrics.inc('scraper_countries_total',
+                            len(rows) - len(written_names), result='unchanged')
+                rows.clear()
+
+        for title, text in iter_articles(path):
+            stats['articles'] += 1
+            # Resolve the title to the name the country is stored with, as
+            # an article may be titled after an alias of the country
+            name = names.get(name_key(title))
+            if name is None:
+                if known_only:
+                    continue
+                name = title
+            if name_key(name) in written:
+                continue
+            start = time.perf_counter()
+            parsed = parse_country_wikitext(text)
+            stats['stages']['parse'] += time.perf_counter() - start
+            if parsed is None:
+                continue
+            stats['countries'] += 1
+            written.add(name_key(name))
+            population, (area, density, capital, neighbors, languages,
+                         timezone, regime) = parsed
+            # If no density was found calculate it the same way as the scraper
+            density = fill_density(density, population, area)
+            rows.append((name, capital, population, density, area, neighbors,
+                         languages, timezone, regime, None, None))
+            if len(rows) >= batch_size:
+                flush()
+        flush()
+
+        start = time.perf_counter()
+        links, unresolved = replace_neighbors(db)
+        aliases = replace_aliases(db)
+        stats['stages']['neighbors'] = time.perf_counter() - start
+        stats['seconds'] = time.perf_counter() - run_start
+        stats['stages']['read'] = stats['seconds'] - sum(
+            stats['stages'].values())
+        for stage, seconds in stats['stages'].items():
+            metrics.observe('scraper_stage_seconds', seconds, stage=stage)
+        metrics.observe('scraper_run_seconds', stats['seconds'])
+        print(f"Read {stats['articles']} articles, found {stats['countries']} "
+              f"countries, wrote {stats['written']} "
+              f"({stats['unchanged']} unchanged). Linked {links} neighbors, "
+              f"{unresolved} not found among the countries, and {aliases} "
+              f"aliases.")
+        print("Stage seconds: " + ", ".join(
+            f"{stage} {seconds:.2f}" for stage, seconds
+            in stats['stages'].items()) + f"; total {stats['seconds']:.2f}.")
+        return stats